@@ -0,0 +1,267 @@
+"""
+Archiwum surowych stron (ofert i listingów) zastępujące zapis każdej strony w osobnym pliku .html.
+Treści przechowywane są w skompresowanej postaci w dopisywanych segmentach, a indeks SQLite wiąże nazwę strony
+(folder + nazwa pliku) z adresem treści w segmencie. Identyczne treści zapisywane są jednokrotnie.
+Indeks zatwierdzany jest co commit_every zapisów (oraz przy zamknięciu archiwum), a nie po każdej stronie.
+Migracja istniejących folderów: python archive.py offers/otomoto offers/olx ...
+"""
+import argparse
+import atexit
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+DEFAULT_ARCHIVE_FOLDER = 'archive'
+
+_archives = dict()
+_archives_lock = threading.Lock()
+
+
+def get_archive(folder=DEFAULT_ARCHIVE_FOLDER):
+    """Funkcja zwracająca współdzielony obiekt archiwum dla folderu - wszystkie downloadery i fileloadery w procesie
+    korzystają z jednego obiektu, dzięki czemu dopisywanie do segmentów jest synchronizowane
+
+    :param folder: folder archiwum
+    :return: obiekt PageArchive
+    """
+    key = os.path.abspath(folder)
+    with _archives_lock:
+        if not _archives:
+            atexit.register(close_archives)
+        if key not in _archives:
+            _archives[key] = PageArchive(folder)
+        return _archives[key]
+
+
+def close_archives():
+    """
+    Zamknięcie współdzielonych archiwów (zatwierdzenie oczekujących wpisów indeksu) - wywoływane przy końcu procesu
+    """
+    with _archives_lock:
+        for page_archive in _archives.values():
+            page_archive.close()
+        _archives.clear()
+
+
+def archive_exists(folder=DEFAULT_ARCHIVE_FOLDER):
+    """
+    :param folder: folder archiwum
+    :return: True, jeśli w folderze założono archiwum
+    """
+    return os.path.isfile(os.path.join(folder, PageArchive.index_name))
+
+
+class PageArchive:
+    """
+    Archiwum stron: skompresowane segmenty append-only i indeks nazwa strony -> (segment, przesunięcie, długość)
+    """
+    index_name = 'index.sqlite'
+    segment_template = 'segment_{:05d}.bin'
+    # liczba zapisów, po której zatwierdzana jest transakcja indeksu
+    commit_every = 100
+
+    def __init__(self, folder=DEFAULT_ARCHIVE_FOLDER, codec=None, segment_size=256 * 1024 * 1024, commit_every=None):
+        """Konstruktor otwierający (lub zakładający) archiwum
+
+        :param folder: folder archiwum
+        :param codec: kompresja nowych wpisów: 'zstd' lub 'gzip' (None - zstd, jeśli dostępny pakiet zstandard)
+        :param segment_size: rozmiar segmentu w bajtach, po którego przekroczeniu zakładany jest kolejny segment
+        :param commit_every: liczba zapisów, po której zatwierdzany jest indeks (None - wartość domyślna klasy)
+        """
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        if codec is None:
+            codec = 'zstd' if zstandard is not None else 'gzip'
+        if codec == 'zstd' and zstandard is None:
+            raise ModuleNotFoundError('Kompresja zstd wymaga pakietu zstandard')
+
+        self.folder = folder
+        self.codec = codec
+        self.segment_size = segment_size
+        if commit_every is not None:
+            self.commit_every = commit_every
+        self._lock = threading.Lock()
+        self._readers = dict()
+        self._pending = 0
+        self._closed = False
+        self._connection = sqlite3.connect(os.path.join(folder, self.index_name), check_same_thread=False)
+        # WAL: zatwierdzenie nie wymaga fsync przy każdej transakcji, a odczyt z innych połączeń nie blokuje zapisu
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, segment INTEGER, '
+                                 'offset INTEGER, length INTEGER, codec TEXT, size INTEGER)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS pages (folder TEXT, name TEXT, hash TEXT, '
+                                 'stored_at REAL, PRIMARY KEY (folder, name))')
+        self._connection.commit()
+
+        row = self._connection.execute('SELECT MAX(segment) FROM blobs').fetchone()
+        self._segment = row[0] or 0
+        self._writer = open(self._segment_path(self._segment), 'ab')
+
+    @staticmethod
+    def _folder_key(folder):
+        return os.path.normpath(folder).replace(os.sep, '/')
+
+    def _segment_path(self, segment):
+        return os.path.join(self.folder, self.segment_template.format(segment))
+
+    def _compress(self, data):
+        if self.codec == 'zstd':
+            return zstandard.ZstdCompressor().compress(data)
+        return gzip.compress(data, mtime=0)
+
+    @staticmethod
+    def _decompress(data, codec):
+        if codec == 'zstd':
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def put(self, folder, name, data):
+        """Zapis strony w archiwum. Treść identyczna z zapisaną wcześniej nie jest zapisywana ponownie.
+        Wpis indeksu widoczny jest od razu dla tego obiektu, a dla innych połączeń - po zatwierdzeniu (flush).
+
+        :param folder: folder logiczny (np. offers/otomoto)
+        :param name: nazwa strony (np. offer_123.html)
+        :param data: treść strony (bytes lub string - zapisywany w UTF-8)
+        :return: skrót SHA-256 treści
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            known = self._connection.execute('SELECT 1 FROM blobs WHERE hash = ?', (digest,)).fetchone()
+            if known is None:
+                compressed = self._compress(data)
+                if self._writer.tell() and self._writer.tell() + len(compressed) > self.segment_size:
+                    self._writer.close()
+                    self._segment += 1
+                    self._writer = open(self._segment_path(self._segment), 'ab')
+                offset = self._writer.tell()
+                self._writer.write(compressed)
+                self._writer.flush()
+                self._connection.execute('INSERT INTO blobs VALUES (?, ?, ?, ?, ?, ?)',
+                                         (digest, self._segment, offset, len(compressed), self.codec, len(data)))
+            self._connection.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)',
+                                     (self._folder_key(folder), name, digest, time.time()))
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self._commit()
+        return digest
+
+    def _commit(self):
+        self._connection.commit()
+        self._pending = 0
+
+    def flush(self):
+        """
+        Zatwierdzenie oczekujących wpisów indeksu
+        """
+        with self._lock:
+            if self._pending:
+                self._commit()
+
+    def get(self, folder, name):
+        """Odczyt strony z archiwum
+
+        :param folder: folder logiczny
+        :param name: nazwa strony
+        :return: treść strony (bytes)
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT b.segment, b.offset, b.length, b.codec FROM pages p '
+                                           'JOIN blobs b ON b.hash = p.hash WHERE p.folder = ? AND p.name = ?',
+                                           (self._folder_key(folder), name)).fetchone()
+            if row is None:
+                raise KeyError('%s/%s' % (folder, name))
+            segment, offset, length, codec = row
+            reader = self._readers.get(segment)
+            if reader is None:
+                reader = self._readers[segment] = open(self._segment_path(segment), 'rb')
+            reader.seek(offset)
+            compressed = reader.read(length)
+        return self._decompress(compressed, codec)
+
+    def contains(self, folder, name):
+        with self._lock:
+            row = self._connection.execute('SELECT 1 FROM pages WHERE folder = ? AND name = ?',
+                                           (self._folder_key(folder), name)).fetchone()
+        return row is not None
+
+    def stored_at(self, folder, name):
+        """
+        :param folder: folder logiczny
+        :param name: nazwa strony
+        :return: czas zapisu strony (timestamp) lub None
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT stored_at FROM pages WHERE folder = ? AND name = ?',
+                                           (self._folder_key(folder), name)).fetchone()
+        return row[0] if row is not None else None
+
+    def names(self, folder, since=None, until=None):
+        """Lista nazw stron w folderze logicznym, w kolejności zapisu
+
+        :param folder: folder logiczny
+        :param since: najwcześniejszy czas zapisu strony (timestamp) lub None
+        :param until: najpóźniejszy czas zapisu strony (timestamp, wyłącznie) lub None
+        :return: lista nazw
+        """
+        query, parameters = 'SELECT name FROM pages WHERE folder = ?', [self._folder_key(folder)]
+        if since is not None:
+            query += ' AND stored_at >= ?'
+            parameters.append(since)
+        if until is not None:
+            query += ' AND stored_at < ?'
+            parameters.append(until)
+        with self._lock:
+            rows = self._connection.execute(query + ' ORDER BY rowid', parameters).fetchall()
+        return [row[0] for row in rows]
+
+    def import_folder(self, folder, pattern='.html'):
+        """Migracja stron zapisanych jako osobne pliki do archiwum (pliki nie są usuwane)
+
+        :param folder: folder z plikami
+        :param pattern: końcówka nazw importowanych plików
+        :return: liczba zaimportowanych plików
+        """
+        count = 0
+        for entry in sorted(os.scandir(folder), key=lambda item: item.name):
+            if entry.is_file() and entry.name.endswith(pattern):
+                with open(entry.path, 'rb') as file_in:
+                    self.put(folder, entry.name, file_in.read())
+                count += 1
+        return count
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._commit()
+            self._writer.close()
+            for reader in self._readers.values():
+                reader.close()
+            self._readers.clear()
+            self._connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import folderów ze stronami do archiwum')
+    parser.add_argument('folders', nargs='+')
+    parser.add_argument('--archive', default=DEFAULT_ARCHIVE_FOLDER)
+    arguments = parser.parse_args()
+
+    page_archive = get_archive(arguments.archive)
+    for source_folder in arguments.folders:
+        print('%s: zaimportowano %s plików' % (source_folder, page_archive.import_folder(source_folder)))
+    page_archive.close()
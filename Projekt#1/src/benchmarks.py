@@ -0,0 +1,430 @@
+"""
+Benchmarki i testy zgodności szybkich ścieżek przetwarzania, uruchamiane na zapisanych wcześniej stronach
+(np. python benchmarks.py links --listing-folder listings, python benchmarks.py offer-id)
+"""
+import argparse
+import fnmatch
+import glob
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+from requests.compat import chardet
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from archive import archive_exists, get_archive
+from corpus import default_pack_path
+from downloaders import AllegroDownloader, AutoScout24Downloader, OlxDownloader, OtomotoDownloader
+from fileloaders import AllegroFileloader, AutoScout24Fileloader, OlxFileloader, OtomotoFileloader
+from models import Base, Oferty
+from parsers import (PARSER_BACKENDS, AllegroOfferParser, Autoscout24OfferParser, Offer, OlxOfferParser,
+                     OtomotoOfferParser, available_backend)
+from writer import BatchWriter
+
+PORTALS = (('Allegro', AllegroFileloader, AllegroOfferParser),
+           ('Olx', OlxFileloader, OlxOfferParser),
+           ('Otomoto', OtomotoFileloader, OtomotoOfferParser),
+           ('Autoscout24', AutoScout24Fileloader, Autoscout24OfferParser))
+
+
+def load_pages(folder, pattern='*.html'):
+    """Odczyt zapisanych stron z folderu - osobnych plików oraz stron zapisanych w archiwum (domyślny sposób zapisu
+    downloaderów)
+
+    :param folder: folder ze stronami (dla archiwum - folder logiczny)
+    :param pattern: wzorzec nazw plików
+    :return: lista krotek (nazwa pliku, string z html)
+    """
+    pages = list()
+    for file_name in sorted(glob.glob(os.path.join(folder, pattern))):
+        with open(file_name, 'r', encoding='utf-8') as file_in:
+            pages.append((os.path.basename(file_name), file_in.read()))
+    if archive_exists():
+        page_archive = get_archive()
+        loaded = set(name for name, _ in pages)
+        for name in page_archive.names(folder):
+            if name not in loaded and fnmatch.fnmatch(name, pattern):
+                pages.append((name, page_archive.get(folder, name).decode('utf-8', errors='replace')))
+    return pages
+
+
+def load_offers(fileloader, limit=-1):
+    """Odczyt zapisanych ofert z użyciem fileloadera (z archiwum lub osobnych plików)
+
+    :param fileloader: obiekt fileloadera
+    :param limit: maksymalna liczba ofert (-1 - wszystkie)
+    :return: lista krotek (nazwa oferty, bytes z html)
+    """
+    names = fileloader.download_number_of_links(None, number_of_offers=limit)
+    return [(name, fileloader.download_offer(name)) for name in names]
+
+
+def measure(function, items, repeat):
+    """Pomiar przepustowości funkcji - najlepszy z repeat przebiegów po całym zbiorze (najmniej zaburzony przez
+    inne procesy)
+
+    :param function: funkcja jednoargumentowa
+    :param items: elementy przekazywane do funkcji
+    :param repeat: liczba przebiegów
+    :return: liczba elementów na sekundę
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for item in items:
+            function(item)
+        best = min(best, time.perf_counter() - start_time)
+    return len(items) / best if best else float('inf')
+
+
+def benchmark_link_extraction(logger, listing_folder='listings', repeat=3):
+    """Porównanie wydobywania linków z listingów: strumieniowy ekstraktor vs pełne drzewo BeautifulSoup.
+    Dla każdego zapisanego listingu i prefiksu linków każdego z portali sprawdzana jest zgodność wyników.
+    Przepustowość mierzona jest osobno dla każdego portalu, z jego prefiksem, na listingach zawierających linki
+    do jego ofert (lub na wszystkich listingach, jeśli takich nie ma).
+
+    :param logger: obiekt loggera
+    :param listing_folder: folder z zapisanymi listingami
+    :param repeat: liczba powtórzeń pomiaru
+    :return: liczba niezgodności
+    """
+    pages = load_pages(listing_folder)
+    if not pages:
+        print('Brak listingów w folderze (ani w archiwum) %s' % listing_folder)
+        return 0
+
+    downloaders = [downloader_class(logger) for downloader_class in
+                   (AllegroDownloader, OlxDownloader, OtomotoDownloader, AutoScout24Downloader)]
+    mismatches = 0
+    # downloader -> listingy z linkami do ofert portalu
+    own_pages = dict((downloader, list()) for downloader in downloaders)
+    for file_name, html in pages:
+        for downloader in downloaders:
+            fast = downloader.get_links_from_listing(html, downloader.offer_link_prefix)
+            reference = downloader.get_links_from_listing_soup(html, downloader.offer_link_prefix)
+            if fast != reference:
+                mismatches += 1
+                print('Niezgodność: %s, %s' % (file_name, type(downloader).__name__))
+            if reference:
+                own_pages[downloader].append(html)
+
+    for downloader in downloaders:
+        htmls = own_pages[downloader] or [html for _, html in pages]
+        for name, method in (('LinkExtractor', downloader.get_links_from_listing),
+                             ('BeautifulSoup', downloader.get_links_from_listing_soup)):
+            rate = measure(lambda html: method(html, downloader.offer_link_prefix), htmls, repeat)
+            print('%-22s %-15s %8.1f stron/s (listingów: %s)' % (type(downloader).__name__, name, rate, len(htmls)))
+
+    print('Listingów: %s, niezgodności: %s' % (len(pages), mismatches))
+    return mismatches
+
+
+def benchmark_offer_id(logger, limit=-1, repeat=3):
+    """Porównanie wydobywania identyfikatora oferty na potrzeby nazwy zapisywanego pliku: wyszukiwanie znacznika
+    w tekście vs budowa drzewa BeautifulSoup (poprzednia implementacja download_offer). Różnica czasów to koszt CPU
+    oszczędzany na każdej zapisywanej ofercie.
+
+    :param logger: obiekt loggera
+    :param limit: maksymalna liczba ofert dla portalu (-1 - wszystkie)
+    :param repeat: liczba powtórzeń pomiaru
+    :return: liczba niezgodności
+    """
+    mismatches = 0
+    for downloader_class, fileloader_class in ((OtomotoDownloader, OtomotoFileloader), (OlxDownloader, OlxFileloader),
+                                               (AutoScout24Downloader, AutoScout24Fileloader)):
+        downloader = downloader_class(logger)
+        offers = load_offers(fileloader_class(logger), limit)
+        if not offers:
+            print('%-22s brak zapisanych ofert' % downloader_class.__name__)
+            continue
+
+        tag, attrs, attribute = downloader.offer_id_tag
+
+        def soup_offer_id(html):
+            soup = BeautifulSoup(html, 'html.parser', from_encoding=downloader.encoding)
+            return soup.find(tag, attrs=attrs)[attribute]
+
+        for name, html in offers:
+            if downloader.extract_offer_id(html) != soup_offer_id(html):
+                mismatches += 1
+                print('Niezgodność: %s, %s' % (downloader_class.__name__, name))
+
+        htmls = [html for _, html in offers]
+        fast = measure(downloader.extract_offer_id, htmls, repeat)
+        reference = measure(soup_offer_id, htmls, repeat)
+        print('%-22s ofert: %5s, wyszukiwanie: %8.3f ms/ofertę, BeautifulSoup: %8.3f ms/ofertę' %
+              (downloader_class.__name__, len(offers), 1000 / fast, 1000 / reference))
+
+    print('Niezgodności: %s' % mismatches)
+    return mismatches
+
+
+def benchmark_bytes(logger, limit=-1, repeat=3):
+    """Porównanie kosztu CPU obsługi oferty: poprzednia ścieżka tekstowa (zgadywanie kodowania odpowiedzi bez
+    deklaracji charset, kodowanie do UTF-8 przy zapisie, ponowne dekodowanie przy odczycie, parsowanie stringa)
+    vs ścieżka bajtowa (bajty ze znanym kodowaniem przekazywane bezpośrednio do parsera)
+
+    :param logger: obiekt loggera
+    :param limit: maksymalna liczba ofert dla portalu (-1 - wszystkie)
+    :param repeat: liczba powtórzeń pomiaru
+    """
+    for portal_name, fileloader_class, parser_class in PORTALS:
+        fileloader = fileloader_class(logger)
+        offers = [html for _, html in load_offers(fileloader, limit)]
+        if not offers:
+            print('%-12s brak zapisanych ofert' % portal_name)
+            continue
+        parser = parser_class(logger)
+
+        def text_path(raw):
+            text = raw.decode(chardet.detect(raw)['encoding'] or 'utf-8', errors='replace')
+            text = text.encode('UTF-8').decode('utf-8')
+            return parser.get_details(text)
+
+        def bytes_path(raw):
+            return parser.get_details(raw, encoding=fileloader.encoding)
+
+        text_rate = measure(text_path, offers, repeat)
+        bytes_rate = measure(bytes_path, offers, repeat)
+        print('%-12s ofert: %5s, ścieżka tekstowa: %8.3f ms/ofertę, bajtowa: %8.3f ms/ofertę, oszczędność: %8.3f ms'
+              % (portal_name, len(offers), 1000 / text_rate, 1000 / bytes_rate, 1000 / text_rate - 1000 / bytes_rate))
+
+
+def benchmark_replay(logger, limit=-1, repeat=3, prefetch=32):
+    """Porównanie ponownego przetwarzania zapisanych ofert (odczyt + parsowanie): odczyt synchroniczny, odczyt
+    z wyprzedzeniem oraz - jeśli istnieje - spakowany korpus (python corpus.py offers/<portal>). Przy ciepłym cache
+    systemu plików różnice są niewielkie - pomiar ma sens po opróżnieniu cache (np. echo 3 > /proc/sys/vm/drop_caches)
+    lub dla folderów na wolnym dysku.
+
+    :param logger: obiekt loggera
+    :param limit: maksymalna liczba ofert dla portalu (-1 - wszystkie)
+    :param repeat: liczba powtórzeń pomiaru
+    :param prefetch: liczba ofert odczytywanych z wyprzedzeniem
+    """
+    for portal_name, fileloader_class, parser_class in PORTALS:
+        variants = [('synchronicznie', dict(prefetch=0)), ('z wyprzedzeniem', dict(prefetch=prefetch))]
+        if os.path.isfile(default_pack_path(fileloader_class(logger).offer_folder)):
+            variants.append(('korpus', dict(prefetch=prefetch, pack=True)))
+
+        results = list()
+        for variant_name, options in variants:
+            fileloader = fileloader_class(logger, **options)
+            names = fileloader.download_number_of_links(None, number_of_offers=limit)
+            if not names:
+                break
+            parser = parser_class(logger)
+
+            def replay(_):
+                for _, html, exc in fileloader.download_offers(names):
+                    if exc is None:
+                        parser.get_details(html, encoding=fileloader.encoding)
+
+            results.append('%s: %8.1f ofert/s' % (variant_name, measure(replay, [None], repeat) * len(names)))
+        if not results:
+            print('%-12s brak zapisanych ofert' % portal_name)
+            continue
+        print('%-12s ofert: %5s, %s' % (portal_name, len(names), ', '.join(results)))
+
+
+def offer_fields(offer):
+    """
+    :param offer: obiekt klasy Offer
+    :return: słownik wartości wszystkich pól oferty
+    """
+    return dict((field, getattr(offer, field)) for field in Offer.__slots__)
+
+
+def benchmark_backends(logger, limit=-1, repeat=3):
+    """Test zgodności i porównanie wydajności backendów parserów: dla każdej zapisanej oferty wszystkie pola obiektu
+    Offer muszą być identyczne z wynikiem backendu html.parser (wyjątki parsera również muszą się zgadzać).
+    Wydajność podawana jest w ofertach na sekundę dla każdego backendu i portalu.
+
+    :param logger: obiekt loggera
+    :param limit: maksymalna liczba ofert dla portalu (-1 - wszystkie)
+    :param repeat: liczba powtórzeń pomiaru
+    :return: liczba niezgodności
+    """
+    backends = [backend for backend in PARSER_BACKENDS if available_backend(backend) == backend]
+    mismatches = 0
+    for portal_name, fileloader_class, parser_class in PORTALS:
+        fileloader = fileloader_class(logger)
+        offers = load_offers(fileloader, limit)
+        if not offers:
+            print('%-12s brak zapisanych ofert' % portal_name)
+            continue
+
+        parsers = dict((backend, parser_class(logger, backend=backend)) for backend in backends)
+
+        def parse(parser, html):
+            try:
+                return offer_fields(parser.get_details(html, encoding=fileloader.encoding))
+            except Exception as exc:
+                return type(exc).__name__
+
+        for name, html in offers:
+            reference = parse(parsers['html.parser'], html)
+            for backend, parser in parsers.items():
+                result = parse(parser, html)
+                if result != reference:
+                    mismatches += 1
+                    if isinstance(result, dict) and isinstance(reference, dict):
+                        result = dict((field, value) for field, value in result.items() if reference[field] != value)
+                    print('Niezgodność: %s, %s, %s: %s' % (portal_name, name, backend, result))
+
+        htmls = [html for _, html in offers]
+        rates = list()
+        for backend, parser in parsers.items():
+            rate = measure(lambda html: parse(parser, html), htmls, repeat)
+            rates.append('%s: %8.1f ofert/s' % (backend, rate))
+        print('%-12s ofert: %5s, %s' % (portal_name, len(offers), ', '.join(rates)))
+
+    print('Niezgodności: %s' % mismatches)
+    return mismatches
+
+
+def peak_memory(function, items):
+    """
+    :param function: funkcja jednoargumentowa
+    :param items: elementy przekazywane do funkcji
+    :return: największy szczytowy przyrost pamięci (w bajtach) dla pojedynczego wywołania - tylko alokacje
+        Pythona (tracemalloc), bez pamięci zajmowanej wewnętrznie przez lxml
+    """
+    peak = 0
+    for item in items:
+        tracemalloc.start()
+        function(item)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return peak
+
+
+def benchmark_regions(logger, limit=-1, repeat=3):
+    """Porównanie parsowania z pełnego drzewa i z drzewa ograniczonego do regionów deklarowanych przez parser
+    (wraz z odczytem danych JSON bezpośrednio z html): zgodność wszystkich pól Offer, liczba ofert, dla których parser
+    wrócił do pełnego drzewa, liczniki odczytu danych JSON z html i z drzewa, czas parsowania i szczytowe zużycie
+    pamięci na ofertę
+
+    :param logger: obiekt loggera
+    :param limit: maksymalna liczba ofert dla portalu (-1 - wszystkie)
+    :param repeat: liczba powtórzeń pomiaru
+    :return: liczba niezgodności
+    """
+    mismatches = 0
+    for portal_name, fileloader_class, parser_class in PORTALS:
+        fileloader = fileloader_class(logger)
+        htmls = [html for _, html in load_offers(fileloader, limit)]
+        if not htmls:
+            print('%-12s brak zapisanych ofert' % portal_name)
+            continue
+        full = parser_class(logger, restrict=False)
+        restricted = parser_class(logger)
+
+        fallbacks = 0
+        for html in htmls:
+            payload = restricted.extract_payload(html, fileloader.encoding)
+            strainer = restricted.strainer if payload is not None else restricted.payload_strainer
+            try:
+                restricted.parse_offer(restricted.make_soup(html, fileloader.encoding, strainer), html,
+                                       fileloader.encoding, payload)
+            except Exception:
+                fallbacks += 1
+            if offer_fields(full.get_details(html, fileloader.encoding)) != \
+                    offer_fields(restricted.get_details(html, fileloader.encoding)):
+                mismatches += 1
+
+        results = list()
+        for variant_name, parser in (('pełne drzewo', full), ('regiony', restricted)):
+            rate = measure(lambda html: parser.get_details(html, fileloader.encoding), htmls, repeat)
+            peak = peak_memory(lambda html: parser.get_details(html, fileloader.encoding), htmls)
+            results.append('%s: %8.1f ofert/s, %6.0f KiB' % (variant_name, rate, peak / 1024))
+        print('%-12s ofert: %5s, powrotów do pełnego drzewa: %s, JSON z html/z drzewa: %s/%s, %s'
+              % (portal_name, len(htmls), fallbacks, restricted.stats['fast'], restricted.stats['fallback'],
+                 ', '.join(results)))
+
+    print('Niezgodności: %s' % mismatches)
+    return mismatches
+
+
+def benchmark_writer(logger, limit=-1, rows=2000, batch_size=None):
+    """Porównanie zapisu ofert do bazy SQLite (plik tymczasowy): obiekt ORM i commit dla każdej oferty oraz zapis
+    partiami przez BatchWriter. Zapisywane są wiersze sparsowanych ofert z korpusu, powielone do zadanej liczby.
+
+    :param logger: obiekt loggera
+    :param limit: maksymalna liczba ofert dla portalu (-1 - wszystkie)
+    :param rows: liczba zapisywanych wierszy
+    :param batch_size: liczba wierszy partii (None - wartość domyślna BatchWriter)
+    """
+    offers = list()
+    for portal_name, fileloader_class, parser_class in PORTALS:
+        fileloader = fileloader_class(logger)
+        parser = parser_class(logger)
+        for _, html in load_offers(fileloader, limit):
+            try:
+                offers.append(parser.get_details(html, fileloader.encoding))
+            except Exception as exc:
+                logger.info('Pominięto ofertę %s: %s' % (portal_name, exc))
+    if not offers:
+        print('Brak zapisanych ofert')
+        return
+    row_values = [dict(offers[i % len(offers)].as_row(), id_kampanii=1) for i in range(rows)]
+
+    def write_orm(session):
+        for values in row_values:
+            session.add(Oferty(**values))
+            session.commit()
+
+    def write_batches(session):
+        with BatchWriter(logger, session, batch_size=batch_size) as writer:
+            for values in row_values:
+                writer.add(values)
+
+    with tempfile.TemporaryDirectory() as folder:
+        results = list()
+        for variant_name, write in (('ORM, commit na ofertę', write_orm), ('BatchWriter', write_batches)):
+            engine = create_engine('sqlite:///' + os.path.join(folder, variant_name.split(',')[0] + '.db'))
+            Base.metadata.create_all(engine)
+            session = sessionmaker(bind=engine)()
+            start_time = time.perf_counter()
+            write(session)
+            elapsed = time.perf_counter() - start_time
+            count = session.query(Oferty).count()
+            session.close()
+            engine.dispose()
+            results.append('%s: %9.1f wierszy/s (zapisanych %s)' % (variant_name, rows / elapsed, count))
+    print('Wierszy: %s, %s' % (rows, ', '.join(results)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarki szybkich ścieżek przetwarzania')
+    parser.add_argument('benchmark', choices=['links', 'offer-id', 'bytes', 'replay', 'backends', 'regions',
+                                                     'writer'])
+    parser.add_argument('--listing-folder', default='listings')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--limit', type=int, default=-1)
+    parser.add_argument('--prefetch', type=int, default=32)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int)
+    arguments = parser.parse_args()
+
+    my_logger = logging.getLogger('Benchmarks')
+    logging.basicConfig(filename='{}.log'.format(sys.argv[0]), level=logging.WARNING)
+
+    if arguments.benchmark == 'links':
+        benchmark_link_extraction(my_logger, arguments.listing_folder, arguments.repeat)
+    elif arguments.benchmark == 'offer-id':
+        benchmark_offer_id(my_logger, arguments.limit, arguments.repeat)
+    elif arguments.benchmark == 'bytes':
+        benchmark_bytes(my_logger, arguments.limit, arguments.repeat)
+    elif arguments.benchmark == 'replay':
+        benchmark_replay(my_logger, arguments.limit, arguments.repeat, arguments.prefetch)
+    elif arguments.benchmark == 'backends':
+        benchmark_backends(my_logger, arguments.limit, arguments.repeat)
+    elif arguments.benchmark == 'regions':
+        benchmark_regions(my_logger, arguments.limit, arguments.repeat)
+    elif arguments.benchmark == 'writer':
+        benchmark_writer(my_logger, arguments.limit, arguments.rows, arguments.batch_size)
@@ -0,0 +1,269 @@
+"""
+Uruchamianie kampanii dla wielu portali równocześnie. Plan kampanii to lista wpisów (portal, kategoria, liczba ofert);
+procesory portali działają w osobnych wątkach (portale to niezależne hosty, więc czas całej kampanii zbliża się
+do czasu najwolniejszego portalu zamiast do sumy czasów), korzystają ze wspólnej puli równoległych żądań
+i zapisują oferty przez jeden wspólny wątek zapisu (jeden zapisujący dla bazy SQLite).
+Przykład: python campaign_runner.py --portals Otomoto Olx --categories "ford focus mk3" --number-of-offers 20
+Wznowienie przerwanych kampanii (według dzienników postępu): python campaign_runner.py --resume 12 13
+Zapytania Autoscout24 dzielone są na roczniki (shard) domyślnie tylko przy pobieraniu wszystkich ofert
+(--number-of-offers -1); --shard / --no-shard wymusza wybór.
+"""
+import argparse
+import collections
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+
+from db_engine import Session
+from http_cache import ResponseCache
+from models import Kampanie, Oferty
+from pipeline import StoreWorker
+from processors import (AllegroProcessor, Autoscout24Processor, OlxProcessor, OtomotoProcessor,
+                        all_categories_mappings)
+from writer import BatchWriter
+
+PROCESSORS = {
+    'Allegro': AllegroProcessor,
+    'Otomoto': OtomotoProcessor,
+    'Olx': OlxProcessor,
+    'Autoscout24': Autoscout24Processor}
+
+# zakres roczników zapytań Autoscout24 dla kategorii
+autoscout24_years_mapping = {
+    'ford focus mk3': (2005, 2011),
+    'passat b8': (2014, 2019)}
+
+# shard: podział zapytania na roczniki (tylko Autoscout24); None - tylko przy pobieraniu wszystkich ofert
+PlanEntry = collections.namedtuple('PlanEntry', ['portal', 'category', 'number_of_offers', 'shard'],
+                                   defaults=(None,))
+
+
+def make_plan(portals=None, categories=None, number_of_offers=4, shard=None):
+    """Plan kampanii: wszystkie kombinacje portali i kategorii
+
+    :param portals: nazwy portali (None - wszystkie)
+    :param categories: kategorie (None - wszystkie kategorie z mapowań)
+    :param number_of_offers: liczba ofert dla każdej pary portal, kategoria
+    :param shard: podział zapytań Autoscout24 na roczniki (None - tylko dla number_of_offers równego -1)
+    :return: lista wpisów PlanEntry
+    """
+    portals = portals or list(PROCESSORS)
+    categories = categories or list(all_categories_mappings[portals[0]])
+    return [PlanEntry(portal, category, number_of_offers, shard) for portal in portals for category in categories]
+
+
+def load_plan(path):
+    """Odczyt planu kampanii z pliku JSON - lista obiektów z kluczami portal, category, number_of_offers
+    i opcjonalnie shard
+
+    :param path: ścieżka do pliku planu
+    :return: lista wpisów PlanEntry
+    """
+    with open(path, 'r', encoding='utf-8') as file_in:
+        return [PlanEntry(entry['portal'], entry['category'], entry.get('number_of_offers', -1), entry.get('shard'))
+                for entry in json.load(file_in)]
+
+
+class CampaignRunner:
+    """
+    Równoległe uruchamianie procesorów portali według planu kampanii. Każdy portal przetwarzany jest w osobnym wątku
+    przez jeden procesor (kategorie portalu kolejno, w ramach jednej kampanii), z własną sesją bazy danych.
+    Wiersze ofert wszystkich procesorów trafiają do wspólnego etapu zapisu (StoreWorker z BatchWriter).
+    Zamiast planu runner może wznawiać przerwane kampanie (from_campaigns).
+    """
+    # globalny limit równoległych żądań - wspólny semafor downloaderów wszystkich portali (każdy portal zachowuje
+    # także własny limit max_concurrency)
+    workers = 16
+
+    def __init__(self, logger, plan, provider='portal', workers=None, parse_workers=0, session_factory=Session,
+                 processor_options=None, cache=None):
+        """Konstruktor
+
+        :param logger: obiekt loggera
+        :param plan: lista wpisów PlanEntry
+        :param provider: źródło ofert procesorów ("portal", "file" lub "pack")
+        :param workers: globalny limit równoległych żądań (None - wartość domyślna klasy)
+        :param parse_workers: łączna liczba procesów parsujących, dzielona między portale (0 - parsowanie w wątkach
+            portali)
+        :param session_factory: fabryka sesji bazy danych
+        :param processor_options: słownik dodatkowych opcji konstruktorów procesorów (np. incremental); dziennik
+            postępu (journal) jest domyślnie włączony
+        :param cache: obiekt http_cache.ResponseCache współdzielony przez downloadery portali (tylko dla provider
+            "portal") lub None - bez cache
+        """
+        self.logger = logger
+        self.plan = plan
+        self.provider = provider
+        self.workers = workers if workers is not None else self.workers
+        self.parse_workers = parse_workers
+        self.session_factory = session_factory
+        self.processor_options = processor_options or dict()
+        self.cache = cache
+        self.request_slots = threading.BoundedSemaphore(self.workers)
+        self.portals = collections.OrderedDict()
+        for entry in plan:
+            self.portals.setdefault(entry.portal, list()).append(entry)
+        # portal -> identyfikator wznawianej kampanii
+        self.campaigns = dict()
+
+    @classmethod
+    def from_campaigns(cls, logger, campaigns, session_factory=Session, **kwargs):
+        """Runner wznawiający przerwane kampanie według ich dzienników postępu
+
+        :param logger: obiekt loggera
+        :param campaigns: identyfikatory kampanii (Kampanie.idx), co najwyżej jedna kampania dla portalu
+        :param session_factory: fabryka sesji bazy danych
+        :param kwargs: pozostałe opcje konstruktora (provider, workers, parse_workers, processor_options, cache)
+        :return: obiekt CampaignRunner
+        """
+        runner = cls(logger, list(), session_factory=session_factory, **kwargs)
+        session = session_factory()
+        for campaign in campaigns:
+            kampania = session.get(Kampanie, campaign)
+            if kampania is None:
+                raise ValueError('Brak kampanii %s' % campaign)
+            portal_name = kampania.portal.nazwa_portalu
+            if portal_name in runner.campaigns:
+                raise ValueError('Portal %s: można wznowić tylko jedną kampanię naraz' % portal_name)
+            runner.campaigns[portal_name] = campaign
+            runner.portals[portal_name] = list()
+        session.close()
+        return runner
+
+    def _run_portal(self, portal_name, entries, store):
+        """Przetworzenie wpisów planu jednego portalu
+
+        :return: słownik z wynikiem: processor, campaign (identyfikator kampanii), duration, error
+        """
+        start_time = time.perf_counter()
+        parse_workers = max(1, self.parse_workers // len(self.portals)) if self.parse_workers else 0
+        session = self.session_factory()
+        options = dict(journal=True)
+        options.update(self.processor_options)
+        downloader_options = dict()
+        if self.provider == 'portal':
+            downloader_options['request_slots'] = self.request_slots
+            if self.cache is not None:
+                downloader_options['cache'] = self.cache
+        processor = PROCESSORS[portal_name](self.logger, session, provider=self.provider,
+                                            downloader_options=downloader_options,
+                                            parse_workers=parse_workers, store=store, **options)
+        result = dict(processor=processor, campaign=None, error=None)
+        try:
+            if portal_name in self.campaigns:
+                processor.resume_campaign(self.campaigns[portal_name])
+                result['campaign'] = processor.kampania.idx
+                processor.resume()
+            else:
+                processor.prepare_campaign()
+                result['campaign'] = processor.kampania.idx
+            for entry in entries:
+                if isinstance(processor, Autoscout24Processor):
+                    from_year, to_year = autoscout24_years_mapping[entry.category]
+                    # podział na roczniki przegląda wszystkie strony listingu każdego rocznika przed zwróceniem
+                    # pierwszego linku, więc domyślnie stosowany jest tylko przy pobieraniu wszystkich ofert
+                    shard = entry.shard if entry.shard is not None else entry.number_of_offers == -1
+                    processor.asc_process(entry.category, number_of_offers=entry.number_of_offers,
+                                          from_year=from_year, to_year=to_year, save=True, shard=shard)
+                else:
+                    processor.process(entry.category, number_of_offers=entry.number_of_offers, save=True)
+        except Exception as exc:
+            self.logger.exception('Przetwarzanie portalu %s przerwane' % portal_name)
+            result['error'] = exc
+        finally:
+            processor.close()
+            session.close()
+        result['duration'] = time.perf_counter() - start_time
+        return result
+
+    def run(self):
+        """Wykonanie planu kampanii
+
+        :return: słownik portal -> wynik (processor, campaign, duration, error, offers - liczba zapisanych ofert)
+        """
+        writer_session = self.session_factory()
+        writer = BatchWriter(self.logger, writer_session)
+        try:
+            with StoreWorker(writer.add, idle=writer.flush_due) as store:
+                with ThreadPoolExecutor(max_workers=len(self.portals)) as executor:
+                    futures = [(portal_name, executor.submit(self._run_portal, portal_name, entries, store))
+                               for portal_name, entries in self.portals.items()]
+                    results = collections.OrderedDict((portal_name, future.result())
+                                                      for portal_name, future in futures)
+        finally:
+            writer.close()
+
+        # klucze znanych ofert i stany stored dziennika dodawane są po zapisie wierszy, dlatego indeksy i dzienniki
+        # zapisywane są po zamknięciu etapu zapisu
+        for result in results.values():
+            if result['processor'].known_offers is not None:
+                result['processor'].known_offers.save()
+            if result['processor'].journal is not None:
+                result['processor'].journal.close()
+
+        campaigns = [result['campaign'] for result in results.values() if result['campaign'] is not None]
+        counts = dict(writer_session.query(Oferty.id_kampanii, func.count(Oferty.idx))
+                      .filter(Oferty.id_kampanii.in_(campaigns)).group_by(Oferty.id_kampanii))
+        writer_session.close()
+        for result in results.values():
+            result['offers'] = counts.get(result['campaign'], 0)
+        return results
+
+
+def print_report(results, duration):
+    """Wydruk podsumowania kampanii: czas i liczba ofert dla portali oraz czas całkowity
+
+    :param results: wynik metody CampaignRunner.run
+    :param duration: czas całej kampanii w sekundach
+    """
+    print('%-12s %9s %7s %10s' % ('Portal', 'Kampania', 'Ofert', 'Czas [s]'))
+    for portal_name, result in results.items():
+        status = '' if result['error'] is None else '  błąd: %s' % result['error']
+        print('%-12s %9s %7s %10.1f%s' % (portal_name, result['campaign'], result['offers'], result['duration'],
+                                           status))
+    print('Czas kampanii: %.1f s, suma czasów portali: %.1f s, ofert: %s'
+          % (duration, sum(result['duration'] for result in results.values()),
+             sum(result['offers'] for result in results.values())))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Równoległe kampanie dla wielu portali')
+    parser.add_argument('--plan', help='plik JSON z planem kampanii (zamiast --portals/--categories)')
+    parser.add_argument('--portals', nargs='+', choices=list(PROCESSORS))
+    parser.add_argument('--categories', nargs='+')
+    parser.add_argument('--number-of-offers', type=int, default=4)
+    parser.add_argument('--shard', action=argparse.BooleanOptionalAction, default=None,
+                        help='podział zapytań Autoscout24 na roczniki (domyślnie tylko dla --number-of-offers -1)')
+    parser.add_argument('--provider', choices=['portal', 'file', 'pack'], default='portal')
+    parser.add_argument('--workers', type=int, default=CampaignRunner.workers)
+    parser.add_argument('--parse-workers', type=int, default=0)
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--cache', metavar='PLIK', help='plik cache odpowiedzi HTTP (np. http_cache.sqlite)')
+    parser.add_argument('--resume', nargs='+', type=int, metavar='KAMPANIA',
+                        help='wznowienie przerwanych kampanii (zamiast planu)')
+    arguments = parser.parse_args()
+
+    my_logger = logging.getLogger('Campaign_runner')
+    logging.basicConfig(filename='{}.log'.format(sys.argv[0]), level=logging.DEBUG)
+
+    response_cache = ResponseCache(arguments.cache) if arguments.cache else None
+    runner_options = dict(provider=arguments.provider, workers=arguments.workers,
+                          parse_workers=arguments.parse_workers,
+                          processor_options=dict(incremental=arguments.incremental), cache=response_cache)
+    start_time = time.time()
+    if arguments.resume:
+        runner = CampaignRunner.from_campaigns(my_logger, arguments.resume, **runner_options)
+    else:
+        if arguments.plan:
+            my_plan = load_plan(arguments.plan)
+        else:
+            my_plan = make_plan(arguments.portals, arguments.categories, arguments.number_of_offers, arguments.shard)
+        runner = CampaignRunner(my_logger, my_plan, **runner_options)
+    print_report(runner.run(), time.time() - start_time)
+    if response_cache is not None:
+        response_cache.close()
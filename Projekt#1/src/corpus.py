@@ -0,0 +1,189 @@
+"""
+Spakowany korpus ofert - pojedynczy plik z treściami stron i tablicą przesunięć, przeznaczony do przenoszenia
+zapisanych ofert między maszynami oraz do szybkiego ponownego przetwarzania i benchmarków (plik odczytywany jest
+przez mmap, bez otwierania osobnego pliku dla każdej oferty).
+
+Układ pliku: nagłówek (znacznik, wersja, kompresja), kolejne treści stron, indeks (dla każdej strony: przesunięcie,
+długość, rozmiar po dekompresji, czas zapisu, nazwa), stopka (przesunięcie indeksu, liczba stron, znacznik).
+Eksport folderu: python corpus.py offers/otomoto [--output offers/otomoto.pack] [--codec zlib]
+"""
+import argparse
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+MAGIC = b'OFPK'
+VERSION = 1
+CODECS = ('none', 'zlib', 'zstd')
+PACK_SUFFIX = '.pack'
+
+_header = struct.Struct('<4sHH')
+_entry = struct.Struct('<QIIdH')
+_footer = struct.Struct('<QQ4s')
+
+
+def default_pack_path(folder):
+    """
+    :param folder: folder z ofertami
+    :return: domyślna ścieżka korpusu dla folderu (np. offers/otomoto.pack)
+    """
+    return os.path.normpath(folder) + PACK_SUFFIX
+
+
+def _compressor(codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ModuleNotFoundError('Kompresja zstd wymaga pakietu zstandard')
+        return zstandard.ZstdCompressor().compress
+    if codec == 'zlib':
+        return zlib.compress
+    return bytes
+
+
+def pack_corpus(path, pages, codec='none'):
+    """Zapis stron do spakowanego korpusu (przez plik tymczasowy, aby przerwany eksport nie uszkodził korpusu)
+
+    :param path: ścieżka do pliku korpusu
+    :param pages: iterowalny zbiór krotek (nazwa, bytes z treścią, czas zapisu)
+    :param codec: kompresja treści: 'none', 'zlib' lub 'zstd'
+    :return: liczba zapisanych stron
+    """
+    compress = _compressor(codec)
+    temp_path = path + '.tmp'
+    index = list()
+    with open(temp_path, 'wb') as file_out:
+        file_out.write(_header.pack(MAGIC, VERSION, CODECS.index(codec)))
+        for name, data, stored_at in pages:
+            compressed = compress(data)
+            index.append((file_out.tell(), len(compressed), len(data), stored_at, name.encode('utf-8')))
+            file_out.write(compressed)
+
+        index_offset = file_out.tell()
+        for offset, length, size, stored_at, name in index:
+            file_out.write(_entry.pack(offset, length, size, stored_at, len(name)))
+            file_out.write(name)
+        file_out.write(_footer.pack(index_offset, len(index), MAGIC))
+    os.replace(temp_path, path)
+    return len(index)
+
+
+class PackedCorpus:
+    """
+    Odczyt spakowanego korpusu: plik mapowany jest do pamięci, a indeks wczytywany jednokrotnie przy otwarciu
+    """
+    def __init__(self, path):
+        """Konstruktor otwierający korpus
+
+        :param path: ścieżka do pliku korpusu
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, codec = _header.unpack_from(self._map, 0)
+        index_offset, count, footer_magic = _footer.unpack_from(self._map, len(self._map) - _footer.size)
+        if magic != MAGIC or footer_magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('Plik %s nie jest spakowanym korpusem ofert' % path)
+        self.codec = CODECS[codec]
+        if self.codec == 'zstd' and zstandard is None:
+            self.close()
+            raise ModuleNotFoundError('Kompresja zstd wymaga pakietu zstandard')
+
+        self._index = dict()
+        position = index_offset
+        for _ in range(count):
+            offset, length, size, stored_at, name_length = _entry.unpack_from(self._map, position)
+            position += _entry.size
+            name = self._map[position:position + name_length].decode('utf-8')
+            position += name_length
+            self._index[name] = (offset, length, size, stored_at)
+        if hasattr(self._map, 'madvise'):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+
+    def get(self, name):
+        """Odczyt strony z korpusu
+
+        :param name: nazwa strony
+        :return: treść strony (bytes)
+        """
+        offset, length, size, _ = self._index[name]
+        if self.codec == 'none':
+            return self._map[offset:offset + length]
+        view = memoryview(self._map)[offset:offset + length]
+        try:
+            if self.codec == 'zstd':
+                return zstandard.ZstdDecompressor().decompress(view, max_output_size=size)
+            return zlib.decompress(view, bufsize=size)
+        finally:
+            view.release()
+
+    def names(self, since=None, until=None):
+        """Lista nazw stron w kolejności zapisu w korpusie
+
+        :param since: najwcześniejszy czas zapisu strony (timestamp) lub None
+        :param until: najpóźniejszy czas zapisu strony (timestamp, wyłącznie) lub None
+        :return: lista nazw
+        """
+        if since is None and until is None:
+            return list(self._index)
+        return [name for name, (_, _, _, stored_at) in self._index.items()
+                if (since is None or stored_at >= since) and (until is None or stored_at < until)]
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def export_offers(logger, fileloader, path=None, codec='none'):
+    """Eksport ofert fileloadera (z archiwum i osobnych plików, w kolejności download_number_of_links)
+    do spakowanego korpusu
+
+    :param logger: obiekt loggera
+    :param fileloader: obiekt fileloadera
+    :param path: ścieżka do pliku korpusu (None - ścieżka domyślna dla folderu ofert fileloadera)
+    :param codec: kompresja treści: 'none', 'zlib' lub 'zstd'
+    :return: liczba zapisanych stron
+    """
+    names = fileloader.download_number_of_links(None)
+
+    def pages():
+        for name, data, exc in fileloader.download_offers(names):
+            if exc is not None:
+                logger.warning('Pominięto %s/%s: %s' % (fileloader.offer_folder, name, exc))
+                continue
+            yield name, data, fileloader.offer_time(name) or time.time()
+
+    return pack_corpus(path or default_pack_path(fileloader.offer_folder), pages(), codec=codec)
+
+
+if __name__ == '__main__':
+    from fileloaders import PortalFileloader
+
+    parser = argparse.ArgumentParser(description='Eksport folderów z ofertami do spakowanych korpusów')
+    parser.add_argument('folders', nargs='+')
+    parser.add_argument('--output', help='ścieżka korpusu (tylko dla jednego folderu)')
+    parser.add_argument('--codec', choices=CODECS, default='none')
+    arguments = parser.parse_args()
+
+    my_logger = logging.getLogger('Corpus')
+    logging.basicConfig(level=logging.WARNING)
+    for source_folder in arguments.folders:
+        output = arguments.output if len(arguments.folders) == 1 else None
+        count = export_offers(my_logger, PortalFileloader(my_logger, offer_folder=source_folder, pack=False), output,
+                              arguments.codec)
+        print('%s: spakowano %s ofert do %s' % (source_folder, count, output or default_pack_path(source_folder)))
@@ -1,51 +1,376 @@
+import codecs
+import collections
+import itertools
 import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from html import unescape
+from html.parser import HTMLParser
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
 from bs4 import BeautifulSoup
 
+from archive import get_archive
+from http_cache import declared_charset
+from throttling import Throttle
+
+# zakres zapytania listingu AutoScout24: lata rejestracji i (opcjonalnie) przedział cenowy
+ListingShard = collections.namedtuple('ListingShard', ['from_year', 'to_year', 'price_from', 'price_to'])
+
+ASC_GUID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE)
+
+
+class LinkExtractor(HTMLParser):
+    """
+    Strumieniowy ekstraktor linków - przetwarza znaczniki w miarę tokenizacji, bez budowy drzewa dokumentu.
+    Korzysta z tego samego tokenizera co BeautifulSoup z 'html.parser', więc zwraca te same linki
+    (w tym pomija znaczniki w komentarzach i skryptach, a przy powtórzonym atrybucie href bierze ostatnią wartość).
+    """
+    def __init__(self, offer_link):
+        """Konstruktor ekstraktora
+
+        :param offer_link: wyróżnik (prefiks) linków, które należy wydobyć
+        """
+        super().__init__(convert_charrefs=True)
+        self.offer_link = offer_link
+        self.links = set()
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'a':
+            return
+        href = None
+        for name, value in attrs:
+            if name == 'href':
+                href = value or ''
+        if href is not None and href.startswith(self.offer_link):
+            self.links.add(href)
+
+    def extract(self, html):
+        """Wydobycie linków z przekazanego dokumentu
+
+        :param html: string zawierający html
+        :return: zbiór unikalnych linków
+        """
+        self.feed(html)
+        self.close()
+        return self.links
+
+
+TAG_ATTRIBUTE_PATTERN = re.compile(r'''([^\s"'=<>/]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?''')
+
+
+def find_tag_attribute(html, tag, attrs, attribute, encoding='utf-8'):
+    """Funkcja wydobywająca wartość atrybutu z pierwszego znacznika o podanej nazwie i wartościach atrybutów.
+    Przeszukuje tekst dokumentu wyrażeniem regularnym, bez tokenizacji całego dokumentu. Dla dokumentu w postaci
+    bajtów dekodowane są tylko znalezione znaczniki.
+
+    :param html: string lub bytes zawierający html
+    :param tag: nazwa znacznika
+    :param attrs: słownik atrybutów, które musi mieć znacznik
+    :param attribute: nazwa atrybutu, którego wartość należy zwrócić
+    :param encoding: kodowanie dokumentu przekazanego jako bytes
+    :return: wartość atrybutu lub None, jeśli nie znaleziono znacznika
+    """
+    pattern = r'<%s\b([^>]*)>' % tag
+    if isinstance(html, bytes):
+        pattern = pattern.encode('ascii')
+    for matched in re.finditer(pattern, html, re.IGNORECASE):
+        tag_text = matched.group(1)
+        if isinstance(tag_text, bytes):
+            tag_text = tag_text.decode(encoding, errors='replace')
+        if not all(value in tag_text for value in attrs.values()):
+            continue
+        values = dict()
+        for name, double_quoted, single_quoted, unquoted in TAG_ATTRIBUTE_PATTERN.findall(tag_text):
+            values[name.lower()] = unescape(double_quoted or single_quoted or unquoted)
+        if all(_attribute_matches(values.get(key), value, key) for key, value in attrs.items()) \
+                and attribute in values:
+            return values[attribute]
+    return None
+
+
+def _attribute_matches(actual, expected, name):
+    """Porównanie wartości atrybutu zgodne z BeautifulSoup - atrybut class pasuje również, gdy oczekiwana wartość
+    jest jedną z klas znacznika
+    """
+    if actual is None:
+        return False
+    if actual == expected:
+        return True
+    return name == 'class' and expected in actual.split()
+
+
+def create_http_session(pool_size, hosts=1):
+    """Funkcja tworząca sesję HTTP z pulą połączeń keep-alive.
+    Nagłówek Accept-Encoding obejmuje tylko te kompresje, które urllib3 potrafi rozpakować w tym środowisku
+    (gzip, deflate oraz br, jeśli zainstalowano pakiet brotli).
+
+    :param pool_size: maksymalna liczba utrzymywanych połączeń do jednego hosta
+    :param hosts: liczba hostów, dla których utrzymywane są osobne pule połączeń
+    :return: obiekt requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=hosts, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(make_headers(accept_encoding=True))
+    return session
+
+
+def imap_bounded(executor, function, iterable, window):
+    """Generator wykonujący funkcję dla kolejnych elementów w przekazanej puli (wątków lub procesów).
+    Wyniki zwracane są w kolejności elementów wejściowych, a w locie jest co najwyżej window zadań.
+
+    :param executor: pula wykonawcza (np. ThreadPoolExecutor)
+    :param function: funkcja jednoargumentowa
+    :param iterable: elementy do przetworzenia
+    :param window: maksymalna liczba zadań przekazanych do puli, a jeszcze nie odebranych
+    :return: generator wyników
+    """
+    pending = collections.deque()
+    try:
+        for item in iterable:
+            if len(pending) >= window:
+                yield pending.popleft().result()
+            pending.append(executor.submit(function, item))
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
 
 class PortalDownloader:
     """Klasa bazowa dla downloaderów
     """
-    def __init__(self, logger, offer_folder='offers', listing_folder='listings'):
-        """Konstruktor dla klasy bazowej - zakłada foldery
+    # domyślna liczba równoległych żądań do portalu, klasy pochodne ustawiają własne wartości
+    max_concurrency = 4
+    # limity czasu (połączenie, odczyt) w sekundach dla pojedynczego żądania
+    timeout = (5, 30)
+    # liczba hostów portalu, do których wysyłane są żądania (strony listingów i ofert są pod adresem base_url)
+    hosts = 1
+    # czas (w sekundach), przez który odpowiedź z cache uznawana jest za aktualną bez rewalidacji - listingi zmieniają
+    # się z każdą nową ofertą, treść opublikowanej oferty znacznie rzadziej
+    listing_cache_ttl = 300
+    offer_cache_ttl = 12 * 3600
+    # początkowe tempo żądań do portalu (na sekundę), dostosowywane na podstawie odpowiedzi 429/503
+    requests_per_second = 5.0
+    # kodowanie stron portalu - stosowane, gdy odpowiedź nie deklaruje innego
+    encoding = 'utf-8'
+    # czy listingi sortowane są od najnowszych ofert (pozwala przerwać stronicowanie na znanych ofertach)
+    sorted_by_newest = False
+
+    def __init__(self, logger, offer_folder='offers', listing_folder='listings', max_concurrency=None,
+                 http_session=None, pool_size=None, timeout=None, cache=None, listing_cache_ttl=None,
+                 offer_cache_ttl=None, throttle=None, requests_per_second=None, archive=None, request_slots=None):
+        """Konstruktor dla klasy bazowej - zakłada foldery (tylko przy zapisie stron w osobnych plikach)
 
         :param logger: obiekt loggera
         :param offer_folder: folder w którym zapisywane będą (opcjonalnie) oferty
         :param listing_folder:  folder w którym zapisywane będą (opcjonalnie) listingi
+        :param max_concurrency: liczba równoległych żądań do portalu (None - wartość domyślna dla portalu)
+        :param http_session: sesja HTTP (np. na potrzeby testów); None - sesja tworzona przez downloader
+        :param pool_size: rozmiar puli połączeń keep-alive do hosta (None - równy max_concurrency)
+        :param timeout: limit czasu żądania: liczba lub krotka (połączenie, odczyt); None - wartość domyślna
+        :param cache: obiekt http_cache.ResponseCache (może być współdzielony między downloaderami); None - bez cache
+        :param listing_cache_ttl: czas świeżości listingów w cache w sekundach (None - wartość domyślna dla portalu)
+        :param offer_cache_ttl: czas świeżości ofert w cache w sekundach (None - wartość domyślna dla portalu)
+        :param throttle: obiekt throttling.Throttle (ograniczanie tempa, ponowienia, bezpieczniki);
+            None - polityka domyślna dla portalu
+        :param requests_per_second: początkowe tempo żądań dla polityki domyślnej (None - wartość dla portalu)
+        :param archive: obiekt archive.PageArchive, w którym zapisywane są strony; None - archiwum domyślne
+            (otwierane przy pierwszym zapisie strony), False - zapis każdej strony w osobnym pliku
+        :param request_slots: semafor współdzielony przez downloadery różnych portali - globalny limit równoległych
+            żądań (wolny portal nie blokuje niewykorzystanych miejsc); None - tylko limit max_concurrency portalu
         """
         self.logger = logger
         self.offer_folder = offer_folder
         self.listing_folder = listing_folder
         self.offer_link_prefix = None
-
-        if not os.path.isdir(self.offer_folder):
-            os.makedirs(self.offer_folder)
-        if not os.path.isdir(self.listing_folder):
-            os.makedirs(self.listing_folder)
+        # (znacznik, atrybuty, atrybut z identyfikatorem) - opis miejsca identyfikatora oferty w html
+        self.offer_id_tag = None
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        if timeout is not None:
+            self.timeout = timeout
+        if listing_cache_ttl is not None:
+            self.listing_cache_ttl = listing_cache_ttl
+        if offer_cache_ttl is not None:
+            self.offer_cache_ttl = offer_cache_ttl
+        self.cache = cache
+        if requests_per_second is not None:
+            self.requests_per_second = requests_per_second
+        if throttle is None:
+            throttle = Throttle(logger, rate=self.requests_per_second)
+        self.throttle = throttle
+        self.archive = archive
+        self.request_slots = request_slots
+
+        if http_session is None:
+            http_session = create_http_session(pool_size or self.max_concurrency, self.hosts)
+        self.http_session = http_session
+
+        if self.archive is False:
+            if not os.path.isdir(self.offer_folder):
+                os.makedirs(self.offer_folder)
+            if not os.path.isdir(self.listing_folder):
+                os.makedirs(self.listing_folder)
 
     def save_file(self, folder_name, file_name, data):
-        """Metoda na potrzeby zapisu plików (oferty i listingi)
+        """Metoda na potrzeby zapisu plików (oferty i listingi). Jeśli downloader korzysta z archiwum, strona
+        zapisywana jest w archiwum (folder i nazwa pliku służą jako klucz), w przeciwnym razie jako osobny plik.
 
         :param folder_name: nazwa folderu
         :param file_name: nazwa pliku
-        :param data: dane tekstowe
+        :param data: dane (bytes zapisywane bez zmian lub string zapisywany w UTF-8)
         :return: metoda nie zwraca danych
         """
+        if self.archive is None:
+            # archiwum domyślne otwierane jest dopiero przy pierwszym zapisie (bez zapisu nie powstają jego pliki)
+            self.archive = get_archive()
+        if self.archive:
+            self.logger.info('Zapis strony %s/%s w archiwum' % (folder_name, file_name))
+            self.archive.put(folder_name, file_name, data)
+            return
+
         full_file_name = os.path.join(folder_name, file_name)
         self.logger.info('Zapis pliku %s' % full_file_name)
+        if isinstance(data, bytes):
+            with open(full_file_name, 'wb') as file_out:
+                file_out.write(data)
+            return
         with open(full_file_name, 'w', encoding='UTF-8') as file_out:
             file_out.write(data)
 
+    def http_get(self, url, cache_ttl=None):
+        """Metoda wykonująca żądanie GET z użyciem współdzielonej sesji (połączenia są utrzymywane i ponownie
+        wykorzystywane między kolejnymi listingami i ofertami). Jeśli skonfigurowano cache, świeże odpowiedzi
+        zwracane są z dysku, a starsze rewalidowane żądaniem warunkowym. Żądania sieciowe przechodzą przez politykę
+        throttle (tempo, ponowienia błędów przejściowych, bezpiecznik hosta). Przy współdzielonym limicie żądań
+        (request_slots) miejsce zajmowane jest tylko na czas wysłania żądania - nie w trakcie oczekiwania na ponowienie.
+
+        :param url: adres żądanego zasobu
+        :param cache_ttl: czas świeżości odpowiedzi w cache w sekundach (None - czas dla ofert, offer_cache_ttl)
+        :return: obiekt odpowiedzi
+        """
+        def send(headers):
+            if self.request_slots is None:
+                return self.http_session.get(url, headers=headers, timeout=self.timeout)
+            with self.request_slots:
+                return self.http_session.get(url, headers=headers, timeout=self.timeout)
+
+        def fetch(headers):
+            self.logger.info('Żądanie GET %s' % url)
+            return self.throttle.request(url, lambda: send(headers))
+
+        if self.cache is None:
+            return fetch(dict())
+        return self.cache.get_response(url, cache_ttl if cache_ttl is not None else self.offer_cache_ttl, fetch)
+
+    def response_bytes(self, response):
+        """Metoda zwracająca treść odpowiedzi w postaci bajtów w kodowaniu portalu (encoding). Treść nie jest
+        dekodowana ani nie jest zgadywane jej kodowanie - jedynie strona jawnie zadeklarowana w innym kodowaniu
+        jest przekodowywana. Deklaracja kodowania nieznanego Pythonowi jest pomijana.
+
+        :param response: obiekt odpowiedzi
+        :return: bytes
+        """
+        declared = declared_charset(response.headers.get('Content-Type'))
+        if declared is None:
+            return response.content
+        try:
+            declared_name = codecs.lookup(declared).name
+        except LookupError:
+            self.logger.warning('Nieznane kodowanie %s odpowiedzi %s, treść pozostawiona bez zmian'
+                                % (declared, response.url))
+            return response.content
+        if declared_name == codecs.lookup(self.encoding).name:
+            return response.content
+        self.logger.info('Przekodowanie odpowiedzi z %s do %s' % (declared, self.encoding))
+        return response.content.decode(declared, errors='replace').encode(self.encoding)
+
+    def get_connection_stats(self):
+        """Metoda zwracająca statystyki wykorzystania połączeń dla poszczególnych hostów.
+        Liczba połączeń mniejsza od liczby żądań oznacza, że połączenia (i handshake TCP+TLS) były wykorzystywane
+        ponownie.
+
+        :return: słownik host -> {'requests': liczba żądań, 'connections': liczba nawiązanych połączeń}
+        """
+        stats = dict()
+        for adapter in set(self.http_session.adapters.values()):
+            pools = getattr(getattr(adapter, 'poolmanager', None), 'pools', None)
+            if pools is None:
+                continue
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host_stats = stats.setdefault(pool.host, {'requests': 0, 'connections': 0})
+                host_stats['requests'] += pool.num_requests
+                host_stats['connections'] += pool.num_connections
+        return stats
+
     @staticmethod
     def download_offer(offer_url, save):
         """Metoda statyczna na potrzeby ściągania oferty, zostanie przykryta dostarczoną implementacją
 
         :param offer_url: link do oferty
         :param save: flaga: czy zapisywać dane
-        :return: string zawierający żądaną ofertę
+        :return: bytes zawierające żądaną ofertę (w kodowaniu encoding)
         """
         raise NotImplemented
 
+    def _download_offer_safe(self, offer_url, save):
+        """Opakowanie metody download_offer przechwytujące wyjątki, tak aby błąd jednej oferty nie przerywał paczki
+
+        :param offer_url: link do oferty
+        :param save: flaga: czy zapisywać dane
+        :return: krotka (link, bytes z ofertą lub None, wyjątek lub None)
+        """
+        try:
+            return offer_url, self.download_offer(offer_url, save=save), None
+        except Exception as exc:
+            return offer_url, None, exc
+
+    def download_offers(self, list_of_links, save=False):
+        """Metoda ściągająca oferty współbieżnie - w locie utrzymywanych jest max_concurrency żądań.
+        Wyniki zwracane są w kolejności linków wejściowych.
+
+        :param list_of_links: lista linków do ofert
+        :param save: flaga: czy zapisywać dane
+        :return: generator krotek (link, bytes z ofertą lub None, wyjątek lub None)
+        """
+        if self.max_concurrency <= 1:
+            for link in list_of_links:
+                yield self._download_offer_safe(link, save)
+            return
+
+        def task(link):
+            return self._download_offer_safe(link, save)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            yield from imap_bounded(executor, task, list_of_links, window=self.max_concurrency * 2)
+
+    def extract_offer_id(self, html):
+        """Metoda wydobywająca identyfikator oferty na potrzeby nazwy zapisywanego pliku. Znacznik opisany przez
+        offer_id_tag wyszukiwany jest bezpośrednio w tekście, bez budowy drzewa dokumentu - pełne parsowanie oferty
+        odbywa się jednokrotnie, w parserze. BeautifulSoup używany jest tylko, gdy szybkie wyszukiwanie zawiedzie.
+
+        :param html: bytes (w kodowaniu encoding) lub string zawierający html oferty
+        :return: identyfikator oferty
+        """
+        tag, attrs, attribute = self.offer_id_tag
+        offer_id = find_tag_attribute(html, tag, attrs, attribute, self.encoding)
+        if offer_id is None:
+            self.logger.info('Identyfikator oferty wydobyty z użyciem BeautifulSoup')
+            from_encoding = self.encoding if isinstance(html, bytes) else None
+            soup = BeautifulSoup(html, 'html.parser', from_encoding=from_encoding)
+            offer_id = soup.find(tag, attrs=attrs)[attribute]
+        return offer_id
+
     @staticmethod
     def download_listing_page(category, page, save):
         """
@@ -68,13 +393,23 @@ class PortalDownloader:
         raise NotImplemented
 
     def get_links_from_listing(self, html, offer_link):
-        """Metoda wydobywająca linki z stringa reprezentującego html
+        """Metoda wydobywająca linki z stringa reprezentującego html (strumieniowo, bez budowy drzewa dokumentu)
 
         :param html: string zawierający html
         :param offer_link: wyróżnik linków, które należy wydobyć
-        :return: lista unikalnych linków
+        :return: zbiór unikalnych linków
         """
         self.logger.info('Wyszukiwanie linków')
+        return LinkExtractor(offer_link).extract(html)
+
+    def get_links_from_listing_soup(self, html, offer_link):
+        """Metoda wydobywająca linki z stringa reprezentującego html z użyciem pełnego drzewa BeautifulSoup.
+        Pozostawiona jako implementacja referencyjna dla get_links_from_listing (weryfikacja zgodności, benchmark).
+
+        :param html: string zawierający html
+        :param offer_link: wyróżnik linków, które należy wydobyć
+        :return: zbiór unikalnych linków
+        """
         soup = BeautifulSoup(html, 'html.parser')
         filtered = soup.findAll('a')
         links_in_filtered = list()
@@ -86,51 +421,136 @@ class PortalDownloader:
 
         return set(links_in_filtered)
 
-    def download_number_of_links(self, category, number_of_offers=-1, save=False):
-        """Metoda wydobywającą określoną liczbę linków dla wskazanej kategorii.
+    @staticmethod
+    def offer_key(offer_url):
+        """Metoda zwracająca klucz oferty na potrzeby indeksu znanych ofert - domyślnie link bez parametrów
+
+        :param offer_url: link do oferty
+        :return: klucz oferty
+        """
+        return offer_url.split('#')[0].split('?')[0]
+
+    def skip_known_links(self, link_sets, known_offers, known_ratio=0.8):
+        """Generator usuwający z kolejnych listingów linki do ofert znanych z poprzednich kampanii.
+        Dla portali sortujących listingi od najnowszych ofert stronicowanie jest przerywane po pierwszej stronie,
+        na której udział znanych ofert osiągnął próg known_ratio.
+
+        :param link_sets: iterowalny zbiór kolekcji linków (po jednej dla każdego listingu)
+        :param known_offers: indeks znanych ofert (known_offers.KnownOffersIndex)
+        :param known_ratio: próg udziału znanych ofert na stronie, po którym stronicowanie jest przerywane
+        :return: generator list nowych linków
+        """
+        for links_from_listing in link_sets:
+            links_from_listing = list(links_from_listing)
+            new_links = [link for link in links_from_listing if self.offer_key(link) not in known_offers]
+            yield new_links
+
+            known = len(links_from_listing) - len(new_links)
+            if self.sorted_by_newest and links_from_listing and known / len(links_from_listing) >= known_ratio:
+                self.logger.info('Strona zawiera %s znanych ofert na %s - koniec stronicowania' %
+                                 (known, len(links_from_listing)))
+                return
+
+    def unique_links(self, link_sets, number_of_offers=-1):
+        """Generator zwracający linki z kolejnych listingów z pominięciem powtórzeń, kończy pracę po osiągnięciu
+        żądanej liczby linków. Powtórzenia wykrywane są po kluczach ofert (offer_key) - krótszych od linków, więc
+        pamięć zajmowana przez zbiór zwróconych ofert jest mniejsza przy kampaniach obejmujących całe kategorie.
+
+        :param link_sets: iterowalny zbiór kolekcji linków (po jednej dla każdego listingu)
+        :param number_of_offers: liczba ofert (-1 - bez ograniczenia)
+        :return: generator unikalnych linków
+        """
+        seen = set()
+        for links_from_listing in link_sets:
+            for link in links_from_listing:
+                key = self.offer_key(link)
+                if key in seen:
+                    continue
+                seen.add(key)
+                yield link
+                if len(seen) == number_of_offers:
+                    return
+
+    def stream_listing_links(self, download_listing_links, pages, first_links, number_of_offers=-1,
+                             known_offers=None):
+        """Generator pobierający równolegle kolejne listingi i zwracający unikalne linki w kolejności stron,
+        zanim zakończy się pobieranie wszystkich listingów
+
+        :param download_listing_links: funkcja zwracająca zbiór linków dla numeru strony
+        :param pages: numery stron do pobrania
+        :param first_links: zbiór linków z pierwszej (już pobranej) strony lub None
+        :param number_of_offers: liczba ofert (-1 - bez ograniczenia)
+        :param known_offers: indeks znanych ofert - linki do nich są pomijane (None - bez filtrowania)
+        :return: generator unikalnych linków
+        """
+        if number_of_offers == 0:
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            listings = imap_bounded(executor, download_listing_links, pages, window=self.max_concurrency)
+            if first_links is not None:
+                link_sets = itertools.chain([first_links], listings)
+            else:
+                link_sets = listings
+            if known_offers is not None:
+                link_sets = self.skip_known_links(link_sets, known_offers)
+            try:
+                yield from self.unique_links(link_sets, number_of_offers)
+            finally:
+                # anulowanie listingów, które nie zostały jeszcze pobrane
+                listings.close()
+
+    def iter_links(self, category, number_of_offers=-1, save=False, known_offers=None):
+        """Generator wydobywający określoną liczbę linków dla wskazanej kategorii. Pierwsza strona listingu pobierana
+        jest jednokrotnie, pozostałe strony są pobierane równolegle, a linki zwracane na bieżąco - ściąganie ofert
+        może się rozpocząć przed zakończeniem stronicowania.
 
         :param category: kategoria ofert
-        :param number_of_offers: liczba ofert
+        :param number_of_offers: liczba ofert (-1 - wszystkie dostępne)
         :param save: flaga: czy zapisywać listingi
-        :return: lista linków z wybranej kategorii. Liczba zwróconych linków <= żądana liczba linków
+        :param known_offers: indeks znanych ofert - linki do nich są pomijane (None - bez filtrowania)
+        :return: generator unikalnych linków z wybranej kategorii
         """
         self.logger.info('Pozyskiwanie linków')
         first_listing = self.download_listing_page(category, page=1, save=save)
         number_of_listings = self.get_number_of_listings(first_listing)
-        temp_listing_number = 1
-        all_links = list()
+        first_links = self.get_links_from_listing(first_listing, self.offer_link_prefix)
 
-        while temp_listing_number <= number_of_listings:
-            listing_page = self.download_listing_page(category, temp_listing_number, save)
-            links_from_listing = self.get_links_from_listing(listing_page, self.offer_link_prefix)
-            all_links.extend(links_from_listing)
+        def download_listing_links(page):
+            listing_page = self.download_listing_page(category, page, save)
+            return self.get_links_from_listing(listing_page, self.offer_link_prefix)
 
-            temp_listing_number += 1
-            if number_of_offers == -1:
-                continue
-            else:
-                if len(all_links) >= number_of_offers:
-                    break
+        yield from self.stream_listing_links(download_listing_links, range(2, number_of_listings + 1), first_links,
+                                             number_of_offers, known_offers)
 
-        if number_of_offers != -1:
-            all_links = all_links[:number_of_offers]
+    def download_number_of_links(self, category, number_of_offers=-1, save=False):
+        """Metoda wydobywającą określoną liczbę linków dla wskazanej kategorii.
 
-        return all_links
+        :param category: kategoria ofert
+        :param number_of_offers: liczba ofert
+        :param save: flaga: czy zapisywać listingi
+        :return: lista linków z wybranej kategorii. Liczba zwróconych linków <= żądana liczba linków
+        """
+        return list(self.iter_links(category, number_of_offers=number_of_offers, save=save))
 
 
 class OtomotoDownloader(PortalDownloader):
     """
     Implementacja dla portalu Otomoto
     """
-    def __init__(self, logger):
+    max_concurrency = 8
+
+    def __init__(self, logger, **kwargs):
         """
         Konstruktor inicjalizujący wartości domyślne dla klasy Otomoto
 
         :param logger: obiekt współdzielonego loggera
+        :param kwargs: dodatkowe opcje przekazywane do klasy bazowej (np. max_concurrency, cache, archive)
         """
-        super().__init__(logger=logger, offer_folder='offers/otomoto')
+        super().__init__(logger=logger, offer_folder='offers/otomoto', **kwargs)
         self.base_url = 'https://www.otomoto.pl/'
         self.listing_url1 = self.base_url + 'osobowe/{}/'
+        self.offer_id_tag = ('span', {"class": "om-button blue spoiler seller-phones__button"}, 'data-id_raw')
         self.listing_url2 = self.base_url + 'osobowe/{}/?page={}'
         self.offer_link_prefix = self.base_url + 'oferta/'
 
@@ -152,15 +572,12 @@ class OtomotoDownloader(PortalDownloader):
 
         :param offer_url: link do oferty
         :param save: flaga: czy zapisywać dane
-        :return: string zawierający żądaną ofertę
+        :return: bytes zawierające żądaną ofertę (w kodowaniu encoding)
         """
-        data = requests.get(offer_url)
-        data = data.text
+        data = self.response_bytes(self.http_get(offer_url))
 
         if save:
-            soup = BeautifulSoup(data, 'html.parser')
-            filtered = soup.find('span', attrs={"class": "om-button blue spoiler seller-phones__button"})
-            offer_id = filtered['data-id_raw']
+            offer_id = self.extract_offer_id(data)
             file_name = 'offer_{}.html'.format(offer_id)
             self.save_file(self.offer_folder, file_name, data)
         return data
@@ -178,27 +595,33 @@ class OtomotoDownloader(PortalDownloader):
         else:
             url = self.listing_url2.format(category, page)
 
-        data = requests.get(url)
-        data = data.text
+        data = self.response_bytes(self.http_get(url, self.listing_cache_ttl))
 
         if save:
             file_name = 'listing_{}_{}.html'.format(category.replace('/', '_'), page)
             self.save_file(self.listing_folder, file_name, data)
 
-        return data
+        return data.decode(self.encoding, errors='replace')
 
 
 class AllegroDownloader(PortalDownloader):
     """
     Implementacja dla portalu Allegro
     """
-    def __init__(self, logger):
+    max_concurrency = 4
+    # listingi pobierane są z parametrem order=m (od najnowszych)
+    sorted_by_newest = True
+    # cena i stan ofert (licytacje, liczba sztuk) zmieniają się często
+    offer_cache_ttl = 3600
+
+    def __init__(self, logger, **kwargs):
         """
         Konstruktor inicjalizujący wartości domyślne dla klasy Allegro
 
         :param logger: obiekt współdzielonego loggera
+        :param kwargs: dodatkowe opcje przekazywane do klasy bazowej (np. max_concurrency, cache, archive)
         """
-        super().__init__(logger=logger, offer_folder='offers/allegro')
+        super().__init__(logger=logger, offer_folder='offers/allegro', **kwargs)
         self.base_url = 'https://allegro.pl/'
         self.listing_url = self.base_url + 'kategoria/{}?order=m&p={}'
         self.offer_link_prefix = self.base_url + 'ogloszenie'
@@ -214,15 +637,23 @@ class AllegroDownloader(PortalDownloader):
         filtered = soup.find(attrs={"class": "m-pagination__text"})
         return int(filtered.get_text())
 
+    @staticmethod
+    def offer_key(offer_url):
+        """Implementacja metody dla klasy Allegro - identyfikator oferty jest ostatnim członem linku
+
+        :param offer_url: link do oferty
+        :return: identyfikator oferty
+        """
+        return offer_url.split('?')[0].split('-')[-1]
+
     def download_offer(self, offer_url, save=False):
         """Implementacja metody dla klasy Allegro
 
         :param offer_url: link do oferty
         :param save: flaga: czy zapisywać dane
-        :return: string zawierający żądaną ofertę
+        :return: bytes zawierające żądaną ofertę (w kodowaniu encoding)
         """
-        data = requests.get(offer_url)
-        data = data.text
+        data = self.response_bytes(self.http_get(offer_url))
 
         if save:
             offer_id = offer_url.split('-')[-1]
@@ -239,14 +670,13 @@ class AllegroDownloader(PortalDownloader):
         :return: string zawierający żądany listing
         """
         url = self.listing_url.format(category, page)
-        data = requests.get(url)
-        data = data.text
+        data = self.response_bytes(self.http_get(url, self.listing_cache_ttl))
 
         if save:
             file_name = 'listing_{}_{}.html'.format(category, page)
             self.save_file(self.listing_folder, file_name, data)
 
-        return data
+        return data.decode(self.encoding, errors='replace')
 
 
 class OlxDownloader(PortalDownloader):
@@ -254,15 +684,19 @@ class OlxDownloader(PortalDownloader):
     Implementacja dla portalu Olx
     """
 
-    def __init__(self, logger):
+    max_concurrency = 6
+
+    def __init__(self, logger, **kwargs):
         """
         Konstruktor inicjalizujący wartości domyślne dla klasy Olx
 
         :param logger: obiekt współdzielonego loggera
+        :param kwargs: dodatkowe opcje przekazywane do klasy bazowej (np. max_concurrency, cache, archive)
         """
-        super().__init__(logger=logger, offer_folder='offers/olx')
+        super().__init__(logger=logger, offer_folder='offers/olx', **kwargs)
         self.base_url = 'https://www.olx.pl/'
         self.listing_url1 = self.base_url + 'motoryzacja/samochody/{}/'
+        self.offer_id_tag = ('div', {"class": "clm-samurai"}, 'data-item')
         self.listing_url2 = self.base_url + 'motoryzacja/samochody/{}/?page={}'
         self.offer_link_prefix = self.base_url + 'oferta/'
 
@@ -285,15 +719,12 @@ class OlxDownloader(PortalDownloader):
 
         :param offer_url: link do oferty
         :param save: flaga: czy zapisywać dane
-        :return: string zawierający żądaną ofertę
+        :return: bytes zawierające żądaną ofertę (w kodowaniu encoding)
         """
-        data = requests.get(offer_url)
-        data = data.text
+        data = self.response_bytes(self.http_get(offer_url))
 
         if save:
-            soup = BeautifulSoup(data, 'html.parser')
-            filtered = soup.find('div', attrs={"class": "clm-samurai"})
-            offer_id = filtered['data-item']
+            offer_id = self.extract_offer_id(data)
             file_name = 'offer_{}.html'.format(offer_id)
             self.save_file(self.offer_folder, file_name, data)
         return data
@@ -311,14 +742,13 @@ class OlxDownloader(PortalDownloader):
         else:
             url = self.listing_url2.format(category, page)
 
-        data = requests.get(url)
-        data = data.text
+        data = self.response_bytes(self.http_get(url, self.listing_cache_ttl))
 
         if save:
             file_name = 'listing_{}_{}.html'.format(category.replace('/', '_'), page)
             self.save_file(self.listing_folder, file_name, data)
 
-        return data
+        return data.decode(self.encoding, errors='replace')
 
 
 class AutoScout24Downloader(PortalDownloader):
@@ -326,38 +756,64 @@ class AutoScout24Downloader(PortalDownloader):
     Implementacja dla portalu AutoScout24. Ta implementacja nieznacząco różni się od pozostałych implementacji:
     # .brak metody get_number_of_listings(html)
     #. własna implementacja download_listing_page o nazwie asc_download_listing_page
+    #. tryb dzielenia zapytania na zakresy (shardy), ponieważ portal zwraca co najwyżej max_listing_pages stron
     """
 
-    def __init__(self, logger):
+    max_concurrency = 4
+    # maksymalna liczba stron wyników zwracanych przez portal dla jednego zapytania
+    max_listing_pages = 20
+    # zapytania dzielone na roczniki i przedziały cenowe - wyniki pojedynczego zapytania zmieniają się wolniej
+    listing_cache_ttl = 900
+    offer_cache_ttl = 24 * 3600
+    # górna granica cen używana przy dzieleniu zakresu jednego rocznika na przedziały cenowe
+    max_price = 500000
+    # najwęższy przedział cenowy, który może zostać jeszcze podzielony
+    min_price_step = 500
+
+    def __init__(self, logger, **kwargs):
         """
         Konstruktor inicjalizujący wartości domyślne dla klasy AutoScout24
 
         :param logger: obiekt współdzielonego loggera
+        :param kwargs: dodatkowe opcje przekazywane do klasy bazowej (np. max_concurrency, cache, archive)
         """
-        super().__init__(logger=logger, offer_folder='offers/autoscout24')
+        super().__init__(logger=logger, offer_folder='offers/autoscout24', **kwargs)
         self.base_url = 'https://www.autoscout24.pl/'
         self.listing_url1 = self.base_url + 'lst/{}?fregfrom={}&fregto={}&page={}'
+        self.price_url_suffix = '&pricefrom={}&priceto={}'
+        self.offer_id_tag = ('input', {"name": "classifiedGuid"}, 'value')
         self.offer_link_prefix = '/oferta/'
 
+    @staticmethod
+    def offer_key(offer_url):
+        """Implementacja metody dla klasy AutoScout24 - link kończy się identyfikatorem GUID oferty
+
+        :param offer_url: link do oferty
+        :return: identyfikator oferty (lub link, jeśli nie zawiera identyfikatora)
+        """
+        offer_url = offer_url.split('?')[0]
+        matched = ASC_GUID_PATTERN.search(offer_url)
+        if matched is None:
+            return offer_url
+        return matched.group(0)
+
     def download_offer(self, offer_url, save=False):
         """Implementacja metody dla klasy AutoScout24
 
         :param offer_url: link do oferty
         :param save: flaga: czy zapisywać dane
-        :return: string zawierający żądaną ofertę
+        :return: bytes zawierające żądaną ofertę (w kodowaniu encoding)
         """
-        data = requests.get(self.base_url + offer_url)
-        data = data.text
+        data = self.response_bytes(self.http_get(self.base_url + offer_url))
 
         if save:
-            soup = BeautifulSoup(data, 'html.parser')
-            filtered = soup.find('input', attrs={"name": "classifiedGuid"})
-            offer_id = filtered['value']
+            offer_id = self.extract_offer_id(data)
             file_name = 'offer_{}.html'.format(offer_id)
             self.save_file(self.offer_folder, file_name, data)
         return data
 
-    def asc_download_listing_page(self, category, page, from_year, to_year, save=False):
+    def asc_download_listing_page(self, category, page, from_year, to_year, save=False, price_from=None,
+                                  price_to=None):
         """Implementacja metody dla klasy AutoScout24
 
         :param category: kategoria z której ściągane są sane
@@ -365,49 +821,166 @@ class AutoScout24Downloader(PortalDownloader):
         :param from_year: rok początkowy dla zapytania
         :param to_year: rok końcowy dla zapytania
         :param save: flaga: czy zapisywać dane
+        :param price_from: cena minimalna dla zapytania (None - bez ograniczenia)
+        :param price_to: cena maksymalna dla zapytania (None - bez ograniczenia)
         :return: string zawierający żądany listing
         """
         url = self.listing_url1.format(category, from_year, to_year, page)
+        query = '{}-{}'.format(from_year, to_year)
+        if price_from is not None or price_to is not None:
+            url += self.price_url_suffix.format(price_from or '', price_to or '')
+            query += '_{}-{}'.format(price_from or '', price_to or '')
 
-        data = requests.get(url)
-        data = data.text
+        data = self.response_bytes(self.http_get(url, self.listing_cache_ttl))
 
         if save:
-            file_name = 'listing_{}_{}.html'.format(category.replace('/', '_'), page)
+            file_name = 'listing_{}_{}_{}.html'.format(category.replace('/', '_'), query, page)
             self.save_file(self.listing_folder, file_name, data)
 
-        return data
+        return data.decode(self.encoding, errors='replace')
 
-    def download_number_of_links(self, category, number_of_offers=-1, from_year=2000, to_year=2001, save=False):
-        """Metoda wydobywającą określoną liczbę linków dla wskazanej kategorii.
+    def crawl_shard(self, category, shard, save=False):
+        """Pobranie kolejnych stron listingu dla jednego zakresu zapytania, aż do pierwszej strony bez nowych linków
+        lub do limitu stron portalu
+
+        :param category: kategoria ofert
+        :param shard: zakres zapytania (ListingShard)
+        :param save: flaga: czy zapisywać listingi
+        :return: krotka (lista linków, flaga: czy zakres osiągnął limit wyników portalu)
+        """
+        links = list()
+        seen = set()
+        for page in range(1, self.max_listing_pages + 1):
+            listing_page = self.asc_download_listing_page(category, page, from_year=shard.from_year,
+                                                          to_year=shard.to_year, save=save,
+                                                          price_from=shard.price_from, price_to=shard.price_to)
+            new_links = [link for link in self.get_links_from_listing(listing_page, self.offer_link_prefix)
+                         if link not in seen]
+            if not new_links:
+                return links, False
+            seen.update(new_links)
+            links.extend(new_links)
+        return links, True
+
+    def split_shard(self, shard):
+        """Podział zakresu zapytania na dwa węższe: najpierw według lat, dla jednego rocznika według ceny
+
+        :param shard: zakres zapytania (ListingShard)
+        :return: lista węższych zakresów (pusta, jeśli zakresu nie można już podzielić)
+        """
+        if shard.from_year < shard.to_year:
+            middle = (shard.from_year + shard.to_year) // 2
+            return [shard._replace(to_year=middle), shard._replace(from_year=middle + 1)]
+
+        price_from = shard.price_from or 0
+        price_to = shard.price_to
+        if price_to is None:
+            price_to = self.max_price
+            # oferty droższe od max_price trafiają do osobnego, otwartego z góry zakresu
+            if price_from < price_to:
+                return [shard._replace(price_from=price_from, price_to=price_to),
+                        shard._replace(price_from=price_to + 1, price_to=None)]
+        if price_to - price_from < self.min_price_step:
+            return list()
+        middle = (price_from + price_to) // 2
+        return [shard._replace(price_from=price_from, price_to=middle),
+                shard._replace(price_from=middle + 1, price_to=price_to)]
+
+    def iter_sharded_links(self, category, number_of_offers=-1, from_year=2000, to_year=2001, save=False,
+                           known_offers=None):
+        """Generator wydobywający linki dla zakresu lat podzielonego na roczniki pobierane równolegle.
+        Rocznik, który osiągnął limit wyników portalu, jest dzielony dalej (według ceny), dzięki czemu żadne oferty
+        nie są pomijane. Linki zwracane są bez powtórzeń, w kolejności kończenia się zakresów.
 
         :param category: kategoria ofert
         :param number_of_offers: liczba ofert
         :param from_year: rok początkowy dla zapytania
         :param to_year: rok końcowy dla zapytania
         :param save: flaga: czy zapisywać listingi
-        :return: lista linków z wybranej kategorii. Liczba zwróconych linków <= żądana liczba linków
+        :param known_offers: indeks znanych ofert - linki do nich są pomijane (None - bez filtrowania)
+        :return: generator unikalnych linków z wybranej kategorii
         """
+        if number_of_offers == 0:
+            return
+
+        seen = set()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            shards = dict()
+            for year in range(from_year, to_year + 1):
+                shard = ListingShard(year, year, None, None)
+                shards[executor.submit(self.crawl_shard, category, shard, save)] = shard
+            pending = set(shards)
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        links, capped = future.result()
+                        shard = shards.pop(future)
+                        if capped:
+                            sub_shards = self.split_shard(shard)
+                            if sub_shards:
+                                self.logger.info('Zakres %s osiągnął limit wyników, podział na %s' %
+                                                 (shard, sub_shards))
+                            else:
+                                self.logger.warning('Zakres %s osiągnął limit wyników i nie może zostać podzielony'
+                                                    % (shard,))
+                            for sub_shard in sub_shards:
+                                sub_future = executor.submit(self.crawl_shard, category, sub_shard, save)
+                                shards[sub_future] = sub_shard
+                                pending.add(sub_future)
+
+                        for link in links:
+                            key = self.offer_key(link)
+                            if key in seen or (known_offers is not None and key in known_offers):
+                                continue
+                            seen.add(key)
+                            yield link
+                            if len(seen) == number_of_offers:
+                                return
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def iter_links(self, category, number_of_offers=-1, from_year=2000, to_year=2001, save=False, known_offers=None,
+                   shard=False):
+        """Generator wydobywający określoną liczbę linków dla wskazanej kategorii. Strony listingów pobierane są
+        równolegle, a linki zwracane na bieżąco.
 
-        number_of_listings = 20
-        temp_listing_number = 1
-        all_links = list()
+        :param category: kategoria ofert
+        :param number_of_offers: liczba ofert
+        :param from_year: rok początkowy dla zapytania
+        :param to_year: rok końcowy dla zapytania
+        :param save: flaga: czy zapisywać listingi
+        :param known_offers: indeks znanych ofert - linki do nich są pomijane (None - bez filtrowania)
+        :param shard: flaga: czy dzielić zapytanie na roczniki (i dalej przedziały cenowe) - pełne pokrycie ofert
+        :return: generator unikalnych linków z wybranej kategorii
+        """
+        if shard:
+            yield from self.iter_sharded_links(category, number_of_offers=number_of_offers, from_year=from_year,
+                                               to_year=to_year, save=save, known_offers=known_offers)
+            return
 
-        while temp_listing_number <= number_of_listings:
-            listing_page = self.asc_download_listing_page(category, temp_listing_number, from_year=from_year,
-                                                          to_year=to_year, save=save)
-            links_from_listing = self.get_links_from_listing(listing_page, self.offer_link_prefix)
-            all_links.extend(links_from_listing)
+        number_of_listings = self.max_listing_pages
 
-            temp_listing_number += 1
-            if number_of_offers == -1:
-                continue
-            else:
-                if len(all_links) >= number_of_offers:
-                    break
+        def download_listing_links(page):
+            listing_page = self.asc_download_listing_page(category, page, from_year=from_year, to_year=to_year,
+                                                          save=save)
+            return self.get_links_from_listing(listing_page, self.offer_link_prefix)
 
-        if number_of_offers != -1:
-            all_links = all_links[:number_of_offers]
+        yield from self.stream_listing_links(download_listing_links, range(1, number_of_listings + 1), None,
+                                             number_of_offers, known_offers)
 
-        return all_links
+    def download_number_of_links(self, category, number_of_offers=-1, from_year=2000, to_year=2001, save=False,
+                                 shard=False):
+        """Metoda wydobywającą określoną liczbę linków dla wskazanej kategorii.
 
+        :param category: kategoria ofert
+        :param number_of_offers: liczba ofert
+        :param from_year: rok początkowy dla zapytania
+        :param to_year: rok końcowy dla zapytania
+        :param save: flaga: czy zapisywać listingi
+        :param shard: flaga: czy dzielić zapytanie na roczniki (i dalej przedziały cenowe) - pełne pokrycie ofert
+        :return: lista linków z wybranej kategorii. Liczba zwróconych linków <= żądana liczba linków
+        """
+        return list(self.iter_links(category, number_of_offers=number_of_offers, from_year=from_year,
+                                    to_year=to_year, save=save, shard=shard))
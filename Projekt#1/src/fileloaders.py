@@ -1,101 +1,278 @@
+import itertools
 import os
 
+from archive import archive_exists, get_archive
+from corpus import PackedCorpus, default_pack_path
+from manifest import FolderManifest
+from prefetch import read_ahead, read_file
+
 
 class PortalFileloader:
     """
     Klasa bazowa na potrzeby odczytu ofert z dysku
     """
-    def __init__(self, logger, offer_folder='offers'):
+    # kodowanie zapisanych ofert (downloadery zapisują treść w kodowaniu portalu, dla wszystkich portali UTF-8)
+    encoding = 'utf-8'
+
+    # liczba ofert odczytywanych z wyprzedzeniem przez download_offers (0 - odczyt synchroniczny)
+    prefetch = 32
+    # limit bajtów odczytanych z wyprzedzeniem
+    prefetch_bytes = 64 * 1024 * 1024
+
+    def __init__(self, logger, offer_folder='offers', max_concurrency=None, archive=None, prefetch=None,
+                 prefetch_bytes=None, manifest=True, pack=None):
         """Konstruktor dla klasy bazowej
 
         :param logger: obiekt loggera
         :param offer_folder: folder nadrzędny dla folderów z ofertami
+        :param max_concurrency: parametr pomijany, obecny dla kompatybilności z klasami downloaders
+        :param archive: obiekt archive.PageArchive z zapisanymi ofertami; None - archiwum domyślne (o ile istnieje),
+            False - odczyt wyłącznie z osobnych plików
+        :param prefetch: liczba ofert odczytywanych z wyprzedzeniem (None - wartość domyślna klasy)
+        :param prefetch_bytes: limit bajtów odczytanych z wyprzedzeniem (None - wartość domyślna klasy)
+        :param manifest: True - spis plików folderu utrzymywany w manifeście (manifest.FolderManifest),
+            False - listowanie folderu przy każdym wywołaniu
+        :param pack: spakowany korpus (corpus.PackedCorpus), z którego odczytywane są wyłącznie oferty: ścieżka do pliku
+            korpusu, True - korpus domyślny dla folderu ofert (np. offers/otomoto.pack), None/False - bez korpusu
         """
         self.offer_folder = offer_folder
         self.logger = logger
+        if prefetch is not None:
+            self.prefetch = prefetch
+        if prefetch_bytes is not None:
+            self.prefetch_bytes = prefetch_bytes
+        self.use_manifest = manifest
+        self.manifest = None
+        if archive is None and archive_exists():
+            archive = get_archive()
+        self.archive = archive
+        if pack is True:
+            pack = default_pack_path(offer_folder)
+        self.pack = PackedCorpus(pack) if pack else None
 
     def download_offer(self, link, save=False):
         """
-        Metoda odczytująca ofertę o przekazanej nazwie
+        Metoda odczytująca ofertę o przekazanej nazwie (ze spakowanego korpusu, z archiwum lub z osobnego pliku)
 
         :param link: nazwa oferty
         :param save: parametr pomijany, obecny dla kompatybilności z klasami downloaders
-        :return: string z html oferty
+        :return: bytes z html oferty (w kodowaniu encoding), bez dekodowania
         """
+        if self.pack is not None:
+            return self.pack.get(link)
+
+        if self.archive and self.archive.contains(self.offer_folder, link):
+            self.logger.info('Odczyt z archiwum: %s/%s' % (self.offer_folder, link))
+            return self.archive.get(self.offer_folder, link)
+
         full_file_name = os.path.join(self.offer_folder, link)
         self.logger.info('Odczyt pliku: %s' % full_file_name)
-        with open(full_file_name, 'r', encoding='utf-8') as file_in:
-            html = file_in.read()
-        return html
+        return read_file(full_file_name)
+
+    def download_offers(self, list_of_links, save=False):
+        """
+        Metoda odczytująca kolejne oferty, zwraca wyniki w postaci zgodnej z metodą download_offers downloaderów.
+        Przy prefetch > 0 oferty odczytywane są z wyprzedzeniem w wątku w tle, równolegle z ich przetwarzaniem.
+
+        :param list_of_links: lista nazw ofert
+        :param save: parametr pomijany, obecny dla kompatybilności z klasami downloaders
+        :return: generator krotek (nazwa, bytes z html oferty lub None, wyjątek lub None)
+        """
+        if self.prefetch > 0:
+            yield from read_ahead(self.download_offer, list_of_links, self.prefetch, self.prefetch_bytes)
+            return
+
+        for link in list_of_links:
+            try:
+                yield link, self.download_offer(link, save=save), None
+            except Exception as exc:
+                yield link, None, exc
+
+    def get_manifest(self):
+        """
+        Metoda zwracająca aktualny manifest folderu ofert (tworzony przy pierwszym wywołaniu)
 
-    def download_number_of_links(self, category, number_of_offers=-1, save=False):
+        :return: obiekt manifest.FolderManifest
         """
-        Metoda zwracająca liczbę plików ofert dla danego portalu znajdujących się na dysku
+        if self.manifest is None:
+            self.manifest = FolderManifest(self.offer_folder, offer_id=self.offer_key)
+        self.manifest.update()
+        return self.manifest
+
+    def list_files(self, number_of_offers=-1, since=None, until=None, offer_ids=None):
+        """
+        Metoda zwracająca nazwy plików ofert z folderu w kolejności nazw
+
+        :param number_of_offers: liczba ofert (-1 - wszystkie)
+        :param since: najwcześniejszy czas modyfikacji pliku (timestamp) lub None
+        :param until: najpóźniejszy czas modyfikacji pliku (timestamp, wyłącznie) lub None
+        :param offer_ids: zbiór identyfikatorów ofert lub None
+        :return: lista nazw plików
+        """
+        if not os.path.isdir(self.offer_folder):
+            return list()
+        if self.use_manifest:
+            return self.get_manifest().select(number_of_offers, since=since, until=until, offer_ids=offer_ids)
+
+        file_list = list()
+        offer_ids = None if offer_ids is None else set(str(offer_id) for offer_id in offer_ids)
+        for name in sorted(os.listdir(self.offer_folder)):
+            if not name.endswith('.html'):
+                continue
+            if offer_ids is not None and self.offer_key(name) not in offer_ids:
+                continue
+            if since is not None or until is not None:
+                mtime = os.path.getmtime(os.path.join(self.offer_folder, name))
+                if (since is not None and mtime < since) or (until is not None and mtime >= until):
+                    continue
+            file_list.append(name)
+        return file_list if number_of_offers == -1 else file_list[:number_of_offers]
+
+    def download_number_of_links(self, category, number_of_offers=-1, save=False, since=None, until=None,
+                                 offer_ids=None):
+        """
+        Metoda zwracająca liczbę plików ofert dla danego portalu znajdujących się na dysku - najpierw oferty
+        z archiwum (w kolejności zapisu), następnie osobne pliki, których nie ma w archiwum (w kolejności nazw)
 
         :param category: parametr pomijany, obecny dla kompatybilności z klasami downloaders
         :param number_of_offers: liczba ofert
         :param save: parametr pomijany, obecny dla kompatybilności z klasami downloaders
+        :param since: najwcześniejszy czas zapisu oferty (timestamp) lub None
+        :param until: najpóźniejszy czas zapisu oferty (timestamp, wyłącznie) lub None
+        :param offer_ids: zbiór identyfikatorów ofert (zgodnych z offer_key) lub None
         :return: lista nazw plików
         """
-        file_list = os.listdir(self.offer_folder)
+        if self.pack is not None:
+            file_list = self.pack.names(since=since, until=until)
+            if offer_ids is not None:
+                selected = set(str(offer_id) for offer_id in offer_ids)
+                file_list = [name for name in file_list if self.offer_key(name) in selected]
+            return file_list if number_of_offers == -1 else file_list[:number_of_offers]
+
+        file_list = list()
+        if self.archive:
+            file_list = self.archive.names(self.offer_folder, since=since, until=until)
+            if offer_ids is not None:
+                selected = set(str(offer_id) for offer_id in offer_ids)
+                file_list = [name for name in file_list if self.offer_key(name) in selected]
+        if not file_list:
+            return self.list_files(number_of_offers, since=since, until=until, offer_ids=offer_ids)
+
+        archived = set(file_list)
+        file_list.extend(name for name in self.list_files(since=since, until=until, offer_ids=offer_ids)
+                         if name not in archived)
         if number_of_offers == -1:
             return file_list
         else:
             return file_list[:number_of_offers]
 
+    def offer_time(self, link):
+        """
+        Metoda zwracająca czas zapisu oferty (z archiwum lub czas modyfikacji pliku)
+
+        :param link: nazwa oferty
+        :return: timestamp lub None
+        """
+        if self.archive:
+            stored_at = self.archive.stored_at(self.offer_folder, link)
+            if stored_at is not None:
+                return stored_at
+        full_file_name = os.path.join(self.offer_folder, link)
+        if os.path.isfile(full_file_name):
+            return os.path.getmtime(full_file_name)
+        return None
+
+    @staticmethod
+    def offer_key(link):
+        """
+        Metoda zwracająca klucz oferty na potrzeby indeksu znanych ofert - identyfikator z nazwy pliku offer_<id>.html
+
+        :param link: nazwa pliku oferty
+        :return: klucz oferty
+        """
+        name = os.path.splitext(os.path.basename(link))[0]
+        if name.startswith('offer_'):
+            return name[len('offer_'):]
+        return name
+
+    def iter_links(self, category, number_of_offers=-1, save=False, known_offers=None):
+        """
+        Generator zwracający nazwy plików ofert, zgodny z metodą iter_links downloaderów
+
+        :param category: parametr pomijany, obecny dla kompatybilności z klasami downloaders
+        :param number_of_offers: liczba ofert
+        :param save: parametr pomijany, obecny dla kompatybilności z klasami downloaders
+        :param known_offers: indeks znanych ofert - pliki z tymi ofertami są pomijane (None - bez filtrowania)
+        :return: generator nazw plików
+        """
+        if known_offers is None:
+            yield from self.download_number_of_links(category, number_of_offers=number_of_offers, save=save)
+            return
+
+        file_list = self.download_number_of_links(category, save=save)
+        new_files = (link for link in file_list if self.offer_key(link) not in known_offers)
+        if number_of_offers != -1:
+            new_files = itertools.islice(new_files, number_of_offers)
+        yield from new_files
+
 
 class AllegroFileloader(PortalFileloader):
     """
     Implementacja dla plików portalu Allegro
     """
-    def __init__(self, logger):
+    def __init__(self, logger, **kwargs):
         """
         Konstruktor inicjalizujący wartości domyślne dla klasy Otomoto
 
         :param logger: obiekt współdzielonego loggera
+        :param kwargs: dodatkowe opcje przekazywane do klasy bazowej
         """
-        super().__init__(logger=logger, offer_folder='offers/allegro')
+        super().__init__(logger=logger, offer_folder='offers/allegro', **kwargs)
 
 
 class OlxFileloader(PortalFileloader):
     """
     Implementacja dla plików portalu OLx
     """
-    def __init__(self, logger):
+    def __init__(self, logger, **kwargs):
         """
         Konstruktor inicjalizujący wartości domyślne dla klasy Olx
 
         :param logger: obiekt współdzielonego loggera
+        :param kwargs: dodatkowe opcje przekazywane do klasy bazowej
         """
-        super().__init__(logger=logger, offer_folder='offers/olx')
+        super().__init__(logger=logger, offer_folder='offers/olx', **kwargs)
 
 
 class OtomotoFileloader(PortalFileloader):
     """
     Implementacja dla plików portalu Otomoto
     """
-    def __init__(self, logger):
+    def __init__(self, logger, **kwargs):
         """
         Konstruktor inicjalizujący wartości domyślne dla klasy Otomoto
 
         :param logger: obiekt współdzielonego loggera
+        :param kwargs: dodatkowe opcje przekazywane do klasy bazowej
         """
-        super().__init__(logger=logger, offer_folder='offers/otomoto')
+        super().__init__(logger=logger, offer_folder='offers/otomoto', **kwargs)
 
 
 class AutoScout24Fileloader(PortalFileloader):
     """
     Implementacja dla plików portalu AutoScout24
     """
-    def __init__(self, logger):
+    def __init__(self, logger, **kwargs):
         """
         Konstruktor inicjalizujący wartości domyślne dla klasy AutoScout24
 
         :param logger: obiekt współdzielonego loggera
+        :param kwargs: dodatkowe opcje przekazywane do klasy bazowej
         """
-        super().__init__(logger=logger, offer_folder='offers/autoscout24')
+        super().__init__(logger=logger, offer_folder='offers/autoscout24', **kwargs)
 
-    def download_number_of_links(self, category, number_of_offers=-1, from_year=2000, to_year=2001, save=False):
+    def download_number_of_links(self, category, number_of_offers=-1, from_year=2000, to_year=2001, save=False,
+                                 shard=False, **kwargs):
         """
         Metoda specyficzna dla portalu AutoScout24
 
@@ -104,6 +281,26 @@ class AutoScout24Fileloader(PortalFileloader):
         :param from_year: parametr pomijany, obecny dla kompatybilności z klasami downloaders
         :param to_year: parametr pomijany, obecny dla kompatybilności z klasami downloaders
         :param save: parametr pomijany, obecny dla kompatybilności z klasami downloaders
+        :param shard: parametr pomijany, obecny dla kompatybilności z klasami downloaders
+        :param kwargs: kryteria wyboru ofert (since, until, offer_ids) przekazywane do klasy bazowej
         :return:
         """
-        return super().download_number_of_links(category=category, number_of_offers=number_of_offers, save=save)
+        return super().download_number_of_links(category=category, number_of_offers=number_of_offers, save=save,
+                                                **kwargs)
+
+    def iter_links(self, category, number_of_offers=-1, from_year=2000, to_year=2001, save=False, known_offers=None,
+                   shard=False):
+        """
+        Generator specyficzny dla portalu AutoScout24
+
+        :param category: parametr pomijany, obecny dla kompatybilności z klasami downloaders
+        :param number_of_offers: liczba_ofert
+        :param from_year: parametr pomijany, obecny dla kompatybilności z klasami downloaders
+        :param to_year: parametr pomijany, obecny dla kompatybilności z klasami downloaders
+        :param save: parametr pomijany, obecny dla kompatybilności z klasami downloaders
+        :param known_offers: indeks znanych ofert - pliki z tymi ofertami są pomijane (None - bez filtrowania)
+        :param shard: parametr pomijany, obecny dla kompatybilności z klasami downloaders
+        :return: generator nazw plików
+        """
+        yield from super().iter_links(category=category, number_of_offers=number_of_offers, save=save,
+                                      known_offers=known_offers)
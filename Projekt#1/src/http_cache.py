@@ -0,0 +1,219 @@
+import collections
+import os
+import sqlite3
+import threading
+import time
+
+
+def declared_charset(content_type):
+    """Funkcja odczytująca kodowanie jawnie zadeklarowane w nagłówku Content-Type (bez zgadywania i bez wartości
+    domyślnych)
+
+    :param content_type: wartość nagłówka lub None
+    :return: nazwa kodowania lub None
+    """
+    if not content_type:
+        return None
+    for part in content_type.split(';')[1:]:
+        name, _, value = part.strip().partition('=')
+        if name.strip().lower() == 'charset' and value:
+            return value.strip().strip('"\'') or None
+    return None
+
+
+class CachedResponse:
+    """
+    Odpowiedź odtworzona z cache - udostępnia podzbiór interfejsu requests.Response wykorzystywany przez downloadery
+    """
+    def __init__(self, url, content, encoding, headers, status_code=200):
+        """Konstruktor zapisujący dane odpowiedzi
+
+        :param url: adres zasobu
+        :param content: treść odpowiedzi (bytes)
+        :param encoding: kodowanie treści zadeklarowane przez serwer (None - brak deklaracji)
+        :param headers: słownik nagłówków zapisanych razem z odpowiedzią
+        :param status_code: kod odpowiedzi
+        """
+        self.url = url
+        self.content = content
+        self.encoding = encoding
+        self.headers = headers
+        self.status_code = status_code
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+
+class CacheEntry:
+    """
+    Wpis cache odczytany z bazy
+    """
+    def __init__(self, url, etag, last_modified, encoding, stored_at, body):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.encoding = encoding
+        self.stored_at = stored_at
+        self.body = body
+
+    def age(self):
+        """
+        :return: wiek wpisu w sekundach (od ostatniego pobrania lub rewalidacji)
+        """
+        return time.time() - self.stored_at
+
+    def conditional_headers(self):
+        """
+        :return: nagłówki żądania warunkowego (If-None-Match / If-Modified-Since)
+        """
+        headers = dict()
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def as_response(self):
+        headers = {'ETag': self.etag, 'Last-Modified': self.last_modified}
+        if self.encoding:
+            headers['Content-Type'] = 'text/html; charset=%s' % self.encoding
+        return CachedResponse(self.url, self.body, self.encoding, headers)
+
+
+class ResponseCache:
+    """
+    Trwały (SQLite) cache odpowiedzi HTTP z kluczem w postaci adresu URL.
+
+    Wpisy młodsze niż przekazany TTL zwracane są bez kontaktu z portalem. Starsze wpisy są rewalidowane żądaniem
+    warunkowym (ETag/Last-Modified) - odpowiedź 304 pozwala pominąć transfer treści. Po przekroczeniu limitu rozmiaru
+    usuwane są najdawniej używane wpisy (LRU).
+    """
+    def __init__(self, path='http_cache.sqlite', max_bytes=512 * 1024 * 1024):
+        """Konstruktor otwierający (lub zakładający) bazę cache
+
+        :param path: ścieżka do pliku bazy
+        :param max_bytes: limit łącznego rozmiaru przechowywanych treści w bajtach
+        """
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS entries (url TEXT PRIMARY KEY, etag TEXT, '
+                                 'last_modified TEXT, encoding TEXT, stored_at REAL, last_access REAL, '
+                                 'size INTEGER, body BLOB)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)')
+        self._connection.commit()
+        self._total_bytes = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def get(self, url):
+        """Odczyt wpisu dla adresu
+
+        :param url: adres zasobu
+        :return: obiekt CacheEntry lub None
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT url, etag, last_modified, encoding, stored_at, body '
+                                           'FROM entries WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(*row)
+
+    def store(self, url, response):
+        """Zapis odpowiedzi w cache, w razie potrzeby usuwa najdawniej używane wpisy
+
+        :param url: adres zasobu
+        :param response: obiekt odpowiedzi (requests.Response)
+        """
+        body = response.content
+        encoding = declared_charset(response.headers.get('Content-Type'))
+        now = time.time()
+        with self._lock:
+            previous = self._connection.execute('SELECT size FROM entries WHERE url = ?', (url,)).fetchone()
+            if previous is not None:
+                self._total_bytes -= previous[0]
+            self._connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                     (url, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                                      encoding, now, now, len(body), body))
+            self._total_bytes += len(body)
+            self._evict()
+            self._connection.commit()
+
+    def refresh(self, url):
+        """Oznaczenie wpisu jako aktualnego (po odpowiedzi 304)
+
+        :param url: adres zasobu
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute('UPDATE entries SET stored_at = ?, last_access = ? WHERE url = ?',
+                                     (now, now, url))
+            self._connection.commit()
+
+    def touch(self, url):
+        """Aktualizacja czasu ostatniego użycia wpisu (na potrzeby LRU)
+
+        :param url: adres zasobu
+        """
+        with self._lock:
+            self._connection.execute('UPDATE entries SET last_access = ? WHERE url = ?', (time.time(), url))
+            self._connection.commit()
+
+    def _evict(self):
+        """Usunięcie najdawniej używanych wpisów aż do zejścia poniżej limitu rozmiaru. Wymaga założonej blokady.
+
+        """
+        while self._total_bytes > self.max_bytes:
+            rows = self._connection.execute('SELECT url, size FROM entries ORDER BY last_access LIMIT 64').fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                self._connection.execute('DELETE FROM entries WHERE url = ?', (url,))
+                self._total_bytes -= size
+                self.stats['evictions'] += 1
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get_response(self, url, ttl, fetch):
+        """Zwraca odpowiedź dla adresu korzystając z cache. Liczniki: hits (świeży wpis), misses (brak wpisu),
+        revalidations (żądanie warunkowe), not_modified (odpowiedź 304).
+
+        :param url: adres zasobu
+        :param ttl: czas świeżości wpisu w sekundach
+        :param fetch: funkcja wykonująca żądanie, przyjmuje słownik dodatkowych nagłówków
+        :return: obiekt odpowiedzi (requests.Response lub CachedResponse)
+        """
+        entry = self.get(url)
+        if entry is not None and entry.age() < ttl:
+            self._count('hits')
+            self.touch(url)
+            return entry.as_response()
+
+        if entry is None:
+            self._count('misses')
+            response = fetch(dict())
+        else:
+            self._count('revalidations')
+            response = fetch(entry.conditional_headers())
+            if response.status_code == 304:
+                self._count('not_modified')
+                self.refresh(url)
+                return entry.as_response()
+
+        if response.status_code == 200:
+            self.store(url, response)
+        return response
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
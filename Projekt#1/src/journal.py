@@ -0,0 +1,207 @@
+"""
+Dziennik postępu kampanii: plik JSONL (jeden obiekt JSON w wierszu), do którego dopisywane są zadania kampanii
+(wywołania process/asc_process z parametrami) oraz kolejne stany linków: discovered (pozyskany z listingu), fetched
+(ściągnięty), parsed (sparsowany), stored (zapisany w bazie) i failed (z etapem i przyczyną błędu). Dziennik
+pozwala wznowić przerwaną kampanię bez powtarzania zakończonej pracy (python campaign_runner.py --resume <kampania>).
+"""
+import json
+import os
+import threading
+import time
+
+STATES = ('discovered', 'fetched', 'parsed', 'stored', 'failed')
+
+
+class CampaignJournal:
+    """
+    Dziennik postępu kampanii. Wpisy dopisywane są na końcu pliku i przekazywane do systemu operacyjnego po każdym
+    wpisie (przerwanie procesu nie traci wpisów), a synchronizowane z dyskiem co najwyżej co fsync_interval sekund
+    i przy zamknięciu. Przy otwarciu istniejącego dziennika odtwarzany jest ostatni stan każdego linku (niepełny
+    ostatni wiersz, np. po awarii, jest pomijany). W pamięci śledzone są tylko stany linków odczytanych przy otwarciu -
+    linki pozyskane później trafiają wyłącznie do pliku, więc pamięć nie rośnie wraz z liczbą ofert kampanii.
+    """
+    journal_folder = 'journals'
+    fsync_interval = 1.0
+
+    def __init__(self, path, fsync_interval=None):
+        """Konstruktor otwierający (lub zakładający) dziennik
+
+        :param path: ścieżka do pliku dziennika
+        :param fsync_interval: maksymalny czas w sekundach między synchronizacjami z dyskiem (None - wartość
+            domyślna klasy)
+        """
+        self.path = path
+        self.fsync_interval = fsync_interval if fsync_interval is not None else self.fsync_interval
+        self.header = dict()
+        self.states = dict()
+        self.reasons = dict()
+        self.tasks = dict()
+        self.finished_tasks = set()
+        # linki z dziennika przekazane ponownie do przetworzenia od jego otwarcia
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._last_sync = time.monotonic()
+        if os.path.isfile(path):
+            self._load()
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    @classmethod
+    def default_path(cls, portal_name, campaign, folder=None):
+        """
+        :param portal_name: nazwa portalu
+        :param campaign: identyfikator kampanii (Kampanie.idx)
+        :param folder: folder dzienników (None - wartość domyślna klasy)
+        :return: ścieżka dziennika kampanii (np. journals/Otomoto_12.jsonl)
+        """
+        return os.path.join(folder or cls.journal_folder, '%s_%s.jsonl' % (portal_name, campaign))
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as file_in:
+            for line in file_in:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._apply(record, loading=True)
+
+    def _apply(self, record, loading=False):
+        if 'link' in record:
+            if not loading and record['link'] not in self.states:
+                return
+            self.states[record['link']] = record['state']
+            if record['state'] == 'failed':
+                self.reasons[record['link']] = (record.get('stage'), record.get('reason'))
+        elif 'task' in record:
+            if record.get('done'):
+                self.finished_tasks.add(record['task'])
+            else:
+                self.tasks[record['task']] = (record['method'], record['arguments'])
+        elif 'campaign' in record:
+            self.header = record
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._apply(record)
+            self._file.write(line)
+            self._file.flush()
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_sync = time.monotonic()
+
+    def start(self, campaign, portal_name, api):
+        """Zapis nagłówka dziennika (tylko dla nowego dziennika)
+
+        :param campaign: identyfikator kampanii
+        :param portal_name: nazwa portalu
+        :param api: informacja o użytym API
+        """
+        if not self.header:
+            self._write(dict(campaign=campaign, portal=portal_name, api=api, started=time.time()))
+
+    def start_task(self, method, arguments):
+        """Zapis rozpoczęcia zadania kampanii. Niezakończone zadanie o tej samej metodzie i parametrach (np. przy
+        wznowieniu) jest kontynuowane, a nie zapisywane ponownie.
+
+        :param method: nazwa metody procesora (np. 'process')
+        :param arguments: słownik parametrów metody (wartości zapisywalne w JSON)
+        :return: identyfikator zadania
+        """
+        for task, (task_method, task_arguments) in self.tasks.items():
+            if task not in self.finished_tasks and task_method == method and task_arguments == arguments:
+                return task
+        task = len(self.tasks) + 1
+        self._write(dict(task=task, method=method, arguments=arguments))
+        return task
+
+    def finish_task(self, task):
+        """
+        :param task: identyfikator zakończonego zadania
+        """
+        self._write(dict(task=task, done=True))
+
+    def unfinished_tasks(self):
+        """
+        :return: lista krotek (identyfikator, metoda, parametry) niezakończonych zadań
+        """
+        return [(task, method, arguments) for task, (method, arguments) in sorted(self.tasks.items())
+                if task not in self.finished_tasks]
+
+    def mark(self, link, state, stage=None, reason=None):
+        """Zapis stanu linku
+
+        :param link: link do oferty
+        :param state: stan linku (jeden z STATES)
+        :param stage: etap, na którym wystąpił błąd (dla stanu failed)
+        :param reason: przyczyna błędu (dla stanu failed)
+        """
+        record = dict(link=link, state=state)
+        if state == 'failed':
+            record.update(stage=stage, reason=str(reason))
+        self._write(record)
+
+    def failed(self, link, stage, reason):
+        """Zapis błędu przetwarzania linku
+
+        :param link: link do oferty
+        :param stage: etap, na którym wystąpił błąd (fetch, parse, store)
+        :param reason: przyczyna błędu
+        """
+        self.mark(link, 'failed', stage, reason)
+
+    def discover(self, links):
+        """Generator zapisujący nowe linki jako discovered i pomijający linki zapisane już w bazie oraz linki z dziennika
+        przekazane ponownie do przetworzenia od jego otwarcia (przy wznowieniu - linki z poprzedniego przebiegu, których
+        zapis w bazie może jeszcze trwać)
+
+        :param links: iterowalny zbiór linków
+        :return: generator linków do przetworzenia
+        """
+        for link in links:
+            state = self.states.get(link)
+            if state is None:
+                self.mark(link, 'discovered')
+            elif state == 'stored' or link in self._seen:
+                continue
+            else:
+                self._seen.add(link)
+            yield link
+
+    def fetched(self, offers):
+        """Generator zapisujący wynik ściągania ofert
+
+        :param offers: krotki (link, html lub None, wyjątek lub None) - np. wynik download_offers
+        :return: generator tych samych krotek
+        """
+        for link, data, exc in offers:
+            if exc is None:
+                self.mark(link, 'fetched')
+            else:
+                self.failed(link, 'fetch', exc)
+            yield link, data, exc
+
+    def pending_links(self):
+        """
+        :return: lista linków, które nie zostały zapisane w bazie, w tym zakończonych błędem (w kolejności pozyskania)
+        """
+        return [link for link, state in self.states.items() if state != 'stored']
+
+    def summary(self):
+        """
+        :return: słownik stan -> liczba linków odczytanych przy otwarciu dziennika (z późniejszymi zmianami stanu)
+        """
+        counts = dict((state, 0) for state in STATES)
+        for state in self.states.values():
+            counts[state] += 1
+        return counts
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
@@ -0,0 +1,138 @@
+import hashlib
+import math
+import os
+import struct
+import threading
+
+from models import Kampanie, Oferty, Portale
+
+
+class BloomFilter:
+    """
+    Filtr Blooma z opcjonalnym zapisem na dysku. Pozwala zapamiętać bardzo dużą liczbę kluczy w stałej pamięci
+    kosztem niewielkiego odsetka fałszywych trafień (nigdy nie daje fałszywych chybień).
+    """
+    _header = struct.Struct('<QI')
+
+    def __init__(self, capacity=1000000, error_rate=0.001, path=None):
+        """Konstruktor tworzący pusty filtr lub wczytujący go z pliku
+
+        :param capacity: przewidywana liczba kluczy
+        :param error_rate: dopuszczalny odsetek fałszywych trafień przy pełnym wykorzystaniu
+        :param path: ścieżka do pliku filtra (None - filtr tylko w pamięci)
+        """
+        self.path = path
+        if path is not None and os.path.isfile(path):
+            with open(path, 'rb') as file_in:
+                self.size, self.hash_count = self._header.unpack(file_in.read(self._header.size))
+                self.bits = bytearray(file_in.read())
+        else:
+            self.size = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+            self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+            self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).digest()
+        first, second = struct.unpack_from('<QQ', digest)
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def save(self):
+        """Zapis filtra do pliku (przez plik tymczasowy, aby przerwany zapis nie uszkodził filtra)
+
+        """
+        if self.path is None:
+            return
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as file_out:
+            file_out.write(self._header.pack(self.size, self.hash_count))
+            file_out.write(self.bits)
+        os.replace(temp_path, self.path)
+
+
+class KnownOffersIndex:
+    """
+    Indeks ofert znanych z poprzednich kampanii danego portalu. Kluczami są identyfikatory ofert (id_oferty) oraz
+    klucze linków zwracane przez metodę offer_key downloadera - dla portali, w których link nie zawiera id_oferty
+    (Otomoto, Olx - id_oferty to numeryczny ad_id), klucze linków przechowywane są w filtrze Blooma zapisywanym na
+    dysku (domyślnie known_offers/<portal>.bloom), bo nie da się ich odtworzyć z bazy danych.
+    """
+    bloom_folder = 'known_offers'
+
+    def __init__(self, logger, keys=(), bloom_path=None, capacity=1000000):
+        """Konstruktor indeksu
+
+        :param logger: obiekt loggera
+        :param keys: klucze znanych ofert
+        :param bloom_path: ścieżka do pliku filtra Blooma (None - indeks tylko w pamięci)
+        :param capacity: przewidywana liczba kluczy filtra Blooma
+        """
+        self.logger = logger
+        self._keys = set(str(key) for key in keys)
+        self._lock = threading.Lock()
+        self.bloom = None
+        if bloom_path is not None:
+            self.bloom = BloomFilter(capacity=capacity, path=bloom_path)
+
+    @classmethod
+    def default_path(cls, portal_name, folder=None):
+        """
+        :param portal_name: nazwa portalu
+        :param folder: folder filtrów Blooma (None - wartość domyślna klasy)
+        :return: ścieżka filtra Blooma portalu (np. known_offers/Otomoto.bloom)
+        """
+        return os.path.join(folder or cls.bloom_folder, '%s.bloom' % portal_name)
+
+    @classmethod
+    def from_database(cls, logger, session, portal_name, bloom_path=None):
+        """Budowa indeksu na podstawie ofert zapisanych w bazie dla wskazanego portalu
+
+        :param logger: obiekt loggera
+        :param session: sesja bazy danych
+        :param portal_name: nazwa portalu
+        :param bloom_path: ścieżka do pliku filtra Blooma
+        :return: obiekt KnownOffersIndex
+        """
+        query = session.query(Oferty.id_oferty).join(Kampanie).join(Portale)\
+            .filter(Portale.nazwa_portalu == portal_name).distinct()
+        index = cls(logger, keys=(row[0] for row in query), bloom_path=bloom_path)
+        logger.info('Indeks znanych ofert dla %s: %s identyfikatorów' % (portal_name, len(index._keys)))
+        return index
+
+    def __contains__(self, key):
+        key = str(key)
+        if key in self._keys:
+            return True
+        return self.bloom is not None and key in self.bloom
+
+    def add(self, *keys):
+        """Dodanie kluczy oferty (np. id_oferty i klucza linku) do indeksu
+
+        :param keys: klucze oferty
+        """
+        with self._lock:
+            for key in keys:
+                if key is None:
+                    continue
+                key = str(key)
+                self._keys.add(key)
+                if self.bloom is not None:
+                    self.bloom.add(key)
+
+    def save(self):
+        """Utrwalenie filtra Blooma (jeśli skonfigurowano)
+
+        """
+        if self.bloom is not None:
+            with self._lock:
+                self.bloom.save()
@@ -0,0 +1,170 @@
+"""
+Manifest folderu z zapisanymi stronami: trwały (SQLite) spis plików z rozmiarem, czasem modyfikacji, skrótem treści
+i identyfikatorem oferty. Zastępuje listowanie całego folderu przy każdym uruchomieniu - manifest aktualizowany jest
+przyrostowo, a wybór plików (w deterministycznej kolejności, według zakresu dat lub identyfikatorów) wykonywany jest
+zapytaniem do indeksu.
+Odświeżenie manifestu: python manifest.py offers/otomoto offers/olx ...
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """
+    :param path: ścieżka do pliku
+    :param chunk_size: rozmiar porcji odczytu w bajtach
+    :return: skrót SHA-256 treści pliku
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file_in:
+        for chunk in iter(lambda: file_in.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def offer_id_from_name(name):
+    """
+    :param name: nazwa pliku oferty
+    :return: identyfikator oferty z nazwy offer_<id>.html (lub nazwa pliku bez rozszerzenia)
+    """
+    name = os.path.splitext(name)[0]
+    if name.startswith('offer_'):
+        return name[len('offer_'):]
+    return name
+
+
+class FolderManifest:
+    """
+    Manifest plików folderu. Aktualizacja porównuje zawartość folderu (os.scandir) z manifestem i dopisuje lub usuwa
+    tylko zmienione wpisy. Jeśli czas modyfikacji folderu nie zmienił się od ostatniej aktualizacji, folder nie jest
+    w ogóle przeglądany.
+    """
+    manifest_suffix = '.manifest.sqlite'
+    orders = {'name': 'name', 'mtime': 'mtime, name', 'offer_id': 'offer_id, name'}
+
+    def __init__(self, folder, suffix='.html', offer_id=offer_id_from_name, path=None):
+        """Konstruktor otwierający (lub zakładający) manifest folderu
+
+        :param folder: folder z plikami
+        :param suffix: końcówka nazw plików ujmowanych w manifeście
+        :param offer_id: funkcja wyznaczająca identyfikator oferty z nazwy pliku
+        :param path: ścieżka do pliku manifestu (None - plik obok folderu, np. offers/otomoto.manifest.sqlite;
+            manifest nie jest zapisywany w samym folderze, aby jego zapis nie zmieniał czasu modyfikacji folderu)
+        """
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.folder = folder
+        self.suffix = suffix
+        self.offer_id = offer_id
+        self.path = path or os.path.normpath(folder) + self.manifest_suffix
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, size INTEGER, '
+                                 'mtime REAL, hash TEXT, offer_id TEXT)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS files_mtime ON files (mtime)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS files_offer_id ON files (offer_id)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER)')
+        self._connection.commit()
+
+    def _folder_mtime(self):
+        return os.stat(self.folder).st_mtime_ns
+
+    def update(self, full=False):
+        """Przyrostowa aktualizacja manifestu
+
+        :param full: True - sprawdzenie rozmiaru i czasu modyfikacji wszystkich plików (wykrywa pliki nadpisane
+            w miejscu, które nie zmieniają czasu modyfikacji folderu); False - tylko pliki dodane i usunięte
+        :return: krotka (liczba dodanych lub zmienionych wpisów, liczba usuniętych wpisów)
+        """
+        folder_mtime = self._folder_mtime()
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM state WHERE key = 'folder_mtime'").fetchone()
+            if not full and row is not None and row[0] == folder_mtime:
+                return 0, 0
+
+            known = dict((name, (size, mtime)) for name, size, mtime in
+                         self._connection.execute('SELECT name, size, mtime FROM files'))
+            changed = list()
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(self.suffix) or not entry.is_file():
+                        continue
+                    previous = known.pop(entry.name, None)
+                    if previous is not None and not full:
+                        continue
+                    stat = entry.stat()
+                    if previous == (stat.st_size, stat.st_mtime):
+                        continue
+                    changed.append((entry.name, stat.st_size, stat.st_mtime, file_digest(entry.path),
+                                    self.offer_id(entry.name)))
+
+            self._connection.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)', changed)
+            self._connection.executemany('DELETE FROM files WHERE name = ?', ((name,) for name in known))
+            self._connection.execute("INSERT OR REPLACE INTO state VALUES ('folder_mtime', ?)", (folder_mtime,))
+            self._connection.commit()
+        return len(changed), len(known)
+
+    def select(self, number_of_offers=-1, offset=0, since=None, until=None, offer_ids=None, order='name'):
+        """Wybór nazw plików z manifestu
+
+        :param number_of_offers: maksymalna liczba nazw (-1 - wszystkie)
+        :param offset: liczba pominiętych początkowych nazw
+        :param since: najwcześniejszy czas modyfikacji pliku (timestamp) lub None
+        :param until: najpóźniejszy czas modyfikacji pliku (timestamp, wyłącznie) lub None
+        :param offer_ids: zbiór identyfikatorów ofert lub None
+        :param order: kolejność: 'name', 'mtime' lub 'offer_id'
+        :return: lista nazw plików
+        """
+        conditions, parameters = list(), list()
+        if since is not None:
+            conditions.append('mtime >= ?')
+            parameters.append(since)
+        if until is not None:
+            conditions.append('mtime < ?')
+            parameters.append(until)
+        if offer_ids is not None:
+            conditions.append('offer_id IN (SELECT value FROM json_each(?))')
+            parameters.append(json.dumps([str(offer_id) for offer_id in offer_ids]))
+        query = 'SELECT name FROM files'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY ' + self.orders[order] + ' LIMIT ? OFFSET ?'
+        parameters.extend((number_of_offers, offset))
+        with self._lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+        return [row[0] for row in rows]
+
+    def entry(self, name):
+        """
+        :param name: nazwa pliku
+        :return: krotka (rozmiar, czas modyfikacji, skrót treści, identyfikator oferty) lub None
+        """
+        with self._lock:
+            return self._connection.execute('SELECT size, mtime, hash, offer_id FROM files WHERE name = ?',
+                                            (name,)).fetchone()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Aktualizacja manifestów folderów ze stronami')
+    parser.add_argument('folders', nargs='+')
+    parser.add_argument('--full', action='store_true', help='sprawdzenie rozmiaru i czasu modyfikacji plików')
+    arguments = parser.parse_args()
+
+    for source_folder in arguments.folders:
+        folder_manifest = FolderManifest(source_folder)
+        added, removed = folder_manifest.update(full=arguments.full)
+        print('%s: plików %s, dodanych/zmienionych %s, usuniętych %s'
+              % (source_folder, len(folder_manifest), added, removed))
+        folder_manifest.close()
@@ -0,0 +1,139 @@
+"""
+Etap parsowania ofert: w bieżącym wątku lub w puli procesów (parsowanie BeautifulSoup obciąża CPU i w jednym
+procesie nie korzysta z więcej niż jednego rdzenia). Oba warianty przyjmują i zwracają krotki w postaci zgodnej
+z metodą download_offers downloaderów, zachowując kolejność ofert.
+"""
+import collections
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from downloaders import imap_bounded
+
+
+class ParseError(Exception):
+    """
+    Wyjątek opisujący błąd metody get_details() - zawiera typ i treść oryginalnego wyjątku (w tej postaci może zostać
+    przekazany z procesu roboczego niezależnie od typu oryginalnego wyjątku)
+    """
+    def __init__(self, message):
+        super().__init__(message)
+
+    @classmethod
+    def from_exception(cls, exc):
+        return cls('%s: %s' % (type(exc).__name__, exc))
+
+
+def parse_one(parser, link, data, exc, encoding):
+    """Parsowanie pojedynczej oferty
+
+    :param parser: obiekt parsera
+    :param link: namiar na ofertę
+    :param data: html oferty lub None
+    :param exc: wyjątek ściągania oferty lub None
+    :param encoding: kodowanie html przekazanego jako bytes
+    :return: krotka (namiar, obiekt Offer lub None, wyjątek lub None)
+    """
+    if exc is not None:
+        return link, None, exc
+    try:
+        return link, parser.get_details(data, encoding=encoding), None
+    except Exception as error:
+        return link, None, ParseError.from_exception(error)
+
+
+def parse_inline(parser, offers, encoding):
+    """Generator parsujący oferty w bieżącym wątku
+
+    :param parser: obiekt parsera
+    :param offers: krotki (namiar, html lub None, wyjątek lub None) - np. wynik download_offers
+    :param encoding: kodowanie html przekazanego jako bytes
+    :return: generator krotek (namiar, obiekt Offer lub None, wyjątek lub None)
+    """
+    for link, data, exc in offers:
+        yield parse_one(parser, link, data, exc, encoding)
+
+
+# parser procesu roboczego, tworzony przez init_worker
+_worker_parser = None
+
+
+def init_worker(parser_class, parser_options, logger_name):
+    global _worker_parser
+    _worker_parser = parser_class(logging.getLogger(logger_name), **parser_options)
+
+
+def parse_task(task):
+    """Zadanie wykonywane w procesie roboczym
+
+    :param task: krotka (namiar, html, kodowanie)
+    :return: krotka (namiar, obiekt Offer lub None, wyjątek lub None, liczniki parsera od poprzedniego zadania)
+    """
+    link, data, encoding = task
+    if data is None:
+        return link, None, None, None
+    result = parse_one(_worker_parser, link, data, None, encoding)
+    stats = getattr(_worker_parser, 'stats', None)
+    counters = collections.Counter(stats) if stats else None
+    if stats:
+        stats.clear()
+    return result + (counters,)
+
+
+class ParsePool:
+    """
+    Pula procesów parsujących oferty. Każdy proces tworzy własny obiekt parsera, a do procesów przekazywany jest
+    wyłącznie html oferty - wynikiem jest obiekt Offer. Liczniki parserów procesów roboczych sumowane są w atrybucie
+    stats puli. Procesy uruchamiane są metodą forkserver (lub spawn) - fork procesu z wieloma wątkami (np. kilka
+    procesorów uruchomionych równolegle) mógłby skopiować blokady zajęte przez inne wątki. Skrypt uruchamiający pulę
+    musi więc chronić swój kod blokiem if __name__ == '__main__'.
+    """
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    def __init__(self, logger, parser_class, parser_options=None, workers=-1):
+        """Konstruktor uruchamiający pulę
+
+        :param logger: obiekt loggera (procesy robocze korzystają z loggera o tej samej nazwie)
+        :param parser_class: klasa parsera
+        :param parser_options: słownik opcji konstruktora parsera
+        :param workers: liczba procesów (-1 - liczba rdzeni)
+        """
+        self.logger = logger
+        self.workers = (os.cpu_count() or 1) if workers == -1 else workers
+        self.stats = collections.Counter()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context(self.start_method),
+                                            initializer=init_worker,
+                                            initargs=(parser_class, parser_options or dict(), logger.name))
+        logger.info('Pula parsowania: %s procesów' % self.workers)
+
+    def parse(self, offers, encoding):
+        """Generator parsujący oferty w puli procesów - w locie jest co najwyżej dwukrotność liczby procesów ofert,
+        wyniki zwracane są w kolejności ofert wejściowych. Oferty, których nie udało się ściągnąć, nie są przekazywane
+        do procesów roboczych.
+
+        :param offers: krotki (namiar, html lub None, wyjątek lub None) - np. wynik download_offers
+        :param encoding: kodowanie html przekazanego jako bytes
+        :return: generator krotek (namiar, obiekt Offer lub None, wyjątek lub None)
+        """
+        download_errors = collections.deque()
+
+        def tasks():
+            for link, data, exc in offers:
+                download_errors.append(exc)
+                if exc is None:
+                    yield link, data, encoding
+                else:
+                    yield link, None, encoding
+
+        for link, offer, exc, counters in imap_bounded(self.executor, parse_task, tasks(), self.workers * 2):
+            download_error = download_errors.popleft()
+            if download_error is not None:
+                yield link, None, download_error
+                continue
+            if counters:
+                self.stats.update(counters)
+            yield link, offer, exc
+
+    def close(self):
+        self.executor.shutdown()
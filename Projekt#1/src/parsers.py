@@ -1,34 +1,255 @@
 
+import bisect
+import collections
+import html
 import json
 import re
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
+
+# backendy budowy drzewa dokumentu: lxml (parser w C) oraz html.parser (czysty Python, zawsze dostępny)
+PARSER_BACKENDS = ('lxml', 'html.parser')
+FALLBACK_BACKEND = 'html.parser'
+
+
+def available_backend(backend):
+    """
+    Funkcja sprawdzająca dostępność backendu - niedostępny backend (np. brak pakietu lxml) zastępowany jest
+    backendem html.parser
+
+    :param backend: nazwa backendu
+    :return: nazwa dostępnego backendu
+    """
+    if backend not in PARSER_BACKENDS:
+        raise ValueError('Nieznany backend parsera: %s' % backend)
+    if builder_registry.lookup(backend) is None:
+        return FALLBACK_BACKEND
+    return backend
+
+
+class RegionStrainer(SoupStrainer):
+    """
+    Filtr parse_only zachowujący w drzewie wyłącznie wskazane regiony dokumentu (wraz z całą zawartością) - elementy
+    spoza regionów nie są w ogóle tworzone. Region to krotka (nazwa znacznika lub None, słownik atrybutów), gdzie
+    wartością atrybutu jest: string (dla class - wszystkie klasy ze stringa muszą wystąpić), krotka dopuszczalnych
+    wartości, True (atrybut obecny) lub False (atrybut nieobecny).
+    """
+    def __init__(self, regions):
+        super().__init__()
+        self.regions = regions
+
+    @staticmethod
+    def _attribute_matches(name, value, rule):
+        if rule is True or rule is False:
+            return (value is not None) == rule
+        if value is None:
+            return False
+        if name == 'class':
+            classes = value.split() if isinstance(value, str) else value
+            return all(item in classes for item in rule.split())
+        if isinstance(value, list):
+            value = ' '.join(value)
+        if isinstance(rule, tuple):
+            return value in rule
+        return value == rule
+
+    def match_region(self, name, attrs):
+        """
+        :param name: nazwa znacznika
+        :param attrs: słownik atrybutów znacznika
+        :return: True, jeśli znacznik rozpoczyna któryś z regionów
+        """
+        attrs = attrs or dict()
+        for region_name, region_attrs in self.regions:
+            if region_name is not None and region_name != name:
+                continue
+            if all(self._attribute_matches(attribute, attrs.get(attribute), rule)
+                   for attribute, rule in region_attrs.items()):
+                return True
+        return False
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        # bs4 >= 4.13
+        return self.match_region(name, attrs)
+
+    def allow_string_creation(self, string):
+        # tekst poza regionami nie jest potrzebny
+        return False
+
+    def search_tag(self, markup_name=None, markup_attrs=None):
+        # bs4 < 4.13
+        if self.match_region(markup_name, markup_attrs):
+            return markup_name
+        return None
+
+
+def make_soup(_data, encoding=None, backend=FALLBACK_BACKEND, parse_only=None):
+    """
+    Funkcja budująca drzewo dokumentu. Html przekazany jako bytes trafia bezpośrednio do parsera ze znanym kodowaniem,
+    bez dekodowania po stronie downloadera i bez zgadywania kodowania.
+
+    :param _data: string lub bytes zawierający html
+    :param encoding: kodowanie html przekazanego jako bytes (None - UTF-8)
+    :param backend: backend budowy drzewa ('lxml' lub 'html.parser')
+    :param parse_only: filtr ograniczający budowane drzewo (np. RegionStrainer) lub None - pełne drzewo
+    :return: obiekt BeautifulSoup
+    """
+    if isinstance(_data, bytes):
+        return BeautifulSoup(_data, backend, from_encoding=encoding or 'utf-8', parse_only=parse_only)
+    return BeautifulSoup(_data, backend, parse_only=parse_only)
+
+
+def parameter_table(block, label_name, value_name, value_attrs=None):
+    """
+    Funkcja budująca w jednym przejściu bloku parametrów oferty słownik etykieta -> element z wartością. Etykietą jest
+    tekst elementu label_name (tak jak przy wyszukiwaniu find(label_name, text=etykieta)), a wartością - najbliższy
+    kolejny element rodzeństwa value_name. Przy powtórzonej etykiecie obowiązuje pierwsze wystąpienie.
+
+    :param block: element z blokiem parametrów
+    :param label_name: nazwa znacznika etykiety
+    :param value_name: nazwa znacznika wartości
+    :param value_attrs: dodatkowe kryteria znacznika wartości (jak w find_next_sibling)
+    :return: słownik etykieta -> element wartości (None, jeśli etykieta nie ma elementu wartości)
+    """
+    table = dict()
+    for label in block.find_all(label_name):
+        key = label.string
+        if key is None or key in table:
+            continue
+        if value_attrs is None:
+            table[str(key)] = label.find_next_sibling(value_name)
+        else:
+            table[str(key)] = label.find_next_sibling(value_name, attrs=value_attrs)
+    return table
+
+
+SCRIPT_PATTERN = re.compile(r'<script\b([^>]*)>(.*?)</script\s*>', re.S | re.I)
+SCRIPT_PATTERN_BYTES = re.compile(SCRIPT_PATTERN.pattern.encode('ascii'), re.S | re.I)
+ATTRIBUTE_PATTERN = re.compile(r'([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+# komentarz html (niedomknięty komentarz trwa do końca dokumentu)
+COMMENT_PATTERN = re.compile(r'<!--.*?(?:-->|\Z)', re.S)
+COMMENT_PATTERN_BYTES = re.compile(COMMENT_PATTERN.pattern.encode('ascii'), re.S)
+
+
+class CommentSpans:
+    """
+    Zakresy komentarzy html dokumentu (elementy w komentarzu nie trafiają do drzewa). Zakresy wyznaczane są jednym
+    przejściem po dokumencie przy pierwszym sprawdzeniu pozycji, a kolejne pozycje sprawdzane są przez wyszukiwanie
+    binarne - koszt nie rośnie z liczbą sprawdzanych elementów.
+    """
+    def __init__(self, _data):
+        """
+        :param _data: string lub bytes zawierający html
+        """
+        self._data = _data
+        self._starts = None
+        self._ends = None
+
+    def __contains__(self, position):
+        if self._starts is None:
+            pattern = COMMENT_PATTERN_BYTES if isinstance(self._data, bytes) else COMMENT_PATTERN
+            spans = [match.span() for match in pattern.finditer(self._data)]
+            self._starts = [start for start, _ in spans]
+            self._ends = [end for _, end in spans]
+        index = bisect.bisect_right(self._starts, position) - 1
+        return index >= 0 and position < self._ends[index]
+
+
+def _as_text(value, encoding):
+    if isinstance(value, bytes):
+        return value.decode(encoding or 'utf-8', errors='replace')
+    return value
+
+
+def script_text(_data, pattern, encoding=None):
+    """
+    Funkcja odczytująca bez budowy drzewa treść pierwszego skryptu inline, którego treść pasuje do wzorca
+    (odpowiednik soup.find('script', text=re.compile(pattern)).text)
+
+    :param _data: string lub bytes zawierający html
+    :param pattern: wyrażenie regularne (string)
+    :param encoding: kodowanie html przekazanego jako bytes (None - UTF-8)
+    :return: treść skryptu (string) lub None
+    """
+    if isinstance(_data, bytes):
+        scripts, pattern = SCRIPT_PATTERN_BYTES, re.compile(pattern.encode('utf-8'))
+    else:
+        scripts, pattern = SCRIPT_PATTERN, re.compile(pattern)
+    comments = CommentSpans(_data)
+    for match in scripts.finditer(_data):
+        if pattern.search(match.group(2)) and match.start() not in comments:
+            return _as_text(match.group(2), encoding)
+    return None
+
+
+def element_text(_data, name, attrs, encoding=None):
+    """
+    Funkcja odczytująca bez budowy drzewa tekst pierwszego elementu o wskazanej nazwie i atrybutach (odpowiednik
+    soup.find(name, attrs=attrs).text) - tylko dla elementów bez elementów potomnych. Dokument w postaci bajtów
+    przeszukiwany jest bez dekodowania - dekodowane są tylko znalezione znaczniki.
+
+    :param _data: string lub bytes zawierający html
+    :param name: nazwa znacznika
+    :param attrs: słownik wymaganych wartości atrybutów
+    :param encoding: kodowanie html przekazanego jako bytes (None - UTF-8)
+    :return: tekst elementu lub None (brak elementu lub element z elementami potomnymi)
+    """
+    pattern = as_data_type(r'<%s\b([^>]*)>(.*?)</%s\s*>' % (re.escape(name), re.escape(name)), _data)
+    comments = CommentSpans(_data)
+    for match in re.finditer(pattern, _data, re.S | re.I):
+        if match.start() in comments:
+            continue
+        tag_attrs = dict((attribute.lower(), html.unescape(next((value for value in values if value), '')))
+                         for attribute, *values in ATTRIBUTE_PATTERN.findall(_as_text(match.group(1), encoding)))
+        if all(tag_attrs.get(attribute) == value for attribute, value in attrs.items()):
+            text = _as_text(match.group(2), encoding)
+            if '<' in text:
+                return None
+            return html.unescape(text)
+    return None
+
+
+def as_data_type(text, _data):
+    """
+    Funkcja dopasowująca typ znacznika tekstowego (str/bytes) do typu przeszukiwanych danych
+
+    :param text: znacznik tekstowy
+    :param _data: przeszukiwane dane
+    :return: znacznik w typie zgodnym z danymi (bytes kodowane w UTF-8)
+    """
+    if isinstance(_data, bytes):
+        return text.encode('utf-8')
+    return text
 
 
 class Offer:
     """
-    Klasa reprezentująca ofertę
+    Klasa reprezentująca ofertę - rekord ze stałym zestawem pól (__slots__), bez słownika atrybutów i referencji
+    do loggera, dzięki czemu obiekty zajmują mniej pamięci i są tanie w przesyłaniu między procesami
     """
     field_names = ['kolor', 'kraj', 'liczba_miejsc', 'moc', 'naped', 'pojemnosc', 'przebieg', 'rodzaj_paliwa',
                    'rok_produkcji', 'uszkodzony', 'nadwozie', 'cena', 'waluta', 'marka', 'typ', 'model', 'id_oferty',
                    'tytul', 'nazwa_sprzedajacego', 'id_sprzedajacego', 'lokalizacja', 'miejscowosc', 'wojewodztwo']
+    __slots__ = tuple(field_names) + ('anomalie',)
+    # pola zapisywane w kolumnach modelu Oferty (waluta i nazwa sprzedającego nie mają odpowiadających kolumn)
+    columns = tuple(field for field in __slots__ if field not in ('waluta', 'nazwa_sprzedajacego'))
 
-    def __init__(self, logger):
-        """Konstruktor inicjalizujący wartości domyślne dla atrytbutów oferty oraz zapisujący referencję do loggera
+    def __init__(self):
+        """Konstruktor inicjalizujący wartości domyślne dla atrybutów oferty
 
-        :param logger:
         """
-        self.logger = logger
         self.anomalie = ''
         for field in Offer.field_names:
             setattr(self, field, None)
 
-    def post_process(self):
+    def post_process(self, logger):
         """
         Metoda dostosowująca postać oferty (a konkretnie atrybuty).
         Tu następuje walidacja i ewentualna zmiana typu atrybutów cena i przebieg, moc, pojemność.
         Metoda tworzy także listę wykrytych anomalii.
 
+        :param logger: obiekt loggera (anomalie zapisywane są w logu)
         """
 
         anomalie = list()
@@ -38,7 +259,7 @@ class Offer:
                 self.cena = int(float(self.cena))
             except Exception:
                 self.cena = 0
-                self.logger.info('Anomalia dla atrybutu cena')
+                logger.info('Anomalia dla atrybutu cena')
                 anomalie.append('cena')
 
         if isinstance(self.przebieg, str):
@@ -49,7 +270,7 @@ class Offer:
                 self.przebieg = int(float(__temp))
             except Exception:
                 self.przebieg = 0
-                self.logger.info('Anomalia dla atrybutu przebieg')
+                logger.info('Anomalia dla atrybutu przebieg')
                 anomalie.append('przebieg')
 
         self.pojemnosc = self.pojemnosc.upper().replace('CM3', '').replace('CM³', '').replace(' ','')
@@ -57,26 +278,149 @@ class Offer:
 
         self.anomalie = ", ".join(anomalie)
 
+    def as_row(self):
+        """
+        :return: słownik wartości kolumn modelu Oferty
+        """
+        return dict((column, getattr(self, column)) for column in self.columns)
+
     def __repr__(self):
-        return str(self.__dict__)
+        return str(dict((field, getattr(self, field)) for field in self.__slots__))
 
 
-class AllegroOfferParser:
+class OfferParser:
     """
-    Implementacja klasy parsującej oferty z portalu Allegro
+    Klasa bazowa parserów ofert - przechowuje logger i backend budowy drzewa dokumentu. Klasy pochodne implementują
+    metodę parse_offer i deklarują w atrybucie regions regiony strony, z których korzystają.
     """
-    def __init__(self, logger):
+    # backend domyślny; przy braku pakietu lxml parsery korzystają z html.parser
+    backend = 'lxml'
+    # regiony dokumentu odczytywane przez parse_offer (format jak w RegionStrainer)
+    regions = ()
+    # regiony z danymi JSON oferty - budowane tylko wtedy, gdy dane nie zostały odczytane bezpośrednio z html
+    payload_regions = ()
+
+    def __init__(self, logger, backend=None, restrict=True):
+        """Konstruktor dla klasy bazowej
+
+        :param logger: obiekt loggera
+        :param backend: backend budowy drzewa ('lxml' lub 'html.parser', None - wartość domyślna klasy)
+        :param restrict: True - drzewo budowane tylko dla regionów z atrybutów regions i payload_regions,
+            False - pełne drzewo
+        """
         self.logger = logger
+        requested = backend or self.backend
+        self.backend = available_backend(requested)
+        if self.backend != requested:
+            self.logger.warning('Backend %s niedostępny, użyty zostanie %s' % (requested, self.backend))
+        # liczniki ofert, dla których dane JSON odczytano bezpośrednio z html (fast) lub z drzewa (fallback)
+        self.stats = collections.Counter()
+        self.strainer = None
+        self.payload_strainer = None
+        if restrict and self.regions:
+            self.strainer = RegionStrainer(self.regions)
+            self.payload_strainer = RegionStrainer(self.regions + self.payload_regions)
+
+    def make_soup(self, _data, encoding=None, strainer=None):
+        """
+        Metoda budująca drzewo dokumentu z użyciem backendu parsera
 
-    def get_details(self, _data):
+        :param _data: string lub bytes zawierający html
+        :param encoding: kodowanie html przekazanego jako bytes (None - UTF-8)
+        :param strainer: filtr regionów (RegionStrainer) lub None - pełne drzewo
+        :return: obiekt BeautifulSoup
         """
-        Implementacja parsera, który wydobywa wartości atrybutów oferty z przekazanego stringa (html)
+        return make_soup(_data, encoding, self.backend, parse_only=strainer)
 
-        :param _data: string zawierający html z ofertą
+    def get_details(self, _data, encoding=None):
+        """
+        Metoda wydobywająca wartości atrybutów oferty z przekazanego html. Dane JSON osadzone w stronie odczytywane są
+        w miarę możliwości bezpośrednio z html (extract_payload), bez budowy drzewa dla skryptów. Jeśli parser deklaruje
+        regiony, drzewo budowane jest tylko dla nich; gdy wydobycie danych z regionów się nie powiedzie (np. po zmianie
+        układu strony), oferta jest parsowana ponownie z pełnego drzewa.
+
+        :param _data: string lub bytes zawierający html z ofertą
+        :param encoding: kodowanie html przekazanego jako bytes (None - UTF-8)
         :return: obiekt klasy Offer
         """
         self.logger.info('Metoda get_details()')
-        soup = BeautifulSoup(_data, 'html.parser')
+        payload = None
+        if self.payload_regions:
+            payload = self.extract_payload(_data, encoding)
+            self.stats['fast' if payload is not None else 'fallback'] += 1
+
+        strainer = self.strainer if payload is not None else self.payload_strainer
+        if strainer is not None:
+            try:
+                return self.parse_offer(self.make_soup(_data, encoding, strainer), _data, encoding, payload)
+            except Exception as exc:
+                self.logger.info('Parsowanie regionów nie powiodło się (%s), parsowanie pełnego dokumentu' % exc)
+        return self.parse_offer(self.make_soup(_data, encoding), _data, encoding, payload)
+
+    def extract_payload(self, _data, encoding):
+        """
+        Metoda odczytująca dane JSON oferty bezpośrednio z html (bez budowy drzewa), implementowana w klasach
+        pochodnych deklarujących payload_regions
+
+        :param _data: string lub bytes zawierający html z ofertą
+        :param encoding: kodowanie html przekazanego jako bytes
+        :return: dane JSON lub None, jeśli nie udało się ich odczytać (dane zostaną odczytane z drzewa)
+        """
+        return None
+
+    def parse_offer(self, soup, _data, encoding, payload=None):
+        """
+        Metoda wydobywająca wartości atrybutów oferty z drzewa dokumentu, implementowana w klasach pochodnych
+
+        :param soup: obiekt BeautifulSoup
+        :param _data: string lub bytes zawierający html z ofertą
+        :param encoding: kodowanie html przekazanego jako bytes
+        :param payload: dane JSON odczytane przez extract_payload lub None - odczyt z drzewa
+        :return: obiekt klasy Offer
+        """
+        raise NotImplementedError
+
+    def apply_parameters(self, offer, table, labels, convert, suffix='', missing='NULL'):
+        """
+        Metoda przepisująca wartości z tablicy parametrów (parameter_table) do atrybutów oferty
+
+        :param offer: obiekt klasy Offer
+        :param table: słownik etykieta -> element wartości
+        :param labels: słownik etykieta portalu -> nazwa atrybutu oferty
+        :param convert: funkcja zamieniająca element wartości na wartość atrybutu
+        :param suffix: końcówka etykiety w dokumencie (np. ':')
+        :param missing: wartość dla etykiet nieobecnych w tablicy
+        """
+        missing_keys = list()
+        for key, label in labels.items():
+            element = table.get(key + suffix)
+            if element is None:
+                missing_keys.append(key)
+                value = missing
+            else:
+                value = convert(key, element)
+            setattr(offer, label, value)
+        if missing_keys:
+            self.logger.info('Brak kluczy: %s' % ', '.join(missing_keys))
+
+
+class AllegroOfferParser(OfferParser):
+    """
+    Implementacja klasy parsującej oferty z portalu Allegro
+    """
+    # dataLayer odczytywany jest jako rodzeństwo znacznika meta robots, dlatego zachowywany jest cały head
+    regions = (('head', {}), (None, {'data-box-name': 'Parameters'}), (None, {'itemprop': ('price', 'priceCurrency')}),
+               (None, {'data-analytics-interaction-value': ('LocationShow', 'locationShow')}))
+
+    def parse_offer(self, soup, _data, encoding, payload=None):
+        """
+        Implementacja parsera, który wydobywa wartości atrybutów oferty z drzewa dokumentu
+
+        :param soup: obiekt BeautifulSoup (pełne drzewo lub regiony z atrybutu regions)
+        :param _data: string lub bytes zawierający html z ofertą
+        :param encoding: kodowanie html przekazanego jako bytes (None - UTF-8)
+        :return: obiekt klasy Offer
+        """
         parameters_filtered = soup.find(attrs={"data-box-name": "Parameters"})
 
         labels = {"Kolor": 'kolor', "Kraj pochodzenia": 'kraj', "Liczba miejsc": 'liczba_miejsc', "Moc": 'moc',
@@ -84,18 +428,10 @@ class AllegroOfferParser:
                   "Rodzaj paliwa": 'rodzaj_paliwa', "Rok produkcji": 'rok_produkcji', "Uszkodzony": 'uszkodzony',
                   "Nadwozie": 'nadwozie'}
 
-        big_data = Offer(self.logger)
+        big_data = Offer()
 
-        for key, label in labels.items():
-            anchor = parameters_filtered.find("div", text=key + ":")
-            try:
-                value = anchor.find_next_sibling("div").text
-
-            except AttributeError as err:
-                self.logger.info('Wyjątek dla klucza %s' % key)
-                value = 'NULL'
-
-            setattr(big_data, label, value)
+        table = parameter_table(parameters_filtered, "div", "div")
+        self.apply_parameters(big_data, table, labels, lambda key, element: element.text, suffix=':')
 
         filtered = soup.find(itemprop="price")
         big_data.cena = filtered.get('content')
@@ -130,26 +466,52 @@ class AllegroOfferParser:
         big_data.miejscowosc = location[0]
         big_data.wojewodztwo = location[1]
 
-        big_data.post_process()
+        big_data.post_process(self.logger)
         return big_data
 
 
-class OlxOfferParser:
+class OlxOfferParser(OfferParser):
     """
     Implementacja klasy parsującej oferty z portalu Olx
     """
-    def __init__(self, logger):
-        self.logger = logger
+    regions = ((None, {'class': 'details fixed marginbott20 margintop5 full'}),
+               (None, {'class': 'block brkword xx-large'}), (None, {'class': 'offer-titlebox'}))
+    payload_regions = (('script', {'src': False}),)
+    payload_pattern = 'var trackingData.*siteUrl'
+
+    @staticmethod
+    def payload_from_script(matched):
+        """
+        Metoda odczytująca dane JSON (trackingData) z treści skryptu
 
-    def get_details(self, _data):
+        :param matched: treść skryptu
+        :return: dane JSON
         """
-        Implementacja parsera, który wydobywa wartości atrybutów oferty z przekazanego stringa (html)
+        json_beginning = matched.find('{"$config"')
+        json_ending = matched.find("}}'", json_beginning)
+
+        txt = matched[json_beginning:json_ending+2]
 
-        :param _data: string zawierający html z ofertą
+        return json.loads(txt)
+
+    def extract_payload(self, _data, encoding):
+        matched = script_text(_data, self.payload_pattern, encoding)
+        if matched is None:
+            return None
+        try:
+            return self.payload_from_script(matched)
+        except ValueError:
+            return None
+
+    def parse_offer(self, soup, _data, encoding, payload=None):
+        """
+        Implementacja parsera, który wydobywa wartości atrybutów oferty z drzewa dokumentu
+
+        :param soup: obiekt BeautifulSoup (pełne drzewo lub regiony z atrybutu regions)
+        :param _data: string lub bytes zawierający html z ofertą
+        :param encoding: kodowanie html przekazanego jako bytes (None - UTF-8)
         :return: obiekt klasy Offer
         """
-        self.logger.info('Metoda get_details()')
-        soup = BeautifulSoup(_data, 'html.parser')
 
         parameters_filtered = soup.find(class_='details fixed marginbott20 margintop5 full')
 
@@ -158,30 +520,15 @@ class OlxOfferParser:
                   "Paliwo": 'rodzaj_paliwa', "Rok produkcji": 'rok_produkcji', "Stan techniczny": 'uszkodzony',
                   "Typ nadwozia": 'nadwozie', 'Marka': 'marka', 'Model':'typ'}
 
-        big_data = Offer(self.logger)
+        big_data = Offer()
         big_data.model = ''
-        for key, label in labels.items():
-            anchor = parameters_filtered.find("th", text=key)
-            try:
-                value = anchor.find_next_sibling("td", attrs='value').text.strip()
-
-            except AttributeError as err:
-                self.logger.info('Wyjątek dla klucza %s' % key)
-                value = 'NULL'
-
-            setattr(big_data, label, value)
-
-        pattern = re.compile('var trackingData.*siteUrl')
+        table = parameter_table(parameters_filtered, "th", "td", value_attrs='value')
+        self.apply_parameters(big_data, table, labels, lambda key, element: element.text.strip())
 
-        matched = soup.find('script', text=pattern).text
-
-        json_beginning = matched.find('{"$config"')
-        json_ending = matched.find("}}'", json_beginning)
-
-        txt = matched[json_beginning:json_ending+2]
-
-        some_json = json.loads(txt)
-        some_json = some_json['pageView']
+        if payload is None:
+            pattern = re.compile(self.payload_pattern)
+            payload = self.payload_from_script(soup.find('script', text=pattern).text)
+        some_json = payload['pageView']
 
         big_data.cena = some_json['ad_price']
         big_data.waluta = some_json['price_currency']
@@ -194,26 +541,52 @@ class OlxOfferParser:
         big_data.nazwa_sprzedajacego = soup.find(class_="block brkword xx-large").text.strip()
         big_data.tytul = soup.find(class_='offer-titlebox').contents[1].text.strip()
 
-        big_data.post_process()
+        big_data.post_process(self.logger)
         return big_data
 
 
-class OtomotoOfferParser:
+class OtomotoOfferParser(OfferParser):
     """
     Implementacja klasy parsującej oferty z portalu Otomoto
     """
-    def __init__(self, logger):
-        self.logger = logger
+    regions = ((None, {'id': 'parameters'}), (None, {'class': 'seller-box__seller-name'}))
+    payload_regions = (('script', {'src': False}),)
+    payload_pattern = 'window.ninjaPV = {'
+
+    @staticmethod
+    def payload_from_script(matched):
+        """
+        Metoda odczytująca dane JSON (window.ninjaPV) z treści skryptu
+
+        :param matched: treść skryptu
+        :return: dane JSON
+        """
+        json_beginning = matched.find('window.ninjaPV = {')
+        json_beginning = matched.find('{', json_beginning)
+        json_ending = matched.find("};", json_beginning)
+
+        txt = matched[json_beginning:json_ending+1]
+
+        return json.loads(txt)
 
-    def get_details(self, _data):
+    def extract_payload(self, _data, encoding):
+        matched = script_text(_data, self.payload_pattern, encoding)
+        if matched is None:
+            return None
+        try:
+            return self.payload_from_script(matched)
+        except ValueError:
+            return None
+
+    def parse_offer(self, soup, _data, encoding, payload=None):
         """
-        Implementacja parsera, który wydobywa wartości atrybutów oferty z przekazanego stringa (html)
+        Implementacja parsera, który wydobywa wartości atrybutów oferty z drzewa dokumentu
 
-        :param _data: string zawierający html z ofertą
+        :param soup: obiekt BeautifulSoup (pełne drzewo lub regiony z atrybutu regions)
+        :param _data: string lub bytes zawierający html z ofertą
+        :param encoding: kodowanie html przekazanego jako bytes (None - UTF-8)
         :return: obiekt klasy Offer
         """
-        self.logger.info('Metoda get_details()')
-        soup = BeautifulSoup(_data, 'html.parser')
 
         parameters_filtered = soup.find(id='parameters')
 
@@ -222,37 +595,26 @@ class OtomotoOfferParser:
                   "Rodzaj paliwa": 'rodzaj_paliwa', "Rok produkcji": 'rok_produkcji', "Bezwypadkowy": 'uszkodzony',
                   "Typ": 'nadwozie', 'Marka pojazdu': 'marka', 'Model pojazdu': 'typ', 'Wersja':'model'}
 
-        big_data = Offer(self.logger)
+        big_data = Offer()
 
-        for key, label in labels.items():
-            anchor = parameters_filtered.find("span", text=key)
-            try:
-                value = anchor.find_next_sibling("div").text.strip()
+        def convert(key, element):
+            value = element.text.strip()
+            # na pierwszy rzut oka pojawia się konsternacja, ale to wynika z wykorzystania przeciwstawnych określeń
+            # dla stanu auta (bezwypadkowy vs uszkodzony)
+            if key == 'Bezwypadkowy':
+                if value == 'Tak':
+                    value = 'Nie'
+                elif value == 'Nie':
+                    value = 'Tak'
+            return value
 
-                # na pierwszy rzut oka pojawia się konsternacja, ale to wynika z wykorzystania przeciwstawnych określeń
-                # dla stanu auta (bezwypadkowy vs uszkodzony)
-                if key == 'Bezwypadkowy':
-                    if value == 'Tak':
-                        value = 'Nie'
-                    elif value == 'Nie':
-                        value = 'Tak'
-
-            except AttributeError as err:
-                self.logger.info('Wyjątek dla klucza %s' % key)
-                value = 'NULL'
-
-            setattr(big_data, label, value)
+        table = parameter_table(parameters_filtered, "span", "div")
+        self.apply_parameters(big_data, table, labels, convert)
 
-        pattern = re.compile('window.ninjaPV = {')
-        matched = soup.find('script', text=pattern).text
-
-        json_beginning = matched.find('window.ninjaPV = {')
-        json_beginning = matched.find('{', json_beginning)
-        json_ending = matched.find("};", json_beginning)
-
-        txt = matched[json_beginning:json_ending+1]
-
-        some_json = json.loads(txt)
+        if payload is None:
+            pattern = re.compile(self.payload_pattern)
+            payload = self.payload_from_script(soup.find('script', text=pattern).text)
+        some_json = payload
 
         big_data.cena = some_json['ad_price']
         big_data.waluta = some_json['price_currency']
@@ -265,38 +627,54 @@ class OtomotoOfferParser:
 
         big_data.nazwa_sprzedajacego = soup.find(class_='seller-box__seller-name').text.replace('\n', '').strip()
 
-        title_beginning = _data.find('var ad_title=')
-        title_beginning = _data.find("'", title_beginning)
-        title_ending = _data.find("';", title_beginning)
-        title_contents = _data[title_beginning+1:title_ending].strip()
-        big_data.tytul = title_contents
+        title_beginning = _data.find(as_data_type('var ad_title=', _data))
+        title_beginning = _data.find(as_data_type("'", _data), title_beginning)
+        title_ending = _data.find(as_data_type("';", _data), title_beginning)
+        title_contents = _data[title_beginning+1:title_ending]
+        if isinstance(title_contents, bytes):
+            title_contents = title_contents.decode(encoding or 'utf-8', errors='replace')
+        big_data.tytul = title_contents.strip()
 
-        big_data.post_process()
+        big_data.post_process(self.logger)
         return big_data
 
 
-class Autoscout24OfferParser:
+class Autoscout24OfferParser(OfferParser):
     """
     Implementacja klasy parsującej oferty z portalu Autoscout24
     """
+    regions = ((None, {'class': 'cldt-categorized-data cldt-data-section sc-pull-right'}),
+               (None, {'class': 'btn-watchlist cldt-action-icon'}),
+               (None, {'data-item-name': ('vendor-company-name', 'vendor-private-seller-title', 'vendor-contact-city',
+                                          'vendor-contact-country')}),
+               ('div', {'data-type': 'title'}))
+    payload_regions = (('s24-ad-targeting', {}),)
+    payload_attrs = {'style': 'display:none;'}
+
+    def extract_payload(self, _data, encoding):
+        text = element_text(_data, 's24-ad-targeting', self.payload_attrs, encoding)
+        if text is None:
+            return None
+        try:
+            return json.loads(text)
+        except ValueError:
+            return None
 
-    def __init__(self, logger):
-        self.logger = logger
-
-    def get_details(self, _data):
+    def parse_offer(self, soup, _data, encoding, payload=None):
         """
-        Implementacja parsera, który wydobywa wartości atrybutów oferty z przekazanego stringa (html)
+        Implementacja parsera, który wydobywa wartości atrybutów oferty z drzewa dokumentu
 
-        :param _data: string zawierający html z ofertą
+        :param soup: obiekt BeautifulSoup (pełne drzewo lub regiony z atrybutu regions)
+        :param _data: string lub bytes zawierający html z ofertą
+        :param encoding: kodowanie html przekazanego jako bytes (None - UTF-8)
         :return: obiekt klasy Offer
         """
-        self.logger.info('Metoda get_details()')
-        soup = BeautifulSoup(_data, 'html.parser')
 
-        parameters_filtered = soup.find(name='s24-ad-targeting', attrs={'style': 'display:none;'})
-        parameters_filtered = json.loads(parameters_filtered.text)
+        parameters_filtered = payload
+        if parameters_filtered is None:
+            parameters_filtered = json.loads(soup.find(name='s24-ad-targeting', attrs=self.payload_attrs).text)
 
-        big_data = Offer(self.logger)
+        big_data = Offer()
 
         big_data.cena = parameters_filtered['cost']
         big_data.waluta = 'EUR'
@@ -334,16 +712,9 @@ class Autoscout24OfferParser:
 
         filtered = soup.find(class_='cldt-categorized-data cldt-data-section sc-pull-right')
 
-        for key, label in labels.items():
-            anchor = filtered.find("dt", text=key)
-            try:
-                value = anchor.find_next_sibling("dd").text
-                value = value.replace('\n', '').strip()
-
-            except Exception as err:
-                value = None
-
-            setattr(big_data, label, value)
+        table = parameter_table(filtered, "dt", "dd")
+        self.apply_parameters(big_data, table, labels, lambda key, element: element.text.replace('\n', '').strip(),
+                              missing=None)
 
         big_data.id_oferty = soup.find(class_='btn-watchlist cldt-action-icon').attrs['data-classified-guid'].strip()
 
@@ -385,5 +756,5 @@ class Autoscout24OfferParser:
         big_data.model = ''
         big_data.uszkodzony = ''
 
-        big_data.post_process()
+        big_data.post_process(self.logger)
         return big_data
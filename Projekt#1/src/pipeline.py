@@ -0,0 +1,184 @@
+"""
+Etapy potoku przetwarzania ofert: ściąganie -> parsowanie -> zapis. Etapy działają w osobnych wątkach (lub puli
+procesów parsowania) i połączone są kolejkami o ograniczonej długości - szybszy etap czeka, gdy kolejka do
+wolniejszego jest pełna, więc w pamięci jest co najwyżej kilka partii ofert niezależnie od ich łącznej liczby.
+"""
+import queue
+import threading
+
+# znacznik końca strumienia w kolejce
+_END = object()
+
+
+def _put(items, item, stop):
+    """Umieszczenie elementu w kolejce z przerwaniem oczekiwania po ustawieniu zdarzenia stop
+
+    :return: False, jeśli etap został zatrzymany
+    """
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def offer_size(offer):
+    """
+    :param offer: krotka (link, html lub None, wyjątek lub None) - np. wynik download_offers
+    :return: rozmiar html oferty w bajtach
+    """
+    return len(offer[1]) if offer[1] is not None else 0
+
+
+def buffered(iterable, maxsize, max_bytes=None, size=None):
+    """Generator odczytujący elementy w wątku w tle - np. wyniki ściągania ofert odbierane są z downloadera, podczas
+    gdy wątek główny parsuje poprzednie. Kolejność elementów jest zachowana, a wyjątek zgłoszony przez źródło
+    przekazywany jest do wątku odbierającego. Poza liczbą elementów kolejkę może ograniczać łączny rozmiar elementów
+    (pojedynczy element większy od limitu jest przepuszczany, gdy kolejka jest pusta).
+
+    :param iterable: źródło elementów
+    :param maxsize: maksymalna liczba elementów oczekujących w kolejce (0 - odczyt w bieżącym wątku, bez kolejki)
+    :param max_bytes: maksymalny łączny rozmiar elementów oczekujących w kolejce lub None (bez limitu)
+    :param size: funkcja zwracająca rozmiar elementu w bajtach (wymagana dla max_bytes)
+    :return: generator elementów
+    """
+    if not maxsize:
+        yield from iterable
+        return
+
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    condition = threading.Condition()
+    in_queue = [0]
+
+    def reserve(item_size):
+        with condition:
+            while in_queue[0] and in_queue[0] + item_size > max_bytes:
+                if stop.is_set():
+                    return False
+                condition.wait(0.1)
+            in_queue[0] += item_size
+        return True
+
+    def release(item_size):
+        with condition:
+            in_queue[0] -= item_size
+            condition.notify()
+
+    def produce():
+        source = iter(iterable)
+        try:
+            for item in source:
+                item_size = size(item) if max_bytes else 0
+                if item_size and not reserve(item_size):
+                    return
+                if not _put(items, (item, None), stop):
+                    return
+        except Exception as exc:
+            _put(items, (_END, exc), stop)
+        finally:
+            # generator źródła zamykany jest w wątku, który go wykonywał
+            close = getattr(source, 'close', None)
+            if close is not None:
+                close()
+            _put(items, (_END, None), stop)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, exc = items.get()
+            if exc is not None:
+                raise exc
+            if item is _END:
+                return
+            if max_bytes:
+                release(size(item))
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+class StoreWorker:
+    """
+    Etap zapisu: pojedynczy wątek wywołujący funkcję zapisu dla elementów umieszczanych w kolejce (put). Wątek
+    zapisu jest jedynym użytkownikiem sesji bazy danych w czasie działania etapu. Gdy przez idle_interval sekund
+    nie napływają nowe elementy (np. wcześniejsze etapy czekają na bezpiecznik lub Retry-After), wątek wywołuje
+    funkcję idle - np. zapis zgromadzonej partii po upływie jej limitu czasu. Przy wyjściu z bloku with
+    zapisywane są wszystkie oczekujące elementy, a wyjątek wątku zapisu przekazywany jest do wątku głównego.
+    """
+    idle_interval = 1.0
+
+    def __init__(self, store, maxsize=256, idle=None, idle_interval=None):
+        """Konstruktor etapu
+
+        :param store: funkcja zapisu wywoływana z argumentami przekazanymi do put
+        :param maxsize: maksymalna liczba elementów oczekujących na zapis (0 - zapis w bieżącym wątku, bez kolejki
+            i bez wywołań idle)
+        :param idle: funkcja bez argumentów wywoływana w wątku zapisu, gdy nie napływają nowe elementy, lub None
+        :param idle_interval: czas w sekundach bez nowych elementów, po którym wywoływana jest funkcja idle
+            (None - wartość domyślna klasy)
+        """
+        self.store = store
+        self.maxsize = maxsize
+        self.idle = idle
+        self.idle_interval = idle_interval if idle_interval is not None else self.idle_interval
+        self.error = None
+        self._items = queue.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _consume(self):
+        while True:
+            try:
+                item = self._items.get(timeout=self.idle_interval if self.idle is not None else None)
+            except queue.Empty:
+                item = None
+            if item is _END:
+                return
+            try:
+                if item is None:
+                    self.idle()
+                else:
+                    self.store(*item)
+            except BaseException as exc:
+                self.error = exc
+                self._stop.set()
+                return
+
+    def put(self, *item):
+        """Przekazanie elementu do zapisu - przy pełnej kolejce wywołanie czeka na wątek zapisu
+
+        :param item: argumenty funkcji zapisu
+        """
+        if self._thread is None:
+            self.store(*item)
+            return
+        if not _put(self._items, item, self._stop):
+            raise self.error
+
+    def __enter__(self):
+        if self.maxsize:
+            self._thread = threading.Thread(target=self._consume, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._thread is None:
+            return
+        if exc_type is not None:
+            # przerwanie przetwarzania - elementy już przekazane są zapisywane, nowe nie są przyjmowane
+            self._stop.set()
+        while self._thread.is_alive():
+            try:
+                self._items.put(_END, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self._thread.join()
+        self._thread = None
+        if exc_type is None and self.error is not None:
+            raise self.error
@@ -0,0 +1,37 @@
+"""
+Odczyt zapisanych stron z wyprzedzeniem: wątek w tle czyta kolejne pliki (lub wpisy archiwum), podczas gdy wątek
+główny parsuje poprzednie, dzięki czemu ponowne przetwarzanie ofert z dysku nie czeka na operacje wejścia/wyjścia.
+Kolejkę z limitem liczby stron i bajtów zapewnia pipeline.buffered.
+"""
+from pipeline import buffered, offer_size
+
+
+def read_file(path):
+    """Odczyt całego pliku
+
+    :param path: ścieżka do pliku
+    :return: treść pliku (bytes)
+    """
+    with open(path, 'rb') as file_in:
+        return file_in.read()
+
+
+def read_ahead(read, names, window=32, max_bytes=64 * 1024 * 1024):
+    """Generator odczytujący strony z wyprzedzeniem. W locie jest co najwyżej window stron i co najwyżej max_bytes
+    bajtów (pojedyncza strona większa od limitu jest przepuszczana, gdy kolejka jest pusta). Wyniki zwracane są
+    w kolejności nazw wejściowych, a błąd odczytu strony przekazywany jest w wyniku (błąd źródła nazw - zgłaszany).
+
+    :param read: funkcja przyjmująca nazwę i zwracająca treść strony (bytes)
+    :param names: iterowalny zbiór nazw stron
+    :param window: maksymalna liczba stron odczytanych z wyprzedzeniem
+    :param max_bytes: maksymalna łączna liczba bajtów odczytanych, a jeszcze nie pobranych z generatora
+    :return: generator krotek (nazwa, bytes lub None, wyjątek lub None)
+    """
+    def read_all():
+        for name in names:
+            try:
+                yield name, read(name), None
+            except Exception as exc:
+                yield name, None, exc
+
+    return buffered(read_all(), window, max_bytes=max_bytes, size=offer_size)
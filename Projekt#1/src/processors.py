@@ -2,6 +2,10 @@
 # tqdm nie działa najlepiej w oknie PyCharm, polecam uruchamianie z terminala/linii poleceń
 import tqdm
 
+import collections
+import collections.abc
+import contextlib
+import functools
 import time
 import logging
 import sys
@@ -13,6 +17,11 @@ from db_engine import Session
 from parsers import AllegroOfferParser, Autoscout24OfferParser, OlxOfferParser, OtomotoOfferParser
 from downloaders import AllegroDownloader, AutoScout24Downloader, OlxDownloader, OtomotoDownloader
 from fileloaders import AllegroFileloader, AutoScout24Fileloader, OlxFileloader, OtomotoFileloader
+from journal import CampaignJournal
+from known_offers import KnownOffersIndex
+from parse_pool import ParseError, ParsePool, parse_inline
+from pipeline import StoreWorker, buffered, offer_size
+from writer import BatchWriter
 
 allegro_categories_mapping = {
     'ford focus mk3': 'focus-mk3-2010-110752',
@@ -44,9 +53,22 @@ class PortalProcessor:
     #. pozyskanie surowych danych (z portalu lub pliku)
     #. wydobycie żądanych danych
     #. zapis danych w bazie danych
+    Etapy działają równolegle (potok): ściąganie w puli wątków downloadera, parsowanie w wątku głównym lub w puli
+    procesów, zapis w jednym wątku - etapy połączone są kolejkami o długości fetch_queue_size i store_queue_size.
+    Linki przetwarzane są strumieniowo, więc pamięć zależy od limitów ofert w locie (okno downloadera
+    2 * max_concurrency, kolejki, okno puli parsowania 2 * parse_workers, partia BatchWriter), a nie od liczby ofert
+    kampanii.
     """
-
-    def __init__(self, logger, portal_name, api, session):
+    # maksymalna liczba ściągniętych ofert oczekujących na parsowanie (0 - ściąganie w wątku głównym)
+    fetch_queue_size = 64
+    # maksymalny łączny rozmiar (w bajtach) ściągniętych ofert oczekujących na parsowanie
+    fetch_queue_bytes = 64 * 1024 * 1024
+    # maksymalna liczba sparsowanych ofert oczekujących na zapis (0 - zapis w wątku głównym)
+    store_queue_size = 256
+
+    def __init__(self, logger, portal_name, api, session, downloader_options=None, incremental=False,
+                 known_offers_path=None, parser_options=None, parse_workers=0, writer_options=None,
+                 fetch_queue_size=None, fetch_queue_bytes=None, store_queue_size=None, store=None, journal=False):
         """
         Inicjalizacja wartości początkowych
 
@@ -54,6 +76,22 @@ class PortalProcessor:
         :param portal_name: nazwa portalu
         :param api: informacja o użytym API
         :param session: sesja bazy danych
+        :param downloader_options: słownik opcji przekazywanych do konstruktora downloadera (np. max_concurrency)
+        :param incremental: tryb przyrostowy - oferty zapisane w poprzednich kampaniach są pomijane przed ściąganiem
+        :param known_offers_path: ścieżka do pliku filtra Blooma z kluczami linków znanych ofert (tryb przyrostowy);
+            None - plik domyślny portalu (KnownOffersIndex.default_path), False - indeks budowany wyłącznie na
+            podstawie bazy danych (nie działa dla portali, których linki nie zawierają id_oferty, np. Otomoto, Olx)
+        :param parser_options: słownik opcji przekazywanych do konstruktora parsera (np. backend)
+        :param parse_workers: liczba procesów parsujących oferty (0 - parsowanie w bieżącym wątku, -1 - liczba rdzeni)
+        :param writer_options: słownik opcji przekazywanych do konstruktora BatchWriter (batch_size, flush_interval)
+        :param fetch_queue_size: długość kolejki między ściąganiem a parsowaniem (None - wartość domyślna klasy)
+        :param fetch_queue_bytes: limit rozmiaru ofert w kolejce między ściąganiem a parsowaniem (None - wartość
+            domyślna klasy)
+        :param store_queue_size: długość kolejki między parsowaniem a zapisem (None - wartość domyślna klasy)
+        :param store: współdzielony etap zapisu (StoreWorker), np. dla procesorów uruchomionych równolegle - wiersze
+            zapisuje jego właściciel; None - własny BatchWriter i wątek zapisu procesora
+        :param journal: dziennik postępu kampanii (True - dziennik w folderze domyślnym, ścieżka - dziennik w podanym
+            folderze, False - bez dziennika; włączany np. przez campaign_runner)
         """
         self.logger = logger
         self.portal_name = portal_name
@@ -63,13 +101,37 @@ class PortalProcessor:
         self._offer_parser = None
         self.offer_downloader = None
         self.offer_parser = None
+        # kopia - klasy pochodne uzupełniają opcje (np. pack) bez zmiany słownika wywołującego
+        self.downloader_options = dict(downloader_options or dict())
+        self.parser_options = parser_options or dict()
+        self.incremental = incremental
+        if known_offers_path is None:
+            known_offers_path = KnownOffersIndex.default_path(portal_name)
+        self.known_offers_path = known_offers_path
+        self.known_offers = None
+        self.parse_workers = parse_workers
+        self.parse_pool = None
+        self.writer_options = writer_options or dict()
+        self.writer = None
+        self.store = store
+        self.journal_folder = journal if isinstance(journal, str) else None
+        self.use_journal = bool(journal)
+        self.journal = None
+        # identyfikatory ofert zapisanych w bazie przed wznowieniem kampanii
+        self.stored_offer_ids = set()
+        if fetch_queue_size is not None:
+            self.fetch_queue_size = fetch_queue_size
+        if fetch_queue_bytes is not None:
+            self.fetch_queue_bytes = fetch_queue_bytes
+        if store_queue_size is not None:
+            self.store_queue_size = store_queue_size
 
     def create_campaign(self):
         """
         Utworzenie kampanii na potrzeby ładowania danych do bazy danych. Metoda zakłada także portal, jeśli go nie było.
 
         """
-        self.portal = my_session.query(Portale).filter(Portale.nazwa_portalu == self.portal_name).first()
+        self.portal = self.session.query(Portale).filter(Portale.nazwa_portalu == self.portal_name).first()
         if self.portal is None:
             self.logger.info('Tworzenie portalu %s' % self.portal_name)
             self.portal = Portale(nazwa_portalu=self.portal_name)
@@ -87,9 +149,26 @@ class PortalProcessor:
 
         """
         self.logger.info('Tworzenie parsera')
-        self.offer_parser = self._offer_parser(self.logger)
+        self.offer_parser = self._offer_parser(self.logger, **self.parser_options)
         self.logger.info('Tworzenie downloadera')
-        self.offer_downloader = self._offer_downloader(self.logger)
+        self.offer_downloader = self._offer_downloader(self.logger, **self.downloader_options)
+        if self.parse_workers and self.parse_pool is None:
+            self.logger.info('Tworzenie puli parsowania')
+            self.parse_pool = ParsePool(self.logger, self._offer_parser, self.parser_options, self.parse_workers)
+        if self.writer is None and self.store is None:
+            self.writer = BatchWriter(self.logger, self.session, **self.writer_options)
+
+    def open_journal(self):
+        """
+        Otwarcie (lub założenie) dziennika postępu bieżącej kampanii
+
+        """
+        if not self.use_journal:
+            return
+        path = CampaignJournal.default_path(self.portal_name, self.kampania.idx, self.journal_folder)
+        self.logger.info('Dziennik kampanii: %s' % path)
+        self.journal = CampaignJournal(path)
+        self.journal.start(self.kampania.idx, self.portal_name, self.api)
 
     def prepare_campaign(self):
         """
@@ -98,6 +177,86 @@ class PortalProcessor:
         """
         self.create_campaign()
         self.start_plugins()
+        if self.incremental:
+            self.logger.info('Budowa indeksu znanych ofert')
+            self.known_offers = KnownOffersIndex.from_database(self.logger, self.session, self.portal_name,
+                                                               bloom_path=self.known_offers_path or None)
+        self.open_journal()
+
+    def resume_campaign(self, campaign):
+        """
+        Przygotowanie obiektów do wznowienia przerwanej kampanii (zamiast prepare_campaign) - kampania odczytywana jest
+        z bazy, a jej dziennik postępu otwierany do dalszego zapisu
+
+        :param campaign: identyfikator kampanii (Kampanie.idx)
+        """
+        self.kampania = self.session.get(Kampanie, campaign)
+        if self.kampania is None:
+            raise ValueError('Brak kampanii %s' % campaign)
+        self.portal = self.kampania.portal
+        self.start_plugins()
+        if self.incremental:
+            self.logger.info('Budowa indeksu znanych ofert')
+            self.known_offers = KnownOffersIndex.from_database(self.logger, self.session, self.portal_name,
+                                                               bloom_path=self.known_offers_path or None)
+        self.open_journal()
+        if self.journal is None:
+            raise ValueError('Kampania %s nie ma dziennika postępu' % campaign)
+        self.stored_offer_ids = set(offer_id for offer_id, in self.session.query(Oferty.id_oferty)
+                                    .filter(Oferty.id_kampanii == campaign))
+
+    def resume(self):
+        """
+        Wznowienie kampanii według dziennika: najpierw przetwarzane są linki pozyskane, a niezapisane w bazie (w tym
+        zakończone błędem), a następnie ponownie uruchamiane są niezakończone zadania kampanii - linki zapisane już
+        w bazie są w nich pomijane
+
+        """
+        pending = self.journal.pending_links()
+        self.logger.info('Wznawianie kampanii %s: stan linków %s, do przetworzenia %s'
+                         % (self.kampania.idx, self.journal.summary(), len(pending)))
+        if pending:
+            self.download_offers_from_list(pending, save=True)
+        for _, method, arguments in self.journal.unfinished_tasks():
+            getattr(self, method)(**arguments)
+
+    def start_task(self, method, arguments):
+        """
+        Zapis rozpoczęcia zadania kampanii w dzienniku
+
+        :param method: nazwa metody procesora
+        :param arguments: słownik parametrów metody
+        :return: identyfikator zadania lub None (bez dziennika)
+        """
+        if self.journal is None:
+            return None
+        return self.journal.start_task(method, arguments)
+
+    def finish_task(self, task):
+        """
+        Zapis zakończenia zadania kampanii w dzienniku
+
+        :param task: identyfikator zadania zwrócony przez start_task
+        """
+        if self.journal is not None and task is not None:
+            self.journal.finish_task(task)
+
+    def _offer_stored(self, link, offer_id):
+        """
+        Wywoływana po zapisie oferty w bazie: aktualizacja dziennika i indeksu znanych ofert
+
+        """
+        if self.journal is not None:
+            self.journal.mark(link, 'stored')
+        if self.known_offers is not None:
+            self.known_offers.add(offer_id, self.offer_downloader.offer_key(link))
+
+    def _offer_failed(self, link, exc):
+        """
+        Wywoływana, gdy oferty nie udało się zapisać w bazie: zapis błędu w dzienniku (wznowienie ponowi ofertę)
+
+        """
+        self.journal.failed(link, 'store', exc)
 
     def download_offers_from_list(self, list_of_links, save):
         """
@@ -105,39 +264,109 @@ class PortalProcessor:
         #. ściąganie oferty
         #. wydobywanie danych z oferty
         #. zapis obiektu ofertu w bazie danych
-        Przetwarzaniu towarzyszy pasek postępu
+        Kroki wykonywane są równolegle dla kolejnych ofert: oferty ściągane są współbieżnie (zgodnie z ustawieniem
+        max_concurrency downloadera) w wątku w tle, parsowane w bieżącym wątku lub w puli procesów (parse_workers),
+        a zapis odbywa się w osobnym wątku, w kolejności linków, partiami (BatchWriter) - pozostałe wiersze zapisywane
+        są także po przerwaniu pętli. Pełna kolejka do wolniejszego etapu wstrzymuje etap poprzedni. Błąd ściągania
+        lub parsowania oferty jest logowany, a przetwarzanie jest kontynuowane od kolejnego linku. Przetwarzaniu
+        towarzyszy pasek postępu (dla generatora linków - bez łącznej liczby ofert)
 
 
-        :param list_of_links: lista namiarów na oferty
+        :param list_of_links: lista namiarów na oferty lub generator (np. iter_links downloadera) - w tym drugim
+            przypadku ściąganie ofert rozpoczyna się jeszcze w trakcie pobierania listingów
         :param save: informacja czy oferty mają zostać zapisane na potrzeby deweloperskie/analizy
         """
-        for link in tqdm.tqdm(list_of_links):
-            self.logger.info('Ściąganie z %s' % link)
-            try:
-                offer_html = self.offer_downloader.download_offer(link, save=save)
-            except Exception as exc:
-                self.logger.debug('Wystąpił wyjątek dla metody download_offer() dla linku %s: %s' % (link, exc))
-                return
-
-            try:
-                offer_json = self.offer_parser.get_details(offer_html)
-            except Exception as exc:
-                self.logger.debug('Wystąpił wyjątek dla metody get_details() dla linku %s: %s' % (link, exc))
-                return
+        total = len(list_of_links) if isinstance(list_of_links, collections.abc.Sized) else None
+        if self.journal is not None:
+            list_of_links = self.journal.discover(list_of_links)
+        # fileloader z odczytem z wyprzedzeniem sam buforuje oferty w wątku w tle - bez drugiej kolejki
+        fetch_queue_size = 0 if getattr(self.offer_downloader, 'prefetch', 0) > 0 else self.fetch_queue_size
+        offers = buffered(self.offer_downloader.download_offers(list_of_links, save=save), fetch_queue_size,
+                          max_bytes=self.fetch_queue_bytes, size=offer_size)
+        if self.journal is not None:
+            offers = self.journal.fetched(offers)
+        if self.parse_pool is not None:
+            parsed_offers = self.parse_pool.parse(offers, self.offer_downloader.encoding)
+        else:
+            parsed_offers = parse_inline(self.offer_parser, offers, self.offer_downloader.encoding)
+        campaign_id = self.kampania.idx
+        if self.store is None:
+            store_stage = StoreWorker(self.writer.add, self.store_queue_size, idle=self.writer.flush_due)
+        else:
+            store_stage = contextlib.nullcontext(self.store)
+        try:
+            with store_stage as store:
+                for link, offer_json, exc in tqdm.tqdm(parsed_offers, total=total, unit=' ofert'):
+                    self.logger.info('Ściąganie z %s' % link)
+                    if isinstance(exc, ParseError):
+                        self.logger.debug('Wystąpił wyjątek dla metody get_details() dla linku %s: %s' % (link, exc))
+                        if self.journal is not None:
+                            self.journal.failed(link, 'parse', exc)
+                        continue
+                    if exc is not None:
+                        self.logger.debug('Wystąpił wyjątek dla metody download_offer() dla linku %s: %s'
+                                          % (link, exc))
+                        continue
+                    if self.journal is not None:
+                        self.journal.mark(link, 'parsed')
+                    if self.stored_offer_ids and str(offer_json.id_oferty) in self.stored_offer_ids:
+                        # oferta zapisana przed przerwaniem kampanii, ale bez wpisu w dzienniku
+                        self._offer_stored(link, offer_json.id_oferty)
+                        continue
+
+                    row = offer_json.as_row()
+                    row['id_kampanii'] = campaign_id
+                    callback = errback = None
+                    if self.journal is not None or self.known_offers is not None:
+                        callback = functools.partial(self._offer_stored, link, offer_json.id_oferty)
+                    if self.journal is not None:
+                        errback = functools.partial(self._offer_failed, link)
+                    store.put(row, callback, errback)
+        finally:
+            parsed_offers.close()
+            if self.writer is not None:
+                self.writer.flush()
+
+    def log_connection_stats(self):
+        """
+        Zapis w logu statystyk ponownego wykorzystania połączeń HTTP oraz cache (tylko dla downloaderów portalowych)
 
-            offer_object = Oferty()
+        """
+        get_connection_stats = getattr(self.offer_downloader, 'get_connection_stats', None)
+        if get_connection_stats is None:
+            return
+        for host, stats in get_connection_stats().items():
+            self.logger.info('Host %s: żądań %s, połączeń %s' % (host, stats['requests'], stats['connections']))
 
-            offer_object.id_kampanii = self.kampania.idx
+        cache = getattr(self.offer_downloader, 'cache', None)
+        if cache is not None:
+            self.logger.info('Statystyki cache: %s' % dict(cache.stats))
 
-            fields = list(offer_json.__dict__.keys())
+    def close(self):
+        """
+        Zapis oczekujących wierszy, zamknięcie dziennika kampanii i puli parsowania (jeśli została uruchomiona).
+        Przy współdzielonym etapie zapisu dziennik zamyka właściciel etapu - po zapisie oczekujących wierszy.
 
-            self.logger.info('Przepisywanie wartości')
-            for field in fields:
-                setattr(offer_object, field, getattr(offer_json, field))
+        """
+        if self.writer is not None:
+            self.writer.close()
+        if self.journal is not None and self.store is None:
+            self.journal.close()
+        if self.parse_pool is not None:
+            self.parse_pool.close()
+            self.parse_pool = None
+
+    def log_parser_stats(self):
+        """
+        Zapis w logu liczników parsera - ofert, dla których dane JSON odczytano bezpośrednio z html (fast)
+        i z drzewa dokumentu (fallback)
 
-            self.session.add(offer_object)
-            self.session.commit()
-            self.logger.info('Oferta została zapisana w bazie')
+        """
+        stats = collections.Counter(getattr(self.offer_parser, 'stats', None) or dict())
+        if self.parse_pool is not None:
+            stats.update(self.parse_pool.stats)
+        if stats:
+            self.logger.info('Statystyki parsera %s: %s' % (self.portal_name, dict(stats)))
 
     def process(self, _category, number_of_offers, save):
         """
@@ -152,9 +381,16 @@ class PortalProcessor:
         print(template % (self.portal_name, _category, number_of_offers))
         self.logger.info(template % (self.portal_name, _category, number_of_offers))
 
+        task = self.start_task('process', dict(_category=_category, number_of_offers=number_of_offers, save=save))
         category = all_categories_mappings[self.portal_name][_category]
-        links = self.offer_downloader.download_number_of_links(category, number_of_offers=number_of_offers, save=save)
+        links = self.offer_downloader.iter_links(category, number_of_offers=number_of_offers, save=save,
+                                                 known_offers=self.known_offers)
         self.download_offers_from_list(links, save=True)
+        self.finish_task(task)
+        self.log_connection_stats()
+        self.log_parser_stats()
+        if self.known_offers is not None:
+            self.known_offers.save()
 
 
 class AllegroProcessor(PortalProcessor):
@@ -162,24 +398,28 @@ class AllegroProcessor(PortalProcessor):
     Implementacja procesora dla Allegro
     """
 
-    def __init__(self, logger, session, provider="portal"):
+    def __init__(self, logger, session, provider="portal", **kwargs):
         """
         Inicjalizacja procesora
 
         :param logger: obiekt współdzielonego loggera
         :param session: obiekt sesji bazodanowej
-        :param provider: informacja o klasie dostarczającej obiekty
+        :param provider: informacja o klasie dostarczającej obiekty ("portal", "file" lub "pack" - spakowany korpus)
+        :param kwargs: dodatkowe opcje przekazywane do klasy bazowej (np. downloader_options)
         """
         self.portal_name = 'Allegro'
         self.api = 'scrapper'
         logger.info('Inicjalizacja procesora: %s, api: %s' % (self.portal_name, self.api))
         self.session = session
-        super().__init__(logger, self.portal_name, self.api, self.session)
+        super().__init__(logger, self.portal_name, self.api, self.session, **kwargs)
         self._offer_parser = AllegroOfferParser
         if provider == "portal":
             self._offer_downloader = AllegroDownloader
         elif provider == "file":
             self._offer_downloader = AllegroFileloader
+        elif provider == "pack":
+            self._offer_downloader = AllegroFileloader
+            self.downloader_options.setdefault('pack', True)
         else:
             raise ModuleNotFoundError
 
@@ -189,25 +429,29 @@ class OtomotoProcessor(PortalProcessor):
     Implementacja procesora dla Otomoto
     """
 
-    def __init__(self, logger, session, provider="portal"):
+    def __init__(self, logger, session, provider="portal", **kwargs):
         """
         Inicjalizacja procesora
 
         :param logger: obiekt współdzielonego loggera
         :param session: obiekt sesji bazodanowej
-        :param provider: informacja o klasie dostarczającej obiekty
+        :param provider: informacja o klasie dostarczającej obiekty ("portal", "file" lub "pack" - spakowany korpus)
+        :param kwargs: dodatkowe opcje przekazywane do klasy bazowej (np. downloader_options)
         """
 
         self.portal_name = 'Otomoto'
         self.api = 'scrapper'
         logger.info('Inicjalizacja procesora: %s, api: %s' % (self.portal_name, self.api))
         self.session = session
-        super().__init__(logger, self.portal_name, self.api, self.session)
+        super().__init__(logger, self.portal_name, self.api, self.session, **kwargs)
         self._offer_parser = OtomotoOfferParser
         if provider == "portal":
             self._offer_downloader = OtomotoDownloader
         elif provider == "file":
             self._offer_downloader = OtomotoFileloader
+        elif provider == "pack":
+            self._offer_downloader = OtomotoFileloader
+            self.downloader_options.setdefault('pack', True)
         else:
             raise ModuleNotFoundError
 
@@ -217,29 +461,33 @@ class Autoscout24Processor(PortalProcessor):
     Implementacja procesora dla Autoscout24
     """
 
-    def __init__(self, logger, session, provider="portal"):
+    def __init__(self, logger, session, provider="portal", **kwargs):
         """
         Inicjalizacja procesora
 
         :param logger: obiekt współdzielonego loggera
         :param session: obiekt sesji bazodanowej
-        :param provider: informacja o klasie dostarczającej obiekty
+        :param provider: informacja o klasie dostarczającej obiekty ("portal", "file" lub "pack" - spakowany korpus)
+        :param kwargs: dodatkowe opcje przekazywane do klasy bazowej (np. downloader_options)
         """
 
         self.portal_name = 'Autoscout24'
         self.api = 'scrapper'
         logger.info('Inicjalizacja procesora: %s, api: %s' % (self.portal_name, self.api))
         self.session = session
-        super().__init__(logger, self.portal_name, self.api, self.session)
+        super().__init__(logger, self.portal_name, self.api, self.session, **kwargs)
         self._offer_parser = Autoscout24OfferParser
         if provider == "portal":
             self._offer_downloader = AutoScout24Downloader
         elif provider == "file":
             self._offer_downloader = AutoScout24Fileloader
+        elif provider == "pack":
+            self._offer_downloader = AutoScout24Fileloader
+            self.downloader_options.setdefault('pack', True)
         else:
             raise ModuleNotFoundError
 
-    def asc_process(self, _category, number_of_offers, from_year, to_year, save):
+    def asc_process(self, _category, number_of_offers, from_year, to_year, save, shard=False):
         """
         Specyficzna implementacja dla Autoscout24 ze względu na większą liczbę parametrów niż standardowa
 
@@ -248,6 +496,8 @@ class Autoscout24Processor(PortalProcessor):
         :param from_year: rok początkowy
         :param to_year: rok końcowy
         :param save: informacja czy oferty mają zostać zapisane na potrzeby deweloperskie/analizy
+        :param shard: informacja czy zapytanie ma zostać podzielone na roczniki pobierane równolegle (pełne pokrycie
+            ofert mimo limitu wyników portalu)
         :return:
         """
 
@@ -255,33 +505,46 @@ class Autoscout24Processor(PortalProcessor):
         print(template % (self.portal_name, _category, number_of_offers))
         self.logger.info(template % (self.portal_name, _category, number_of_offers))
 
+        task = self.start_task('asc_process', dict(_category=_category, number_of_offers=number_of_offers,
+                                                   from_year=from_year, to_year=to_year, save=save, shard=shard))
         category = all_categories_mappings[self.portal_name][_category]
-        links = self.offer_downloader.download_number_of_links(category, number_of_offers=number_of_offers, from_year=from_year, to_year=to_year, save=save)
+        links = self.offer_downloader.iter_links(category, number_of_offers=number_of_offers, from_year=from_year,
+                                                 to_year=to_year, save=save, known_offers=self.known_offers,
+                                                 shard=shard)
         self.download_offers_from_list(links, save=True)
+        self.finish_task(task)
+        self.log_connection_stats()
+        self.log_parser_stats()
+        if self.known_offers is not None:
+            self.known_offers.save()
 
 
 class OlxProcessor(PortalProcessor):
     """
     Implementacja procesora dla Olx
     """
-    def __init__(self, logger, session, provider="portal"):
+    def __init__(self, logger, session, provider="portal", **kwargs):
         """
         Inicjalizacja procesora
 
         :param logger: obiekt współdzielonego loggera
         :param session: obiekt sesji bazodanowej
-        :param provider: informacja o klasie dostarczającej obiekty
+        :param provider: informacja o klasie dostarczającej obiekty ("portal", "file" lub "pack" - spakowany korpus)
+        :param kwargs: dodatkowe opcje przekazywane do klasy bazowej (np. downloader_options)
         """
         self.portal_name = 'Olx'
         self.api = 'scrapper'
         logger.info('Inicjalizacja procesora: %s, api: %s' % (self.portal_name, self.api))
         self.session = session
-        super().__init__(logger, self.portal_name, self.api, self.session)
+        super().__init__(logger, self.portal_name, self.api, self.session, **kwargs)
         self._offer_parser = OlxOfferParser
         if provider == "portal":
             self._offer_downloader = OlxDownloader
         elif provider == "file":
             self._offer_downloader = OlxFileloader
+        elif provider == "pack":
+            self._offer_downloader = OlxFileloader
+            self.downloader_options.setdefault('pack', True)
         else:
             raise ModuleNotFoundError
 
@@ -293,6 +556,7 @@ def test_allegro_processor(logger, session, provider):
     processor.process(category, number_of_offers=4, save=True)
     category = 'passat b8'
     processor.process(category, number_of_offers=4, save=True)
+    processor.close()
 
 
 def test_otomoto_processor(logger, session, provider):
@@ -302,6 +566,7 @@ def test_otomoto_processor(logger, session, provider):
     processor.process(category, number_of_offers=4, save=True)
     category = 'passat b8'
     processor.process(category, number_of_offers=4, save=True)
+    processor.close()
 
 
 def test_olx_processor(logger, session, provider):
@@ -311,6 +576,7 @@ def test_olx_processor(logger, session, provider):
     processor.process(category, number_of_offers=4, save=True)
     category = 'passat b8'
     processor.process(category, number_of_offers=4, save=True)
+    processor.close()
 
 
 def test_autoscout24_processor(logger, session, provider):
@@ -320,6 +586,7 @@ def test_autoscout24_processor(logger, session, provider):
     processor.asc_process(category, number_of_offers=4, from_year=2005, to_year=2011, save=True)
     category = 'passat b8'
     processor.asc_process(category, number_of_offers=4, from_year=2014, to_year=2019, save=True)
+    processor.close()
 
 
 if __name__ == '__main__':
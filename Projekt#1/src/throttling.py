@@ -0,0 +1,256 @@
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+
+class TransientHTTPError(Exception):
+    """
+    Wyjątek zgłaszany, gdy portal mimo ponowień odpowiada błędem przejściowym (429, 5xx)
+    """
+    def __init__(self, url, status_code):
+        super().__init__('Błąd przejściowy %s dla %s' % (status_code, url))
+        self.url = url
+        self.status_code = status_code
+
+
+class CircuitOpenError(Exception):
+    """
+    Wyjątek zgłaszany, gdy obwód dla hosta jest otwarty - żądanie nie jest wysyłane
+    """
+    def __init__(self, host):
+        super().__init__('Obwód dla hosta %s jest otwarty' % host)
+        self.host = host
+
+
+def parse_retry_after(value):
+    """Funkcja odczytująca nagłówek Retry-After (liczba sekund lub data HTTP)
+
+    :param value: wartość nagłówka lub None
+    :return: liczba sekund oczekiwania lub None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_date.timestamp() - time.time())
+
+
+class AdaptiveRateLimiter:
+    """
+    Ogranicznik żądań typu token bucket, którego tempo dostosowuje się do odpowiedzi portalu (AIMD):
+    każda poprawna odpowiedź nieznacznie zwiększa tempo, a odpowiedź 429/503 zmniejsza je wielokrotnie
+    i - jeśli portal podał Retry-After - wstrzymuje żądania na wskazany czas.
+    """
+    def __init__(self, rate=5.0, burst=None, min_rate=0.2, max_rate=None, increase=0.05, decrease=0.5):
+        """Konstruktor ogranicznika
+
+        :param rate: początkowa liczba żądań na sekundę
+        :param burst: pojemność wiadra (None - równa zaokrąglonemu tempu)
+        :param min_rate: minimalne tempo po spowolnieniach
+        :param max_rate: maksymalne tempo (None - dwukrotność tempa początkowego)
+        :param increase: przyrost tempa po poprawnej odpowiedzi
+        :param decrease: mnożnik tempa po odpowiedzi 429/503
+        """
+        self.rate = rate
+        self.burst = burst or max(1, int(round(rate)))
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate * 2
+        self.increase = increase
+        self.decrease = decrease
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Oczekiwanie na możliwość wysłania żądania
+
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None):
+        """Reakcja na odpowiedź 429/503
+
+        :param retry_after: czas (w sekundach) wskazany przez portal w nagłówku Retry-After
+        """
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = 0.0
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+
+class CircuitBreaker:
+    """
+    Bezpiecznik dla hosta: po failure_threshold kolejnych błędach obwód jest otwierany i żądania są odrzucane
+    bez kontaktu z portalem. Po reset_timeout sekundach przepuszczane jest jedno żądanie próbne (wraz z jego
+    ponowieniami) - powodzenie lub odpowiedź 429 (host odpowiada, tempo reguluje ogranicznik) zamyka obwód, a błąd
+    ponownie go otwiera.
+    """
+    def __init__(self, host, failure_threshold=5, reset_timeout=60.0):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_request(self, probe=False):
+        """Sprawdzenie, czy żądanie może zostać wysłane
+
+        :param probe: True - ponowienie żądania, które jest żądaniem próbnym
+        :return: True, jeśli żądanie jest (lub pozostaje) żądaniem próbnym
+        """
+        with self._lock:
+            if self.state == 'closed':
+                return False
+            if self.state == 'half-open' and probe:
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half-open'
+                return True
+            raise CircuitOpenError(self.host)
+
+    def on_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = 'closed'
+
+    def on_throttle(self):
+        """Reakcja na odpowiedź 429 - nie jest liczona jako błąd, ale kończy żądanie próbne (host odpowiada)
+
+        """
+        with self._lock:
+            if self.state == 'half-open':
+                self._failures = 0
+                self.state = 'closed'
+
+    def on_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half-open' or self._failures >= self.failure_threshold:
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+
+class Throttle:
+    """
+    Polityka wysyłania żądań do portalu: ogranicznik tempa, ponowienia z wykładniczym opóźnieniem (z losowym
+    rozrzutem) dla błędów przejściowych oraz bezpieczniki dla poszczególnych hostów
+    """
+    retry_statuses = (429, 500, 502, 503, 504)
+    throttle_statuses = (429, 503)
+
+    def __init__(self, logger, rate=5.0, max_retries=3, base_delay=1.0, max_delay=60.0, failure_threshold=5,
+                 reset_timeout=60.0):
+        """Konstruktor polityki
+
+        :param logger: obiekt loggera
+        :param rate: początkowa liczba żądań na sekundę
+        :param max_retries: maksymalna liczba ponowień żądania
+        :param base_delay: podstawa opóźnienia wykładniczego w sekundach
+        :param max_delay: maksymalne opóźnienie ponowienia w sekundach
+        :param failure_threshold: liczba kolejnych błędów otwierająca obwód dla hosta
+        :param reset_timeout: czas (w sekundach), po którym otwarty obwód przepuszcza żądanie próbne
+        """
+        self.logger = logger
+        self.rate_limiter = AdaptiveRateLimiter(rate=rate)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = dict()
+        self._lock = threading.Lock()
+
+    def breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def backoff(self, attempt, retry_after=None):
+        """Opóźnienie przed kolejną próbą: losowe z przedziału [0, base_delay * 2^attempt] (ograniczone max_delay),
+        nie krótsze niż wskazane przez portal w Retry-After
+
+        :param attempt: numer próby (od 0)
+        :param retry_after: czas wskazany przez portal lub None
+        :return: opóźnienie w sekundach
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def request(self, url, send):
+        """Wysłanie żądania zgodnie z polityką
+
+        :param url: adres żądania (na jego podstawie wybierany jest bezpiecznik hosta)
+        :param send: bezargumentowa funkcja wysyłająca żądanie i zwracająca odpowiedź
+        :return: obiekt odpowiedzi
+        """
+        breaker = self.breaker(urlsplit(url).netloc)
+        attempt = 0
+        probe = False
+        while True:
+            probe = breaker.before_request(probe)
+            self.rate_limiter.acquire()
+            retry_after = None
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                breaker.on_failure()
+                if attempt >= self.max_retries:
+                    raise
+                self.logger.info('Błąd połączenia dla %s: %s' % (url, exc))
+            except BaseException:
+                # nieoczekiwany błąd żądania próbnego ponownie otwiera obwód (inaczej pozostałby półotwarty)
+                if probe:
+                    breaker.on_failure()
+                raise
+            else:
+                if response.status_code not in self.retry_statuses:
+                    breaker.on_success()
+                    self.rate_limiter.on_success()
+                    return response
+
+                if response.status_code in self.throttle_statuses:
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    self.rate_limiter.on_throttle(retry_after)
+                if response.status_code == 429:
+                    breaker.on_throttle()
+                else:
+                    breaker.on_failure()
+                if attempt >= self.max_retries:
+                    raise TransientHTTPError(url, response.status_code)
+                self.logger.info('Odpowiedź %s dla %s' % (response.status_code, url))
+
+            delay = self.backoff(attempt, retry_after)
+            self.logger.info('Ponowienie %s dla %s za %.2f s' % (attempt + 1, url, delay))
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,119 @@
+"""
+Zapis ofert do bazy danych partiami: wiersze gromadzone są w pamięci i zapisywane jednym poleceniem INSERT
+z wieloma zestawami parametrów (executemany SQLAlchemy Core, bez jednostki pracy ORM) i jedną transakcją na partię.
+"""
+import collections
+import time
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import Oferty
+
+
+class BatchWriter:
+    """
+    Bufor zapisu wierszy tabeli. Partia zapisywana jest po zebraniu batch_size wierszy lub gdy od poprzedniego zapisu
+    minęło flush_interval sekund (sprawdzane przy dodawaniu wiersza oraz w flush_due - wywoływanej przez wątek zapisu
+    StoreWorker także wtedy, gdy nowe wiersze nie napływają), a także przy wywołaniu flush, close lub wyjściu
+    z bloku with. Jeśli zapis partii się nie powiedzie, wiersze zapisywane są pojedynczo - błędny wiersz jest logowany
+    i pomijany (z wywołaniem jego funkcji errback), a pozostałe trafiają do bazy.
+    """
+    batch_size = 500
+    flush_interval = 5.0
+
+    def __init__(self, logger, session, batch_size=None, flush_interval=None, table=Oferty.__table__):
+        """Konstruktor bufora
+
+        :param logger: obiekt loggera
+        :param session: sesja bazy danych (zapis odbywa się w jej połączeniu)
+        :param batch_size: maksymalna liczba wierszy partii (None - wartość domyślna klasy)
+        :param flush_interval: maksymalny czas w sekundach między zapisami partii (None - wartość domyślna klasy)
+        :param table: tabela, do której zapisywane są wiersze
+        """
+        self.logger = logger
+        self.session = session
+        self.batch_size = batch_size if batch_size is not None else self.batch_size
+        self.flush_interval = flush_interval if flush_interval is not None else self.flush_interval
+        self.table = table
+        self.stats = collections.Counter()
+        self._rows = list()
+        self._callbacks = list()
+        self._errbacks = list()
+        self._last_flush = time.monotonic()
+
+    def add(self, row, callback=None, errback=None):
+        """Dodanie wiersza do partii
+
+        :param row: słownik wartości kolumn
+        :param callback: funkcja bez argumentów wywoływana po zapisaniu wiersza w bazie lub None
+        :param errback: funkcja wywoływana z wyjątkiem, gdy wiersza nie udało się zapisać, lub None
+        """
+        self._rows.append(row)
+        self._callbacks.append(callback)
+        self._errbacks.append(errback)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_due()
+
+    def flush_due(self):
+        """Zapis zgromadzonych wierszy, jeśli od poprzedniego zapisu minęło flush_interval sekund
+
+        :return: liczba zapisanych wierszy
+        """
+        if self._rows and time.monotonic() - self._last_flush >= self.flush_interval:
+            return self.flush()
+        return 0
+
+    def _insert(self, rows):
+        try:
+            self.session.execute(self.table.insert(), rows)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+
+    def flush(self):
+        """Zapis zgromadzonych wierszy
+
+        :return: liczba zapisanych wierszy
+        """
+        rows, callbacks, errbacks = self._rows, self._callbacks, self._errbacks
+        self._rows, self._callbacks, self._errbacks = list(), list(), list()
+        self._last_flush = time.monotonic()
+        if not rows:
+            return 0
+
+        try:
+            self._insert(rows)
+            written = list(zip(rows, callbacks))
+        except SQLAlchemyError as exc:
+            self.logger.warning('Zapis partii %s wierszy nie powiódł się (%s), zapis pojedynczych wierszy'
+                                % (len(rows), exc))
+            written = list()
+            for row, callback, errback in zip(rows, callbacks, errbacks):
+                try:
+                    self._insert([row])
+                    written.append((row, callback))
+                except SQLAlchemyError as row_exc:
+                    self.stats['failed'] += 1
+                    self.logger.debug('Wiersz %s nie został zapisany: %s' % (row, row_exc))
+                    if errback is not None:
+                        errback(row_exc)
+
+        self.stats['batches'] += 1
+        self.stats['rows'] += len(written)
+        self.logger.info('Zapisano w bazie %s ofert' % len(written))
+        for _, callback in written:
+            if callback is not None:
+                callback()
+        return len(written)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# moduły projektu importowane są z katalogu src (tak jak przy uruchamianiu skryptów z tego katalogu)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
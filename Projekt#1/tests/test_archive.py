@@ -0,0 +1,32 @@
+"""
+Testy archiwum stron: zatwierdzanie indeksu co commit_every zapisów oraz zapis przy zamknięciu
+"""
+import sqlite3
+
+from archive import PageArchive
+
+
+def indexed_pages(folder):
+    connection = sqlite3.connect(str(folder / PageArchive.index_name))
+    try:
+        return connection.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_index_committed_in_batches(tmp_path):
+    page_archive = PageArchive(str(tmp_path), codec='gzip', commit_every=3)
+    for number in range(4):
+        page_archive.put('offers/otomoto', 'offer_%d.html' % number, '<html>%d</html>' % number)
+    # czwarty zapis czeka na kolejną transakcję, ale jest widoczny dla obiektu archiwum
+    assert indexed_pages(tmp_path) == 3
+    assert page_archive.get('offers/otomoto', 'offer_3.html') == b'<html>3</html>'
+    page_archive.flush()
+    assert indexed_pages(tmp_path) == 4
+    page_archive.put('offers/otomoto', 'offer_4.html', '<html>4</html>')
+    page_archive.close()
+    page_archive.close()
+    assert indexed_pages(tmp_path) == 5
+    reopened = PageArchive(str(tmp_path))
+    assert reopened.names('offers/otomoto') == ['offer_%d.html' % number for number in range(5)]
+    reopened.close()
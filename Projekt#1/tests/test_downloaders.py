@@ -0,0 +1,129 @@
+"""
+Testy przekazywania treści odpowiedzi jako bajtów (response_bytes), czasu świeżości odpowiedzi w cache,
+współdzielonego limitu równoległych żądań oraz zakładania folderów przy zapisie stron w osobnych plikach
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from downloaders import AllegroDownloader, AutoScout24Downloader, OlxDownloader, OtomotoDownloader
+
+
+@pytest.fixture
+def downloader(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return OtomotoDownloader(logging.getLogger('test_downloaders'), archive=False)
+
+
+def make_response(content, content_type):
+    response = requests.Response()
+    response.status_code = 200
+    response.url = 'https://www.otomoto.pl/oferta/test.html'
+    response._content = content
+    if content_type is not None:
+        response.headers['Content-Type'] = content_type
+    return response
+
+
+def test_connection_pool_sized_to_concurrency(downloader):
+    adapter = downloader.http_session.get_adapter(downloader.base_url)
+    assert (adapter._pool_connections, adapter._pool_maxsize) == (OtomotoDownloader.hosts,
+                                                                  OtomotoDownloader.max_concurrency)
+    custom = OtomotoDownloader(logging.getLogger('test_downloaders'), archive=False, pool_size=3)
+    assert custom.http_session.get_adapter(custom.base_url)._pool_maxsize == 3
+
+
+@pytest.mark.parametrize('content_type', [None, 'text/html', 'text/html; charset=UTF-8', 'text/html; charset=utf8'])
+def test_portal_encoding_unchanged(downloader, content_type):
+    content = 'Żółta łódź'.encode('utf-8')
+    assert downloader.response_bytes(make_response(content, content_type)) is content
+
+
+def test_declared_charset_transcoded(downloader):
+    content = 'Żółta łódź'.encode('iso-8859-2')
+    response = make_response(content, 'text/html; charset=ISO-8859-2')
+    assert downloader.response_bytes(response) == 'Żółta łódź'.encode('utf-8')
+
+
+def test_unknown_charset_keeps_content(downloader):
+    content = 'Żółta łódź'.encode('utf-8')
+    response = make_response(content, 'text/html; charset=x-unknown')
+    assert downloader.response_bytes(response) is content
+
+
+class RecordingCache:
+    """
+    Cache zapamiętujący czas świeżości przekazany przez downloader
+    """
+    def __init__(self):
+        self.ttls = list()
+
+    def get_response(self, url, ttl, fetch):
+        self.ttls.append(ttl)
+        return make_response(b'<html></html>', 'text/html; charset=utf-8')
+
+
+@pytest.mark.parametrize('downloader_class', [AllegroDownloader, AutoScout24Downloader, OlxDownloader,
+                                              OtomotoDownloader])
+def test_listing_and_offer_cache_ttl(tmp_path, monkeypatch, downloader_class):
+    monkeypatch.chdir(tmp_path)
+    cache = RecordingCache()
+    downloader = downloader_class(logging.getLogger('test_downloaders'), archive=False, cache=cache)
+    assert downloader.listing_cache_ttl < downloader.offer_cache_ttl
+    if downloader_class is AutoScout24Downloader:
+        downloader.asc_download_listing_page('ford/focus', 1, from_year=2005, to_year=2011)
+    else:
+        downloader.download_listing_page('ford/focus', 2)
+    downloader.download_offer('/oferta/test')
+    assert cache.ttls == [downloader.listing_cache_ttl, downloader.offer_cache_ttl]
+
+
+def test_cache_ttl_options(downloader):
+    custom = OtomotoDownloader(logging.getLogger('test_downloaders'), archive=False, listing_cache_ttl=10,
+                               offer_cache_ttl=20)
+    assert (custom.listing_cache_ttl, custom.offer_cache_ttl) == (10, 20)
+    assert (downloader.listing_cache_ttl, downloader.offer_cache_ttl) == (OtomotoDownloader.listing_cache_ttl,
+                                                                          OtomotoDownloader.offer_cache_ttl)
+
+
+class SlowSession:
+    """
+    Sesja HTTP zliczająca najwyższą liczbę jednocześnie trwających żądań (wspólna dla kilku downloaderów)
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def get(self, url, headers=None, timeout=None):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+        return make_response(b'<html></html>', 'text/html; charset=utf-8')
+
+
+def test_request_slots_shared_between_portals(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    session = SlowSession()
+    slots = threading.BoundedSemaphore(2)
+    downloaders = [downloader_class(logging.getLogger('test_downloaders'), archive=False, http_session=session,
+                                    requests_per_second=1000, request_slots=slots)
+                   for downloader_class in (OtomotoDownloader, OlxDownloader)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda number: downloaders[number % 2].download_offer('/oferta/%d' % number), range(16)))
+    assert session.peak == 2
+
+
+def test_folders_created_only_without_archive(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    OtomotoDownloader(logging.getLogger('test_downloaders'))
+    assert not (tmp_path / 'offers').exists() and not (tmp_path / 'listings').exists()
+    OtomotoDownloader(logging.getLogger('test_downloaders'), archive=False)
+    assert (tmp_path / 'offers' / 'otomoto').is_dir() and (tmp_path / 'listings').is_dir()
@@ -0,0 +1,59 @@
+"""
+Testy zgodności wydobywania linków z listingów: strumieniowy LinkExtractor (get_links_from_listing) musi zwracać ten sam
+zbiór linków co pełne drzewo BeautifulSoup (get_links_from_listing_soup) - także dla linków w skryptach i komentarzach
+oraz powtórzonego atrybutu href
+"""
+import logging
+import os
+
+import pytest
+
+from downloaders import AllegroDownloader, AutoScout24Downloader, OlxDownloader, OtomotoDownloader
+
+LISTINGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'listings')
+
+DOWNLOADERS = {
+    'allegro': AllegroDownloader,
+    'olx': OlxDownloader,
+    'otomoto': OtomotoDownloader,
+    'autoscout24': AutoScout24Downloader}
+
+
+@pytest.fixture
+def downloader_factory(tmp_path, monkeypatch):
+    # downloader zakłada foldery ofert i listingów w bieżącym katalogu
+    monkeypatch.chdir(tmp_path)
+    return lambda portal: DOWNLOADERS[portal](logging.getLogger('test_links'), archive=False)
+
+
+def read_listing(portal):
+    with open(os.path.join(LISTINGS, '%s.html' % portal), 'r', encoding='utf-8') as file_in:
+        return file_in.read()
+
+
+@pytest.mark.parametrize('portal', sorted(DOWNLOADERS))
+def test_extractor_matches_soup(downloader_factory, portal):
+    downloader = downloader_factory(portal)
+    html = read_listing(portal)
+    links = downloader.get_links_from_listing(html, downloader.offer_link_prefix)
+    assert links == downloader.get_links_from_listing_soup(html, downloader.offer_link_prefix)
+    # 6 ofert (link z parametrami i bez), powtórzony href, wielkie litery, href bez cudzysłowów
+    assert len(links) == 15
+    assert all(link.startswith(downloader.offer_link_prefix) for link in links)
+
+
+@pytest.mark.parametrize('portal', sorted(DOWNLOADERS))
+def test_extractor_edge_cases(downloader_factory, portal):
+    downloader = downloader_factory(portal)
+    links = downloader.get_links_from_listing(read_listing(portal), downloader.offer_link_prefix)
+    marked = set(link.rsplit('/', 1)[-1] for link in links)
+    # linki w komentarzu, skrypcie i danych JSON są pomijane
+    assert 'ford-focus-komentarz' not in marked
+    assert 'ford-focus-skrypt' not in marked
+    assert 'ford-focus-json' not in marked
+    # powtórzony href - ostatnia wartość
+    assert 'ford-focus-powtorzony-href' in marked
+    assert not any('example.com' in link for link in links)
+    assert 'ford-focus-bez-cudzyslowow' in marked
+    # wielkie litery w znaczniku, encje w wartości atrybutu zamieniane na znaki
+    assert any(link.endswith('?a=1&b=2') for link in links)
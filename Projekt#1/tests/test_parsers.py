@@ -0,0 +1,94 @@
+"""
+Testy zgodności parserów ofert: wynik (as_row) nie może zależeć od backendu budowy drzewa (lxml, html.parser) ani od
+budowy drzewa tylko dla regionów strony (restrict). Poza krótkimi stronami offer_{1,2}.html każdy portal ma pełną,
+skróconą stronę oferty (offer_page.html) o układzie stron portalu: doctype, head z meta i skryptami, komentarze
+warunkowe, encje, niedomknięte znaczniki li/p, zagnieżdżone tabele i linki w wartościach parametrów
+"""
+import glob
+import logging
+import os
+
+import pytest
+
+from parsers import (PARSER_BACKENDS, AllegroOfferParser, Autoscout24OfferParser, OlxOfferParser,
+                     OtomotoOfferParser, element_text, script_text)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+PARSERS = {
+    'allegro': AllegroOfferParser,
+    'olx': OlxOfferParser,
+    'otomoto': OtomotoOfferParser,
+    'autoscout24': Autoscout24OfferParser}
+
+CASES = [(portal, path) for portal in sorted(PARSERS)
+         for path in sorted(glob.glob(os.path.join(FIXTURES, portal, '*.html')))]
+
+
+def parse(portal, path, backend, restrict):
+    parser = PARSERS[portal](logging.getLogger('test_parsers'), backend=backend, restrict=restrict)
+    assert parser.backend == backend
+    assert (parser.strainer is not None) == restrict
+    with open(path, 'rb') as file_in:
+        return parser.get_details(file_in.read(), encoding='utf-8').as_row()
+
+
+def test_fixtures_present():
+    assert set(portal for portal, _ in CASES) == set(PARSERS)
+    assert all(os.path.isfile(os.path.join(FIXTURES, portal, 'offer_page.html')) for portal in PARSERS)
+
+
+@pytest.mark.parametrize('portal, path', CASES, ids=[os.path.relpath(path, FIXTURES) for _, path in CASES])
+@pytest.mark.parametrize('restrict', [True, False], ids=['restrict', 'full'])
+def test_backends_agree(portal, path, restrict):
+    rows = [parse(portal, path, backend, restrict) for backend in PARSER_BACKENDS]
+    assert rows[0]['id_oferty']
+    assert rows[0]['marka']
+    for row in rows[1:]:
+        assert row == rows[0]
+
+
+@pytest.mark.parametrize('portal, path', CASES, ids=[os.path.relpath(path, FIXTURES) for _, path in CASES])
+@pytest.mark.parametrize('backend', PARSER_BACKENDS)
+def test_restricted_regions_match_full_tree(portal, path, backend):
+    assert parse(portal, path, backend, restrict=True) == parse(portal, path, backend, restrict=False)
+
+
+COMMENTED_PAGE = ('<html><body><!-- <script>var data = {"x": 1};</script> <b class="v">ukryty</b> -->'
+                  '<script>var other = 1;</script><script>var data = {"x": 2};</script>'
+                  '<b class="v">Łódź &amp; okolice</b><!-- <script>var data = {"x": 3};</script>'
+                  '</body></html>')
+
+
+@pytest.mark.parametrize('as_bytes', [False, True], ids=['str', 'bytes'])
+def test_script_text_skips_comments(as_bytes):
+    page = COMMENTED_PAGE.encode('utf-8') if as_bytes else COMMENTED_PAGE
+    assert script_text(page, r'var data') == 'var data = {"x": 2};'
+    assert script_text(page, r'"x": 3') is None
+
+
+@pytest.mark.parametrize('as_bytes', [False, True], ids=['str', 'bytes'])
+def test_element_text_skips_comments(as_bytes):
+    page = COMMENTED_PAGE.encode('utf-8') if as_bytes else COMMENTED_PAGE
+    assert element_text(page, 'b', {'class': 'v'}) == 'Łódź & okolice'
+    assert element_text(page, 'b', {'class': 'brak'}) is None
+
+
+# wybrane pola pełnych stron ofert (offer_page.html)
+EXPECTED = {
+    'allegro': {'id_oferty': '7640318822', 'marka': 'Ford', 'typ': 'Focus', 'cena': 24900, 'przebieg': 168400,
+                'tytul': 'Ford Focus Mk3 1.6 TDCi Titanium, navi, PDC', 'lokalizacja': 'Kraków, woj. małopolskie'},
+    'olx': {'id_oferty': '537219910', 'marka': 'Ford', 'typ': 'Focus', 'cena': 25900, 'przebieg': 187000,
+            'tytul': 'Ford Focus 1.6 TDCi kombi 2014', 'nadwozie': 'Kombi', 'uszkodzony': 'Nieuszkodzony'},
+    'otomoto': {'id_oferty': 6071982210, 'marka': 'Volkswagen', 'typ': 'Passat', 'model': 'B8 (2014-)',
+                'cena': 67900, 'przebieg': 142500, 'uszkodzony': 'Nie', 'lokalizacja': 'Gdańsk, woj. Pomorskie'},
+    'autoscout24': {'id_oferty': '7d2e5c3b-8a41-4f0e-b9c6-2d31f54a7e90', 'marka': 'Ford', 'cena': 8490,
+                    'przebieg': 134800, 'kolor': 'Szary', 'liczba_miejsc': '5',
+                    'id_sprzedajacego': 'Autohaus Müller & Söhne GmbH'}}
+
+
+@pytest.mark.parametrize('portal', sorted(EXPECTED))
+@pytest.mark.parametrize('backend', PARSER_BACKENDS)
+def test_offer_page_values(portal, backend):
+    row = parse(portal, os.path.join(FIXTURES, portal, 'offer_page.html'), backend, restrict=True)
+    assert {key: row[key] for key in EXPECTED[portal]} == EXPECTED[portal]
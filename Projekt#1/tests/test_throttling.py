@@ -0,0 +1,92 @@
+"""
+Testy ponowień i wyłącznika obwodu (Throttle, CircuitBreaker) z lokalnym serwerem HTTP zwracającym zadane statusy
+"""
+import http.server
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+from throttling import CircuitOpenError, Throttle
+
+RESET_TIMEOUT = 0.2
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    # kolejne statusy odpowiedzi (po ich wyczerpaniu - 200)
+    statuses = list()
+
+    def do_GET(self):
+        status = self.statuses.pop(0) if self.statuses else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    stub = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    StubHandler.statuses = list()
+    thread = threading.Thread(target=stub.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%s/' % stub.server_address[1]
+    stub.shutdown()
+    stub.server_close()
+
+
+@pytest.fixture
+def throttle():
+    return Throttle(logging.getLogger('test_throttling'), rate=1000.0, max_retries=2, base_delay=0.01,
+                    max_delay=0.01, failure_threshold=1, reset_timeout=RESET_TIMEOUT)
+
+
+def open_breaker(throttle, url):
+    StubHandler.statuses = [503]
+    with pytest.raises(CircuitOpenError):
+        throttle.request(url, lambda: requests.get(url))
+    assert throttle.breaker(urlsplit(url).netloc).state == 'open'
+    time.sleep(RESET_TIMEOUT)
+
+
+def test_probe_throttled_closes_breaker(server, throttle):
+    open_breaker(throttle, server)
+    # żądanie próbne dostaje 429 i jest ponawiane - ponowienie nie może być zablokowane przez półotwarty obwód
+    StubHandler.statuses = [429]
+    assert throttle.request(server, lambda: requests.get(server)).status_code == 200
+    breaker = throttle.breaker(urlsplit(server).netloc)
+    assert breaker.state == 'closed'
+    assert throttle.request(server, lambda: requests.get(server)).status_code == 200
+
+
+def test_probe_failure_reopens_breaker(server, throttle):
+    open_breaker(throttle, server)
+    StubHandler.statuses = [503]
+    with pytest.raises(CircuitOpenError):
+        throttle.request(server, lambda: requests.get(server))
+    breaker = throttle.breaker(urlsplit(server).netloc)
+    assert breaker.state == 'open'
+    time.sleep(RESET_TIMEOUT)
+    assert throttle.request(server, lambda: requests.get(server)).status_code == 200
+    assert breaker.state == 'closed'
+
+
+def test_probe_unexpected_error_reopens_breaker(server, throttle):
+    open_breaker(throttle, server)
+
+    def broken():
+        raise requests.exceptions.ChunkedEncodingError('przerwana odpowiedź')
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        throttle.request(server, broken)
+    breaker = throttle.breaker(urlsplit(server).netloc)
+    assert breaker.state == 'open'
+    time.sleep(RESET_TIMEOUT)
+    assert throttle.request(server, lambda: requests.get(server)).status_code == 200
+    assert breaker.state == 'closed'
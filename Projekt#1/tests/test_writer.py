@@ -0,0 +1,67 @@
+"""
+Testy zapisu partiami (BatchWriter): wiersze, których nie udało się zapisać, są zgłaszane przez errback i trafiają
+do dziennika kampanii jako failed, więc wznowienie kampanii je ponawia; partia zapisywana jest po upływie
+flush_interval także wtedy, gdy nowe wiersze nie napływają
+"""
+import logging
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from journal import CampaignJournal
+from models import Base, Oferty
+from pipeline import StoreWorker
+from writer import BatchWriter
+
+
+@pytest.fixture
+def session(tmp_path):
+    # baza w pliku - wątek zapisu korzysta z własnego połączenia
+    engine = create_engine('sqlite:///%s' % (tmp_path / 'offers.db'))
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def make_row(number, marka='Ford'):
+    return dict(id_kampanii=1, id_oferty=str(number), id_sprzedajacego='s', marka=marka, model='Focus', typ='Mk3',
+                rok_produkcji=2012)
+
+
+def test_failed_rows_reported(session, tmp_path):
+    journal = CampaignJournal(str(tmp_path / 'Otomoto_1.jsonl'))
+    writer = BatchWriter(logging.getLogger('test_writer'), session, batch_size=10)
+    for number in range(4):
+        link = 'link_%s' % number
+        journal.mark(link, 'parsed')
+        # wiersz bez wymaganej kolumny marka nie zostanie zapisany
+        writer.add(make_row(number, marka=None if number == 2 else 'Ford'),
+                   lambda link=link: journal.mark(link, 'stored'),
+                   lambda exc, link=link: journal.failed(link, 'store', exc))
+    writer.close()
+    journal.close()
+
+    assert session.query(Oferty).count() == 3
+    assert writer.stats['failed'] == 1
+    reopened = CampaignJournal(journal.path)
+    assert reopened.pending_links() == ['link_2']
+    assert reopened.reasons['link_2'][0] == 'store'
+    reopened.close()
+
+
+def test_flush_interval_without_new_rows(session):
+    writer = BatchWriter(logging.getLogger('test_writer'), session, batch_size=100, flush_interval=0.1)
+    stored = list()
+    with StoreWorker(writer.add, idle=writer.flush_due, idle_interval=0.05) as store:
+        store.put(make_row(1), lambda: stored.append(1))
+        # wcześniejsze etapy potoku wstrzymane - wiersz zapisywany jest bez kolejnych wywołań put
+        deadline = time.monotonic() + 5
+        while not stored and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert stored == [1]
+        assert session.query(Oferty).count() == 1
+    writer.close()